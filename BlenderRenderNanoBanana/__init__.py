@@ -21,6 +21,16 @@ from bpy.props import StringProperty, BoolProperty, IntProperty, FloatProperty,
 from . import properties
 from . import operators
 from . import panels
+from . import disk_writer
+from . import history_browser
+from . import image_pool
+from . import retention
+from . import scene_summary
+from . import analysis_stream
+from . import delivery
+from . import async_render
+from . import live_preview
+from . import progressive
 
 # Test operator for debugging
 class NANOBANANA_OT_test_render(Operator):
@@ -54,7 +64,7 @@ class NANOBANANA_OT_test_render(Operator):
         print("3. 创建测试图像...")
         try:
             # 创建一个简单的测试图像
-            image = bpy.data.images.new("NanoBanana_Test", width=512, height=512)
+            image = image_pool.acquire("NanoBanana_Test", 512, 512)
             
             # 创建渐变测试图像
             pixels = []
@@ -186,8 +196,7 @@ class NANOBANANA_OT_test_render(Operator):
                 print(f"✅ 渲染图像已保存到: {temp_image_path}")
                 
                 # 将保存的图像加载到Blender中
-                viewport_image = bpy.data.images.load(temp_image_path)
-                viewport_image.name = "Viewport_Capture_Test"
+                viewport_image = image_pool.load_file("Viewport_Capture_Test", temp_image_path)
                 
                 print(f"✅ 图像已加载到Blender: {viewport_image.name}, 尺寸: {viewport_image.size}")
                 print("✅ 渲染图像生成测试成功！")
@@ -225,10 +234,23 @@ classes = (
     # operators.NANOBANANA_OT_capture_viewport,  # 暂时禁用以解决导入问题
     operators.NANOBANANA_OT_render_viewport,  # 主要的渲染operator
     operators.NANOBANANA_OT_render_animation,
+    operators.NANOBANANA_OT_batch_generate,  # 多摄像机批量生成
+    operators.NANOBANANA_OT_generate_tiled,  # 分块高分辨率生成
+    operators.NANOBANANA_OT_generate_panorama,  # 360° 全景
+    operators.NANOBANANA_OT_cancel_progressive,  # 取消渐进生成的请求
     operators.NANOBANANA_OT_save_image,  # 保存图片操作符
     operators.NANOBANANA_OT_view_in_editor,  # 在图像编辑器中查看操作符
+    operators.NANOBANANA_OT_history_page,  # 历史翻页
+    operators.NANOBANANA_OT_history_apply,  # 恢复历史设置
+    operators.NANOBANANA_OT_history_open,  # 打开历史结果
+    operators.NANOBANANA_OT_free_images,  # 释放插件图像
+    operators.NANOBANANA_OT_history_pin,  # 固定历史记录
+    operators.NANOBANANA_OT_retention_cleanup,  # 清理旧输出
+    operators.NANOBANANA_OT_apply_fix_plan,  # 应用分析建议
+    operators.NANOBANANA_OT_regenerate_region,  # 区域重新生成
     NANOBANANA_OT_test_render,
     panels.NANOBANANA_PT_render_panel,  # 渲染属性面板
+    panels.NANOBANANA_PT_history_panel,  # 生成历史面板
     panels.NANOBANANA_PT_viewport_panel,  # 3D视口面板
     panels.NANOBANANA_PT_sidebar_panel,  # 侧边栏面板
 )
@@ -244,6 +266,15 @@ def register():
             print(f"Failed to register {cls.__name__}: {e}")
     
     bpy.types.Scene.nano_banana = bpy.props.PointerProperty(type=properties.NanoBananaProperties)
+    bpy.types.Scene.nano_banana_status = bpy.props.StringProperty(name="Nano Banana Status", default="")
+    
+    # 后台写入：保存文件和退出时等待写入完成
+    disk_writer.register()
+    history_browser.register()
+    retention.register()
+    scene_summary.register()
+    analysis_stream.register()
+    live_preview.register()
     
     # 自动加载已保存的API key
     try:
@@ -276,8 +307,20 @@ def set_saved_api_key(api_key):
 def unregister():
     print("Unregistering Nano Banana Renderer...")
     
+    live_preview.unregister()
+    progressive.unregister()
+    async_render.unregister()
+    analysis_stream.unregister()
+    delivery.unregister()
+    scene_summary.unregister()
+    retention.unregister()
+    disk_writer.unregister()
+    history_browser.unregister()
+    
     if hasattr(bpy.types.Scene, 'nano_banana'):
         del bpy.types.Scene.nano_banana
+    if hasattr(bpy.types.Scene, 'nano_banana_status'):
+        del bpy.types.Scene.nano_banana_status
     
     for cls in reversed(classes):
         try:
@@ -0,0 +1,215 @@
+"""
+Streamed scene analysis for Nano Banana Renderer
+
+分析结果是很长的文本，等整个响应返回才显示要等十几秒。这里改用
+streamGenerateContent：请求在工作线程中进行，收到的文本片段放入队列，
+由 bpy.app.timers 在主线程取出并写入文本数据块 NanoBanana_Analysis
+（已打开的文本编辑器会显示它），第一段文字大约一秒后就能看到。
+
+分析按 JSON 返回，流式过程中只显示已经收到的 "advice" 部分；完成后
+由 on_finish 回调解析、缓存并保存结果，文本块替换为完整的分析。
+"""
+
+import bpy
+import re
+import time
+import queue
+import threading
+from bpy.app.handlers import persistent
+
+from . import pipeline
+
+TEXT_NAME = "NanoBanana_Analysis"
+
+# 定时器取出文本片段的间隔(秒)
+DRAIN_INTERVAL = 0.1
+
+_ADVICE_KEY = re.compile(r'"advice"\s*:\s*"')
+_ESCAPES = {'n': "\n", 't': "\t", 'r': "", 'b': "", 'f': "", '"': '"', '\\': "\\", '/': "/"}
+
+_state = {'stream': None}
+
+
+def partial_advice(text):
+    """The advice decoded so far from a (possibly incomplete) JSON analysis
+
+    Plain text answers are returned unchanged.
+    """
+    match = _ADVICE_KEY.search(text)
+    if match is None:
+        return "" if text.lstrip().startswith("{") else text
+
+    decoded = []
+    index = match.end()
+    while index < len(text):
+        char = text[index]
+        if char == '"':
+            break
+        if char != "\\":
+            decoded.append(char)
+            index += 1
+            continue
+        # 转义序列可能被截断在两个片段之间，等下一个片段再解码
+        if index + 1 >= len(text):
+            break
+        escape = text[index + 1]
+        if escape == 'u':
+            if index + 6 > len(text):
+                break
+            try:
+                decoded.append(chr(int(text[index + 2:index + 6], 16)))
+            except ValueError:
+                pass
+            index += 6
+            continue
+        decoded.append(_ESCAPES.get(escape, escape))
+        index += 2
+    return "".join(decoded)
+
+
+class AnalysisStream:
+    """One streamed analysis request running on a worker thread"""
+
+    def __init__(self, api_key, payload, on_finish):
+        self.on_finish = on_finish
+        self.chunks = queue.Queue()
+        self.text = ""
+        self.result = None
+        self.started = time.time()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(api_key, payload), name="NanoBananaAnalysisStream", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _run(self, api_key, payload):
+        try:
+            result = pipeline.stream_analysis(api_key, payload, self.chunks.put, self._cancelled.is_set)
+        except Exception as e:
+            result = (None, {'elapsed': time.time() - self.started, 'error': f"分析请求失败: {e}", 'response': None})
+        # 所有片段入队之后才设置结果
+        self.result = result
+
+    def drain(self):
+        """Move received chunks into self.text; True if anything new arrived"""
+        received = False
+        while True:
+            try:
+                self.text += self.chunks.get_nowait()
+            except queue.Empty:
+                return received
+            received = True
+
+
+def live_text():
+    """The text datablock the analysis streams into (created when missing)"""
+    text = bpy.data.texts.get(TEXT_NAME)
+    if text is None:
+        text = bpy.data.texts.new(TEXT_NAME)
+    return text
+
+
+def show_text(content):
+    """Replace the NanoBanana_Analysis text and show it in open Text Editors"""
+    text = live_text()
+    text.clear()
+    text.write(content)
+
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'TEXT_EDITOR':
+                space = area.spaces.active
+                # 不替换用户正在编辑的其他文本
+                if space.text is None or space.text == text:
+                    space.text = text
+                    space.top = 0
+                area.tag_redraw()
+            elif area.type in {'VIEW_3D', 'PROPERTIES'}:
+                # 面板中的进度
+                area.tag_redraw()
+
+
+def status():
+    """Short progress text for the panel, or None when nothing is streaming"""
+    stream = _state['stream']
+    if stream is None:
+        return None
+    return f"Analyzing... {len(stream.text)} chars ({time.time() - stream.started:.0f}s)"
+
+
+def start(api_key, payload, on_finish):
+    """Stream an analysis into the NanoBanana_Analysis text
+
+    on_finish(result, info) runs on the main thread when the request ends
+    (result is None on errors) and returns the final text to show, or None.
+    A newer stream cancels the previous one, whose on_finish is not called.
+    """
+    cancel()
+    stream = AnalysisStream(api_key, payload, on_finish)
+    _state['stream'] = stream
+    show_text("# NanoBanana AI Analysis\n\nWaiting for the first response...\n")
+    stream.start()
+    if not bpy.app.timers.is_registered(_drain):
+        bpy.app.timers.register(_drain, first_interval=DRAIN_INTERVAL)
+    print("🔍 分析请求已发送（流式）")
+
+
+def cancel():
+    stream = _state['stream']
+    if stream is not None:
+        stream.cancel()
+        _state['stream'] = None
+
+
+def _drain():
+    """Timer: show new text, and finish the analysis once the request ended"""
+    stream = _state['stream']
+    if stream is None:
+        return None
+
+    finished = stream.result is not None
+    if stream.drain() and not finished:
+        advice = partial_advice(stream.text)
+        show_text("# NanoBanana AI Analysis\n\n" + (advice or "Receiving...") + " …\n")
+    if not finished:
+        return DRAIN_INTERVAL
+
+    _state['stream'] = None
+    result, info = stream.result
+    if info.get('first_text') is not None:
+        print(f"⏱️ 首段分析文本: {info['first_text']:.1f}s，完整分析: {info['elapsed']:.1f}s")
+    try:
+        final_text = stream.on_finish(result, info)
+    except Exception as e:
+        print(f"❌ 处理分析结果失败: {e}")
+        final_text = None
+
+    if final_text:
+        show_text(final_text)
+    else:
+        show_text(f"# NanoBanana AI Analysis\n\nAnalysis failed: {info.get('error') or 'no result'}\n")
+    return None
+
+
+@persistent
+def _on_load(*args):
+    # 旧文件的场景已经不存在
+    cancel()
+
+
+def register():
+    if _on_load not in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.append(_on_load)
+
+
+def unregister():
+    if _on_load in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.remove(_on_load)
+    if bpy.app.timers.is_registered(_drain):
+        bpy.app.timers.unregister(_drain)
+    cancel()
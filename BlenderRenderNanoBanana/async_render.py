@@ -0,0 +1,313 @@
+"""
+Non-blocking capture and generation for Nano Banana Renderer
+
+bpy.ops.render.render() 会在渲染期间卡住整个界面。非阻塞模式改用
+INVOKE_DEFAULT 启动渲染：用户看到正常的渐进式渲染窗口，界面保持可用。
+render_complete / render_cancel 处理函数只记录渲染已结束（它们可能不在
+主线程中调用），由定时器在主线程中恢复渲染设置、读取捕获的 PNG 并继续
+后续流程，生成请求在渲染完成的那一刻就发出。
+
+生成请求在工作线程中进行；结果通过 delivery 队列加载到 NanoBanana_Render
+并显示在图像编辑器中，历史记录和输出文件与阻塞模式相同。
+"""
+
+import bpy
+import os
+import time
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from bpy.app.handlers import persistent
+
+from . import batch
+from . import history
+from . import pipeline
+from . import delivery
+from . import image_pool
+from . import output_manager
+from .properties import get_nano_banana_output_dir
+
+POLL_INTERVAL = 0.05
+
+RENDER_COMPLETE = 'COMPLETE'
+RENDER_CANCEL = 'CANCEL'
+
+# 正在进行的捕获（同一时间只有一个渲染）
+_capture = {'scene': None, 'saved': None, 'temp_file': None, 'on_done': None, 'started': 0.0, 'outcome': None}
+
+
+# ================================
+# Capture through render handlers
+# ================================
+
+def is_capturing():
+    return _capture['scene'] is not None
+
+
+def start_capture(context, on_done, resolution=512):
+    """Start rendering the camera view without blocking the UI
+
+    on_done(png_bytes, capture_seconds) runs on the main thread once the
+    render has finished; png_bytes is None when it was cancelled or failed.
+    Returns False when the render could not be started.
+    """
+    scene = context.scene
+    if is_capturing():
+        print("⚠️ 已有一个捕获正在渲染")
+        return False
+    if not scene.camera:
+        print("❌ 没有活动摄像机")
+        return False
+
+    temp_file = pipeline.capture_temp_path()
+    saved = pipeline.apply_capture_settings(scene, temp_file, resolution)
+    _capture.update(scene=scene.name, saved=saved, temp_file=temp_file, on_done=on_done,
+                    started=time.time(), outcome=None)
+    _add_handlers()
+
+    try:
+        result = bpy.ops.render.render('INVOKE_DEFAULT', write_still=True)
+    except RuntimeError as e:
+        print(f"❌ 无法开始渲染: {e}")
+        result = {'CANCELLED'}
+
+    if 'RUNNING_MODAL' not in result:
+        _end_capture()
+        return False
+
+    bpy.app.timers.register(_poll_capture, first_interval=POLL_INTERVAL)
+    print("🎬 捕获渲染已开始（非阻塞）")
+    return True
+
+
+@persistent
+def _on_render_complete(scene, *args):
+    if scene.name == _capture['scene']:
+        _capture['outcome'] = RENDER_COMPLETE
+
+
+@persistent
+def _on_render_cancel(scene, *args):
+    if scene.name == _capture['scene']:
+        _capture['outcome'] = RENDER_CANCEL
+
+
+def _add_handlers():
+    if _on_render_complete not in bpy.app.handlers.render_complete:
+        bpy.app.handlers.render_complete.append(_on_render_complete)
+    if _on_render_cancel not in bpy.app.handlers.render_cancel:
+        bpy.app.handlers.render_cancel.append(_on_render_cancel)
+
+
+def _remove_handlers():
+    if _on_render_complete in bpy.app.handlers.render_complete:
+        bpy.app.handlers.render_complete.remove(_on_render_complete)
+    if _on_render_cancel in bpy.app.handlers.render_cancel:
+        bpy.app.handlers.render_cancel.remove(_on_render_cancel)
+
+
+def _end_capture():
+    """Restore the render settings; returns (png_bytes or None, seconds)"""
+    _remove_handlers()
+    scene = bpy.data.scenes.get(_capture['scene'] or "")
+    temp_file = _capture['temp_file']
+    seconds = time.time() - _capture['started']
+    png_bytes = None
+
+    if scene is not None:
+        pipeline.restore_capture_settings(scene, _capture['saved'])
+    if _capture['outcome'] == RENDER_COMPLETE:
+        try:
+            if not os.path.exists(temp_file) and 'Render Result' in bpy.data.images:
+                # write_still 没有写出文件时从渲染结果保存
+                bpy.data.images['Render Result'].save_render(temp_file)
+            with open(temp_file, 'rb') as f:
+                png_bytes = f.read()
+        except (OSError, RuntimeError) as e:
+            print(f"❌ 读取捕获图像失败: {e}")
+    try:
+        if temp_file and os.path.exists(temp_file):
+            os.unlink(temp_file)
+    except OSError:
+        pass
+
+    _capture.update(scene=None, saved=None, temp_file=None, on_done=None, outcome=None)
+    return png_bytes, seconds
+
+
+def _poll_capture():
+    """Timer: continue on the main thread as soon as the render has ended"""
+    if _capture['scene'] is None:
+        return None
+    if _capture['outcome'] is None:
+        return POLL_INTERVAL
+
+    outcome = _capture['outcome']
+    on_done = _capture['on_done']
+    png_bytes, seconds = _end_capture()
+    if outcome == RENDER_CANCEL:
+        print("⏹️ 捕获渲染已取消")
+    else:
+        print(f"✅ 捕获渲染完成 ({seconds:.1f}s)")
+
+    try:
+        on_done(png_bytes, seconds)
+    except Exception as e:
+        print(f"❌ 捕获后续处理失败: {e}")
+        import traceback
+        traceback.print_exc()
+    return None
+
+
+# ================================
+# Generation on a worker thread
+# ================================
+
+def show_result(image):
+    """Show the result in the Image Editor that shows the render, or the first one"""
+    editors = []
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'IMAGE_EDITOR':
+                editors.append(area)
+    # 优先使用渐进式渲染打开的渲染窗口
+    editors.sort(key=lambda area: not (area.spaces.active.image and area.spaces.active.image.type == 'RENDER_RESULT'))
+    if editors:
+        editors[0].spaces.active.image = image
+        editors[0].tag_redraw()
+
+
+class AsyncGeneration:
+    """One generation request for a captured PNG, finished by a timer
+
+    Subclasses change the request with build_payload() and what happens
+    with the returned image in apply_result().
+    """
+
+    # 正在进行的生成，防止定时器回调引用的对象被回收
+    active = []
+
+    SOURCE = 'viewport'
+
+    def __init__(self, scene, png_bytes, capture_seconds):
+        props = scene.nano_banana
+        self.scene_name = scene.name
+        self.debug_level = props.debug_level
+        self.start_time = time.time()
+        self.cancelled = False
+
+        output_dir = get_nano_banana_output_dir()
+        self.history = None
+        self.history_id = None
+        try:
+            self.history = history.open_history(output_dir)
+            self.history_id = self.history.begin(
+                blend=bpy.data.filepath,
+                scene=scene.name,
+                camera=scene.camera.name if scene.camera else None,
+                frame=scene.frame_current,
+                source=self.SOURCE,
+                settings=history.settings_snapshot(props),
+                capture_seconds=capture_seconds,
+            )
+        except Exception as e:
+            print(f"⚠️ 历史记录不可用: {e}")
+            self.history = None
+
+        self.job = output_manager.OutputJob(output_dir, props.save_artifacts, props.fsync_outputs, name_id=self.history_id)
+        self.job.write_bytes(output_manager.ARTIFACT_INPUT, png_bytes)
+
+        prompt = pipeline.build_image_generation_prompt(scene, props)
+        payload = self.build_payload(props, prompt, base64.b64encode(png_bytes).decode('utf-8'))
+        self.record = {
+            'status': history.STATUS_FAILED,
+            'prompt': prompt,
+            'request_hash': history.request_hash(payload),
+        }
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="NanoBananaGenerate")
+        self.future = executor.submit(pipeline.generate_from_capture, props.api_key, payload)
+        executor.shutdown(wait=False)
+
+    def build_payload(self, props, prompt, image_data):
+        return pipeline.build_generation_payload(props, prompt, image_data)
+
+    def apply_result(self, image_bytes):
+        """Save and show the generated image; returns the saved path"""
+        path = self.job.write_bytes(output_manager.ARTIFACT_RESULT, image_bytes)
+
+        def apply():
+            show_result(image_pool.load_image_from_memory(image_pool.RENDER_IMAGE_NAME, image_bytes, path))
+
+        delivery.submit(('async_render', self.scene_name), apply, image_name=image_pool.RENDER_IMAGE_NAME)
+        return path
+
+    def start(self):
+        AsyncGeneration.active.append(self)
+        batch.set_status(self.scene_name, "Generating AI render...")
+        bpy.app.timers.register(self.poll, first_interval=POLL_INTERVAL)
+
+    def cancel(self):
+        """Drop this request: it is not started if still queued, and its result is ignored"""
+        self.cancelled = True
+        self.future.cancel()
+
+    def poll(self):
+        if not self.cancelled and not self.future.done():
+            return POLL_INTERVAL
+        try:
+            if self.cancelled:
+                self.record['status'] = history.STATUS_CANCELLED
+                print("⏹️ AI渲染请求已取消")
+                batch.set_status(self.scene_name, "AI render cancelled")
+                self.finish_history()
+            else:
+                self.finish()
+        finally:
+            AsyncGeneration.active.remove(self)
+        return None
+
+    @property
+    def succeeded(self):
+        return self.record['status'] == history.STATUS_DONE
+
+    def finish(self):
+        image_bytes, info = self.future.result()
+        self.record['generate_seconds'] = info['elapsed']
+
+        if image_bytes is None:
+            self.record['error'] = info['error']
+            print(f"❌ AI渲染生成失败: {info['error']}")
+            batch.set_status(self.scene_name, f"AI render failed: {info['error']}")
+            if info['response'] is not None:
+                self.job.write_debug(info['response'], store_payloads=self.debug_level == 'PAYLOADS')
+        else:
+            path = self.apply_result(image_bytes)
+            if self.debug_level != 'ERRORS':
+                self.job.write_debug(info['response'], store_payloads=self.debug_level == 'PAYLOADS')
+            self.record['status'] = history.STATUS_DONE
+            print(f"🎉 AI图像生成完成 ({info['elapsed']:.1f}s)，总计 {time.time() - self.start_time:.1f}s")
+            batch.set_status(self.scene_name, f"AI render done ({info['elapsed']:.1f}s) → {os.path.basename(path or '')}")
+
+        print(f"💾 本次输出: {self.job.summary()}")
+        self.finish_history()
+
+    def finish_history(self):
+        if self.history is None or self.history_id is None:
+            return
+        record = dict(self.record)
+        record['input_path'] = self.job.files.get(output_manager.ARTIFACT_INPUT)
+        record['output_path'] = self.job.files.get(output_manager.ARTIFACT_RESULT)
+        record['debug_path'] = self.job.files.get(output_manager.ARTIFACT_DEBUG)
+        record['bytes_written'] = self.job.bytes_written
+        try:
+            self.history.finish(self.history_id, **record)
+            print(f"📒 历史记录 #{self.history_id}: {record['status']}")
+        except Exception as e:
+            print(f"⚠️ 更新历史记录失败: {e}")
+
+
+def unregister():
+    _remove_handlers()
+    if bpy.app.timers.is_registered(_poll_capture):
+        bpy.app.timers.unregister(_poll_capture)
+    _capture.update(scene=None, saved=None, temp_file=None, on_done=None, outcome=None)
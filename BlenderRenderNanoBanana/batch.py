@@ -0,0 +1,309 @@
+"""
+Multi-camera and marker-bound shot batch generation for Nano Banana Renderer
+
+收集用户选择的摄像机 / 时间线标记绑定的镜头（以及可选的环绕视图），
+在主线程中依次捕获，然后在线程池中并发生成，所有结果写入同一个
+Batch_<时间戳> 文件夹。进度通过 bpy.app.timers 轮询并显示在面板状态栏中。
+"""
+
+import bpy
+import os
+import json
+import math
+import time
+import base64
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from mathutils import Vector, Matrix
+
+from . import pipeline
+from . import history
+from . import delivery
+from . import image_pool
+from .properties import get_nano_banana_output_dir
+
+TURNTABLE_OBJECT_NAME = "NanoBanana_Turntable"
+BATCH_IMAGE_PREFIX = "NanoBanana_Batch_"
+
+
+def collect_views(context, props):
+    """Return the views chosen in the batch settings
+
+    Each view is a dict with 'label', 'camera', 'frame' and an optional
+    'matrix' to place the camera at before capturing (turntable views).
+    """
+    scene = context.scene
+    views = []
+
+    if props.batch_source == 'ALL_CAMERAS':
+        cameras = sorted((obj for obj in scene.objects if obj.type == 'CAMERA'), key=lambda obj: obj.name)
+        for camera in cameras:
+            views.append({'label': camera.name, 'camera': camera, 'frame': scene.frame_current})
+
+    elif props.batch_source == 'SELECTED_CAMERAS':
+        cameras = sorted((obj for obj in context.selected_objects if obj.type == 'CAMERA'), key=lambda obj: obj.name)
+        for camera in cameras:
+            views.append({'label': camera.name, 'camera': camera, 'frame': scene.frame_current})
+
+    elif props.batch_source == 'MARKERS':
+        for marker in sorted(scene.timeline_markers, key=lambda marker: marker.frame):
+            if marker.camera:
+                views.append({
+                    'label': f"{marker.name}_{marker.camera.name}",
+                    'camera': marker.camera,
+                    'frame': marker.frame,
+                })
+
+    if props.batch_turntable_views > 0:
+        target = props.batch_turntable_target
+        center = target.matrix_world.translation.copy() if target else Vector((0.0, 0.0, 0.0))
+        reference = scene.camera.matrix_world.translation.copy() if scene.camera else center + Vector((10.0, 0.0, 3.0))
+        for index, matrix in enumerate(turntable_matrices(center, reference, props.batch_turntable_views)):
+            views.append({
+                'label': f"Turntable_{index:02d}",
+                'camera': None,
+                'frame': scene.frame_current,
+                'matrix': matrix,
+            })
+
+    # 保证文件名唯一
+    used = set()
+    for view in views:
+        label = bpy.path.clean_name(view['label'])
+        unique = label
+        suffix = 1
+        while unique in used:
+            unique = f"{label}.{suffix:03d}"
+            suffix += 1
+        used.add(unique)
+        view['label'] = unique
+
+    return views
+
+
+def turntable_matrices(center, reference, count):
+    """World matrices for `count` cameras orbiting `center`, looking at it
+
+    The orbit keeps the distance and height of `reference` (usually the
+    scene camera) and starts at its angle.
+    """
+    offset = reference - center
+    radius = offset.xy.length
+    if radius < 1e-4:
+        radius = max(offset.length, 10.0)
+    start_angle = math.atan2(offset.y, offset.x)
+
+    matrices = []
+    for index in range(count):
+        angle = start_angle + 2.0 * math.pi * index / count
+        location = center + Vector((math.cos(angle) * radius, math.sin(angle) * radius, offset.z))
+        rotation = (center - location).to_track_quat('-Z', 'Y')
+        matrices.append(Matrix.Translation(location) @ rotation.to_matrix().to_4x4())
+    return matrices
+
+
+def create_turntable_camera(scene, name=TURNTABLE_OBJECT_NAME):
+    """Temporary camera object (a copy of the scene camera) used for extra views"""
+    if scene.camera:
+        camera_data = scene.camera.data.copy()
+    else:
+        camera_data = bpy.data.cameras.new(name)
+    camera_data.name = name
+    camera = bpy.data.objects.new(name, camera_data)
+    scene.collection.objects.link(camera)
+    return camera
+
+
+def remove_turntable_camera(camera):
+    camera_data = camera.data
+    bpy.data.objects.remove(camera, do_unlink=True)
+    if camera_data and camera_data.users == 0:
+        bpy.data.cameras.remove(camera_data)
+
+
+def set_status(scene_name, text):
+    """Show batch progress in the panel status box"""
+    scene = bpy.data.scenes.get(scene_name)
+    if scene is not None:
+        scene.nano_banana_status = text
+
+    # 合并重绘：多个状态更新只重绘一次
+    delivery.request_redraw('PROPERTIES', 'VIEW_3D')
+
+
+def batch_image_name(view):
+    return BATCH_IMAGE_PREFIX + view['label']
+
+
+class BatchRun:
+    """One running batch: concurrent requests plus a timer collecting results"""
+
+    # 正在运行的批处理，防止定时器回调引用的对象被回收
+    active = []
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, scene_name, output_dir, api_key, concurrency, history_dir=None, prompt="", settings=None):
+        self.scene_name = scene_name
+        self.output_dir = output_dir
+        self.api_key = api_key
+        self.history_dir = history_dir
+        self.prompt = prompt
+        self.settings = settings
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.futures = []
+        self.capture_failures = []
+        self.delivered = set()
+        self.start_time = time.time()
+
+    def submit(self, view, payload, capture_seconds):
+        path = os.path.join(self.output_dir, f"{view['label']}.png")
+        view['request_hash'] = history.request_hash(payload)
+        future = self.executor.submit(pipeline.generate_to_file, self.api_key, payload, path)
+        self.futures.append((view, capture_seconds, future))
+
+    def start(self):
+        BatchRun.active.append(self)
+        # 所有任务已提交，线程池在任务完成后自行退出
+        self.executor.shutdown(wait=False)
+        set_status(self.scene_name, f"Batch: 0/{len(self.futures)} done")
+        bpy.app.timers.register(self.poll, first_interval=self.POLL_INTERVAL)
+
+    def poll(self):
+        finished = [item for item in self.futures if item[2].done()]
+        succeeded = len([item for item in finished if item[2].result()[0]])
+        self.deliver(finished)
+        set_status(self.scene_name, f"Batch: {len(finished)}/{len(self.futures)} done, {len(finished) - succeeded} failed")
+
+        if len(finished) < len(self.futures):
+            return self.POLL_INTERVAL
+
+        self.finish()
+        return None
+
+    def deliver(self, finished):
+        """Queue newly finished shots for loading on the main thread"""
+        for view, _capture_seconds, future in finished:
+            path = future.result()[0]
+            if not path or view['label'] in self.delivered:
+                continue
+            self.delivered.add(view['label'])
+            name = batch_image_name(view)
+            delivery.submit(
+                (self.output_dir, view['label']),
+                lambda name=name, path=path: image_pool.load_file(name, path, image_pool.ROLE_RESULT),
+                frame=view['frame'],
+                image_name=name,
+            )
+
+    def finish(self):
+        entries = []
+        for view, capture_seconds, future in self.futures:
+            path, info = future.result()
+            entries.append({
+                'label': view['label'],
+                'camera': view['camera_name'],
+                'frame': view['frame'],
+                'path': path,
+                'capture_seconds': round(capture_seconds, 3),
+                'generate_seconds': round(info['elapsed'], 3),
+                'error': info['error'],
+            })
+            if path:
+                print(f"✅ {view['label']}: {path}")
+            else:
+                print(f"❌ {view['label']}: {info['error']}")
+
+        succeeded = len([entry for entry in entries if entry['path']])
+        summary = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'blend': bpy.data.filepath,
+            'seconds': round(time.time() - self.start_time, 3),
+            'succeeded': succeeded,
+            'failed': len(entries) - succeeded,
+            'capture_failures': self.capture_failures,
+            'views': entries,
+        }
+        try:
+            with open(os.path.join(self.output_dir, "batch.json"), 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            print(f"保存批处理记录失败: {e}")
+
+        self.record_history(entries)
+
+        print(f"🎉 批处理完成: {succeeded}/{len(entries)} 成功，结果保存在 {self.output_dir}")
+        set_status(self.scene_name, f"Batch done: {succeeded}/{len(entries)} succeeded → {os.path.basename(self.output_dir)}")
+        BatchRun.active.remove(self)
+
+    def record_history(self, entries):
+        """Add every view of this batch to the output directory's history index"""
+        if not self.history_dir:
+            return
+        try:
+            index = history.open_history(self.history_dir)
+            for entry, (view, _capture_seconds, future) in zip(entries, self.futures):
+                index.record(
+                    blend=bpy.data.filepath,
+                    scene=self.scene_name,
+                    camera=entry['camera'],
+                    frame=entry['frame'],
+                    source='batch',
+                    prompt=self.prompt,
+                    settings=self.settings,
+                    request_hash=view['request_hash'],
+                    status=history.STATUS_DONE if entry['path'] else history.STATUS_FAILED,
+                    error=entry['error'],
+                    output_path=entry['path'],
+                    capture_seconds=entry['capture_seconds'],
+                    generate_seconds=entry['generate_seconds'],
+                    bytes_written=future.result()[1].get('bytes'),
+                )
+        except Exception as e:
+            print(f"⚠️ 写入历史记录失败: {e}")
+
+
+def start_batch(context, views):
+    """Capture every view on the main thread and start concurrent generation
+
+    Labels of views that could not be captured are collected in
+    BatchRun.capture_failures. Call BatchRun.start() to begin polling.
+    """
+    scene = context.scene
+    props = scene.nano_banana
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    history_dir = get_nano_banana_output_dir(context)
+    output_dir = os.path.join(history_dir, f"Batch_{timestamp}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    full_prompt = pipeline.build_image_generation_prompt(scene, props)
+    run = BatchRun(scene.name, output_dir, props.api_key, props.batch_concurrency,
+                   history_dir=history_dir, prompt=full_prompt, settings=history.settings_snapshot(props))
+
+    turntable_camera = None
+    try:
+        for view in views:
+            camera = view['camera']
+            if view.get('matrix') is not None:
+                if turntable_camera is None:
+                    turntable_camera = create_turntable_camera(scene)
+                turntable_camera.matrix_world = view['matrix']
+                camera = turntable_camera
+            view['camera_name'] = camera.name
+
+            print(f"捕获镜头: {view['label']} (摄像机 {camera.name}, 帧 {view['frame']})")
+            capture_start = time.time()
+            png_bytes = pipeline.capture_camera_png(scene, camera=camera, frame=view['frame'])
+            if png_bytes is None:
+                run.capture_failures.append(view['label'])
+                continue
+
+            image_data = base64.b64encode(png_bytes).decode('utf-8')
+            payload = pipeline.build_generation_payload(props, full_prompt, image_data)
+            run.submit(view, payload, time.time() - capture_start)
+    finally:
+        if turntable_camera is not None:
+            remove_turntable_camera(turntable_camera)
+
+    return run
@@ -0,0 +1,245 @@
+"""
+Batch processing of many .blend files for Nano Banana Renderer
+
+对一个目录或通配符匹配到的所有 .blend 文件运行生成流程。每个文件由一个
+独立的无界面Blender进程处理（cli.py，使用文件中的活动摄像机），同时运行
+的进程数量有上限。所有结果汇总到输出目录下的 index.json 中，包括每个
+文件的耗时。
+
+本脚本不依赖 bpy，可以用系统Python或Blender自带的Python运行:
+
+    python BlenderRenderNanoBanana/blend_batch.py /mnt/assets --job job.json \\
+        --blender /opt/blender/blender --workers 4 --output-dir /mnt/lookdev/ai
+
+进度输出格式与 cli.py 相同（以 "NANOBANANA " 开头的单行JSON）。
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+PROGRESS_PREFIX = "NANOBANANA "
+
+CLI_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+
+# 与 cli.py 保持一致的退出码
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_BAD_JOB = 2
+EXIT_FAILED = 4
+
+_emit_lock = threading.Lock()
+
+
+def emit(event, **fields):
+    """Print one machine-readable progress line to stdout"""
+    record = {'event': event, 'time': round(time.time(), 3)}
+    record.update(fields)
+    line = PROGRESS_PREFIX + json.dumps(record, ensure_ascii=False)
+    with _emit_lock:
+        print(line, flush=True)
+
+
+def find_blend_files(sources, recursive=False):
+    """Expand directories and glob patterns into a sorted list of .blend files"""
+    files = set()
+    for source in sources:
+        if os.path.isdir(source):
+            pattern = os.path.join(source, "**", "*.blend") if recursive else os.path.join(source, "*.blend")
+            files.update(glob.glob(pattern, recursive=recursive))
+        else:
+            files.update(path for path in glob.glob(source, recursive=recursive) if path.endswith(".blend"))
+    return sorted(os.path.abspath(path) for path in files)
+
+
+def find_blender(explicit=None):
+    """Locate the Blender executable"""
+    candidates = [explicit, os.environ.get('BLENDER'), shutil.which('blender')]
+    if os.path.basename(sys.executable).lower().startswith('blender'):
+        candidates.append(sys.executable)
+    for candidate in candidates:
+        if candidate and os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def output_name(blend_path, used):
+    """Unique output folder name for one .blend file"""
+    name = os.path.splitext(os.path.basename(blend_path))[0]
+    unique = name
+    suffix = 1
+    while unique in used:
+        unique = f"{name}.{suffix:03d}"
+        suffix += 1
+    used.add(unique)
+    return unique
+
+
+def process_file(blender, blend_path, job_path, output_dir, threads):
+    """Run cli.py for one .blend file and return its index entry"""
+    # 脚本中未捕获的异常也要得到非零退出码，否则Blender会以0退出
+    command = [blender, '-b', blend_path, '-t', str(threads), '--python-exit-code', str(EXIT_FAILED),
+               '--python', CLI_SCRIPT, '--', '--output-dir', output_dir]
+    if job_path:
+        command += ['--job', job_path]
+
+    entry = {
+        'blend': blend_path,
+        'output_dir': output_dir,
+        'results': [],
+        'errors': [],
+        'capture_seconds': 0.0,
+        'generate_seconds': 0.0,
+    }
+
+    emit('file_start', blend=blend_path)
+    start = time.time()
+    try:
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+        )
+    except OSError as e:
+        entry.update(exit_code=None, status='error', seconds=0.0)
+        entry['errors'].append(f"无法启动Blender: {e}")
+        emit('file_done', blend=blend_path, status='error', seconds=0.0)
+        return entry
+
+    log_path = os.path.join(output_dir, "blender.log")
+    with open(log_path, 'w', encoding='utf-8') as log:
+        for line in process.stdout:
+            log.write(line)
+            if not line.startswith(PROGRESS_PREFIX):
+                continue
+            try:
+                record = json.loads(line[len(PROGRESS_PREFIX):])
+            except ValueError:
+                continue
+
+            event = record.get('event')
+            if event == 'captured':
+                entry['capture_seconds'] += record.get('seconds', 0.0)
+            elif event == 'frame_done':
+                entry['generate_seconds'] += record.get('seconds', 0.0)
+                entry['results'].append(record.get('path'))
+            elif event in ('frame_failed', 'error'):
+                entry['errors'].append(record.get('error') or record.get('message'))
+
+    exit_code = process.wait()
+    seconds = time.time() - start
+
+    if exit_code == EXIT_OK and entry['results']:
+        status = 'done'
+    elif exit_code == EXIT_PARTIAL:
+        status = 'partial'
+    else:
+        status = 'failed'
+        if exit_code == EXIT_OK:
+            entry['errors'].append("没有生成任何结果")
+
+    entry.update(
+        exit_code=exit_code,
+        status=status,
+        seconds=round(seconds, 3),
+        capture_seconds=round(entry['capture_seconds'], 3),
+        generate_seconds=round(entry['generate_seconds'], 3),
+        log=log_path,
+    )
+    emit('file_done', blend=blend_path, status=status, exit_code=exit_code,
+         results=len(entry['results']), seconds=entry['seconds'])
+    return entry
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="nano_banana_blend_batch",
+        description="Run the Nano Banana pipeline over a directory or glob of .blend files",
+    )
+    parser.add_argument("sources", nargs='+', help="Directories or glob patterns of .blend files")
+    parser.add_argument("--job", help="JSON job description passed to every file (see cli.py)")
+    parser.add_argument("--output-dir", required=True, help="Root directory for results and index.json")
+    parser.add_argument("--blender", help="Blender executable (default: $BLENDER or blender on PATH)")
+    parser.add_argument("--workers", type=int, default=2, help="Number of Blender processes running at once")
+    parser.add_argument("--recursive", action="store_true", help="Search directories recursively")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    blender = find_blender(args.blender)
+    if not blender:
+        emit('error', message="找不到Blender可执行文件，请使用 --blender 指定")
+        return EXIT_BAD_JOB
+
+    blend_files = find_blend_files(args.sources, recursive=args.recursive)
+    if not blend_files:
+        emit('error', message="没有找到 .blend 文件")
+        return EXIT_BAD_JOB
+
+    job_path = os.path.abspath(args.job) if args.job else None
+    output_root = os.path.abspath(args.output_dir)
+    os.makedirs(output_root, exist_ok=True)
+
+    workers = max(1, min(args.workers, len(blend_files)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    used_names = set()
+    assignments = []
+    for blend_path in blend_files:
+        output_dir = os.path.join(output_root, output_name(blend_path, used_names))
+        os.makedirs(output_dir, exist_ok=True)
+        assignments.append((blend_path, output_dir))
+
+    batch_start = time.time()
+    emit('batch_start', files=len(blend_files), workers=workers, output_dir=output_root)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(process_file, blender, blend_path, job_path, output_dir, threads)
+            for blend_path, output_dir in assignments
+        ]
+        entries = [future.result() for future in futures]
+
+    succeeded = len([entry for entry in entries if entry['status'] == 'done'])
+    index = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'blender': blender,
+        'job': job_path,
+        'workers': workers,
+        'seconds': round(time.time() - batch_start, 3),
+        'succeeded': succeeded,
+        'failed': len(entries) - succeeded,
+        'files': entries,
+    }
+    index_path = os.path.join(output_root, "index.json")
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+
+    if succeeded == len(entries):
+        exit_code = EXIT_OK
+    elif succeeded == 0 and not any(entry['status'] == 'partial' for entry in entries):
+        exit_code = EXIT_FAILED
+    else:
+        exit_code = EXIT_PARTIAL
+
+    emit('batch_done', succeeded=succeeded, failed=len(entries) - succeeded, index=index_path,
+         seconds=index['seconds'], exit_code=exit_code)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
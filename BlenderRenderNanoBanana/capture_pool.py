@@ -0,0 +1,92 @@
+"""
+Multi-process capture for Nano Banana Renderer
+
+启动多个后台Blender进程并行捕获同一个 .blend 文件的不同帧，所有捕获
+结果汇入父进程中的同一个队列。本模块只负责进程管理和结果收集，不访问
+bpy，工作进程的命令行由调用方（cli.py）构建。
+"""
+
+import json
+import queue
+import subprocess
+import threading
+
+
+def split_frames(frames, workers):
+    """Split frames into at most `workers` contiguous, evenly sized chunks"""
+    workers = max(1, min(workers, len(frames)))
+    chunk_size, remainder = divmod(len(frames), workers)
+
+    chunks = []
+    start = 0
+    for index in range(workers):
+        end = start + chunk_size + (1 if index < remainder else 0)
+        chunks.append(frames[start:end])
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+
+class CaptureWorkerPool:
+    """Run capture worker processes and merge their reports into one queue
+
+    Workers print progress lines starting with `progress_prefix` followed by
+    a JSON object. 'captured' and 'frame_failed' records are forwarded to
+    the shared queue; every other output line is discarded.
+    """
+
+    FORWARDED_EVENTS = ('captured', 'frame_failed')
+
+    def __init__(self, commands, progress_prefix):
+        self.commands = commands
+        self.progress_prefix = progress_prefix
+        self.queue = queue.Queue()
+        self.processes = []
+        self.return_codes = []
+
+    def start(self):
+        for command in self.commands:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+            )
+            self.processes.append(process)
+            reader = threading.Thread(target=self._read_worker, args=(process,), daemon=True)
+            reader.start()
+            print(f"✅ 捕获工作进程已启动: PID {process.pid}")
+
+    def _read_worker(self, process):
+        try:
+            for line in process.stdout:
+                if not line.startswith(self.progress_prefix):
+                    continue
+                try:
+                    record = json.loads(line[len(self.progress_prefix):])
+                except ValueError:
+                    continue
+                if record.get('event') in self.FORWARDED_EVENTS:
+                    self.queue.put(record)
+        finally:
+            self.queue.put({'event': 'worker_exit', 'pid': process.pid, 'returncode': process.wait()})
+
+    def captures(self):
+        """Yield worker records as they arrive until every worker has exited"""
+        running = len(self.processes)
+        while running:
+            record = self.queue.get()
+            if record['event'] == 'worker_exit':
+                running -= 1
+                self.return_codes.append(record['returncode'])
+                if record['returncode'] != 0:
+                    print(f"⚠️ 捕获工作进程 {record['pid']} 退出码: {record['returncode']}")
+                continue
+            yield record
+
+    def terminate(self):
+        """Stop any worker that is still running"""
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
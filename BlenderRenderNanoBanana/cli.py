@@ -0,0 +1,601 @@
+"""
+Headless command-line runner for Nano Banana Renderer
+
+在渲染农场节点上无界面运行完整的 捕获→生成→保存 流程:
+
+    blender -b shot.blend --python BlenderRenderNanoBanana/cli.py -- --job job.json
+
+任务描述 (JSON):
+
+    {
+        "frames": [1, 5, "10-20"],
+        "cameras": ["CAM_A", "CAM_B"],
+        "settings": {"image_prompt": "...", "aspect_ratio": "16:9", "quality": "HIGH"},
+        "concurrency": 4,
+        "capture_workers": 1,
+        "capture_resolution": 512,
+        "output_dir": "/mnt/shots/ai",
+        "save_inputs": false,
+        "queue": {"lease_seconds": 600, "max_attempts": 3, "poll_interval": 5}
+    }
+
+"frames" 可以是整数、"a-b" 区间或 "scene"（场景帧范围），默认当前帧；
+"cameras" 默认场景摄像机；"settings" 中的键对应 scene.nano_banana 的属性。
+"concurrency" 控制同时进行的API请求数；"capture_workers" 大于1时，会启动
+相应数量的后台Blender进程分段并行捕获，捕获结果汇入本进程的上传队列。
+API密钥依次从任务文件 "api_key"、环境变量 NANOBANANA_API_KEY / GEMINI_API_KEY
+和插件配置文件中读取。命令行参数会覆盖任务文件中的同名字段。
+
+使用 --queue 指向共享存储上的SQLite数据库时，多个节点上的进程从同一个
+帧队列中租用帧（见 frame_queue.py）。--enqueue 把任务中的帧加入队列，
+可以由任意节点重复执行；结果图像和同名 .json 记录写入共享的输出目录。
+
+    blender -b shot.blend --python cli.py -- --job job.json --queue /mnt/farm/shot.sqlite --enqueue
+
+进度以单行JSON输出到stdout，每行以 "NANOBANANA " 开头，便于和Blender
+自身的日志区分。退出码见下方 EXIT_* 常量。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+import importlib
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import bpy
+
+if __package__:
+    ADDON_PACKAGE = __package__
+else:
+    # 作为 --python 脚本运行时没有包上下文，把插件所在目录的上级加入搜索路径
+    _addon_dir = os.path.dirname(os.path.abspath(__file__))
+    ADDON_PACKAGE = os.path.basename(_addon_dir)
+    if os.path.dirname(_addon_dir) not in sys.path:
+        sys.path.insert(0, os.path.dirname(_addon_dir))
+
+pipeline = importlib.import_module(f"{ADDON_PACKAGE}.pipeline")
+capture_pool = importlib.import_module(f"{ADDON_PACKAGE}.capture_pool")
+frame_queue = importlib.import_module(f"{ADDON_PACKAGE}.frame_queue")
+properties = importlib.import_module(f"{ADDON_PACKAGE}.properties")
+
+PROGRESS_PREFIX = "NANOBANANA "
+
+# 退出码
+EXIT_OK = 0             # 所有帧成功
+EXIT_PARTIAL = 1        # 部分帧失败
+EXIT_BAD_JOB = 2        # 参数或任务描述无效（JobError），重试无用
+EXIT_ENVIRONMENT = 3    # 缺少API密钥、requests库等运行环境问题
+EXIT_FAILED = 4         # 所有帧都失败，或出现意外错误
+
+_emit_lock = threading.Lock()
+
+
+class JobError(Exception):
+    """The job description or its arguments are invalid; retrying will not help"""
+
+
+class JobEnvironmentError(Exception):
+    """The job is valid but this machine cannot run it (no API key, no requests)"""
+
+
+def job_value(mapping, key, default, convert=int):
+    """mapping[key] converted with `convert`, as a JobError when it is not valid"""
+    value = mapping.get(key, default)
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise JobError(f"{key} 的值无效: {value!r}")
+
+
+def emit(event, **fields):
+    """Print one machine-readable progress line to stdout"""
+    record = {'event': event, 'time': round(time.time(), 3)}
+    record.update(fields)
+    line = PROGRESS_PREFIX + json.dumps(record, ensure_ascii=False)
+    with _emit_lock:
+        print(line, flush=True)
+
+
+def ensure_registered():
+    """Register the add-on when it is not enabled in this Blender session"""
+    if not hasattr(bpy.types.Scene, 'nano_banana'):
+        importlib.import_module(ADDON_PACKAGE).register()
+
+
+def parse_frames(values, scene):
+    """Expand a frame specification into a list of frame numbers
+
+    Only a missing or empty specification means the current frame; 0 is frame 0.
+    """
+    if values is None or values == '':
+        return [scene.frame_current]
+    if isinstance(values, (int, str)):
+        values = str(values).split(',')
+
+    frames = []
+    for value in values:
+        if isinstance(value, int):
+            frames.append(value)
+            continue
+
+        value = str(value).strip()
+        if value == 'scene':
+            frames.extend(range(scene.frame_start, scene.frame_end + 1, max(1, scene.frame_step)))
+            continue
+
+        match = re.match(r'^(-?\d+)\s*-\s*(-?\d+)$', value)
+        if match:
+            start, end = int(match.group(1)), int(match.group(2))
+            if end < start:
+                raise JobError(f"无效的帧区间: {value}")
+            frames.extend(range(start, end + 1))
+        else:
+            try:
+                frames.append(int(value))
+            except ValueError:
+                raise JobError(f"无效的帧: {value}")
+
+    return frames
+
+
+def resolve_cameras(names, scene):
+    """Look up camera objects by name, defaulting to the scene camera"""
+    if not names:
+        if not scene.camera:
+            raise JobError("场景没有活动摄像机，请在任务中指定 cameras")
+        return [scene.camera]
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(',') if name.strip()]
+
+    cameras = []
+    for name in names:
+        obj = scene.objects.get(name)
+        if obj is None or obj.type != 'CAMERA':
+            raise JobError(f"场景中没有名为 {name} 的摄像机")
+        cameras.append(obj)
+    return cameras
+
+
+def apply_settings(props, settings):
+    """Copy job settings onto scene.nano_banana"""
+    for key, value in (settings or {}).items():
+        if key == 'api_key' or not hasattr(props, key):
+            raise JobError(f"未知的设置项: {key}")
+        try:
+            setattr(props, key, value)
+        except (TypeError, ValueError) as e:
+            raise JobError(f"设置项 {key} 的值无效: {e}")
+
+
+def resolve_api_key(job, props):
+    """Find an API key without prompting"""
+    return (
+        job.get('api_key')
+        or os.environ.get('NANOBANANA_API_KEY')
+        or os.environ.get('GEMINI_API_KEY')
+        or properties.load_api_key()
+        or props.api_key
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="nano_banana_cli",
+        description="Run the Nano Banana capture→generate→save pipeline without a UI",
+    )
+    parser.add_argument("--job", help="Path to a JSON job description")
+    parser.add_argument("--frames", help="Frames to process, e.g. '1,5,10-20' or 'scene'")
+    parser.add_argument("--cameras", help="Comma separated camera object names")
+    parser.add_argument("--prompt", help="Override settings.image_prompt")
+    parser.add_argument("--concurrency", type=int, help="Number of concurrent API requests")
+    parser.add_argument("--output-dir", help="Directory for generated images")
+    parser.add_argument("--capture-workers", type=int, help="Number of background Blender processes capturing in parallel")
+    parser.add_argument("--queue", help="Shared SQLite frame queue to pull frames from")
+    parser.add_argument("--enqueue", action="store_true", help="Add the job's frames to the queue before working")
+    parser.add_argument("--node-id", help="Worker name recorded in the queue (default host:pid)")
+    # 内部参数: 以捕获工作进程模式运行
+    parser.add_argument("--capture-worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--capture-dir", help=argparse.SUPPRESS)
+    return parser
+
+
+def load_job(args):
+    """Merge the job file with command-line overrides"""
+    job = {}
+    if args.job:
+        try:
+            with open(args.job, 'r', encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError) as e:
+            raise JobError(f"无法读取任务文件 {args.job}: {e}")
+        if not isinstance(job, dict):
+            raise JobError("任务描述必须是JSON对象")
+
+    if args.frames is not None:
+        job['frames'] = args.frames
+    if args.cameras:
+        job['cameras'] = args.cameras
+    if args.prompt:
+        job.setdefault('settings', {})['image_prompt'] = args.prompt
+    if args.concurrency:
+        job['concurrency'] = args.concurrency
+    if args.output_dir:
+        job['output_dir'] = args.output_dir
+    if args.capture_workers:
+        job['capture_workers'] = args.capture_workers
+    return job
+
+
+def unit_name(camera_name, frame):
+    """File-safe name of one camera/frame unit"""
+    return f"{bpy.path.clean_name(camera_name)}_{frame:04d}"
+
+
+def iter_local_captures(scene, frames, cameras, resolution):
+    """Capture every unit in this process, yielding (unit, camera, frame, png_bytes, seconds)"""
+    for frame in frames:
+        for camera in cameras:
+            start = time.time()
+            png_bytes = pipeline.capture_camera_png(scene, camera=camera, frame=frame, resolution=resolution)
+            yield unit_name(camera.name, frame), camera.name, frame, png_bytes, time.time() - start
+
+
+def iter_pool_captures(frames, cameras, resolution, workers):
+    """Capture in background Blender processes, yielding the same tuples as iter_local_captures"""
+    if not bpy.data.filepath:
+        raise JobError("多进程捕获需要已保存的 .blend 文件")
+
+    capture_dir = tempfile.mkdtemp(prefix="nano_banana_capture_")
+    camera_names = [camera.name for camera in cameras]
+    chunks = capture_pool.split_frames(frames, workers)
+    threads = max(1, (os.cpu_count() or 1) // len(chunks))
+
+    commands = []
+    for index, chunk in enumerate(chunks):
+        worker_job = os.path.join(capture_dir, f"worker_{index}.json")
+        with open(worker_job, 'w', encoding='utf-8') as f:
+            json.dump({'frames': chunk, 'cameras': camera_names, 'capture_resolution': resolution}, f)
+        commands.append([
+            bpy.app.binary_path, '-b', bpy.data.filepath, '-t', str(threads),
+            '--python', os.path.abspath(__file__), '--',
+            '--capture-worker', '--job', worker_job, '--capture-dir', capture_dir,
+        ])
+
+    expected = {unit_name(name, frame): (name, frame) for frame in frames for name in camera_names}
+    pool = capture_pool.CaptureWorkerPool(commands, PROGRESS_PREFIX)
+    try:
+        pool.start()
+        for record in pool.captures():
+            unit = record.get('unit')
+            if unit not in expected:
+                continue
+            camera_name, frame = expected.pop(unit)
+
+            png_bytes = None
+            if record['event'] == 'captured':
+                try:
+                    with open(record['path'], 'rb') as f:
+                        png_bytes = f.read()
+                    os.unlink(record['path'])
+                except OSError as e:
+                    print(f"读取捕获文件失败: {e}")
+            yield unit, camera_name, frame, png_bytes, record.get('seconds', 0.0)
+
+        # 工作进程异常退出时未报告的帧视为捕获失败
+        for unit, (camera_name, frame) in expected.items():
+            yield unit, camera_name, frame, None, 0.0
+    finally:
+        pool.terminate()
+        shutil.rmtree(capture_dir, ignore_errors=True)
+
+
+def run_capture_worker(job, capture_dir):
+    """Worker process: capture the assigned frames and report each file"""
+    scene = bpy.context.scene
+    frames = parse_frames(job.get('frames'), scene)
+    cameras = resolve_cameras(job.get('cameras'), scene)
+    resolution = job_value(job, 'capture_resolution', 512)
+
+    succeeded = failed = 0
+    for unit, camera_name, frame, png_bytes, seconds in iter_local_captures(scene, frames, cameras, resolution):
+        if png_bytes is None:
+            emit('frame_failed', unit=unit, stage='capture', error="捕获失败")
+            failed += 1
+            continue
+
+        path = os.path.join(capture_dir, f"{unit}.png")
+        with open(path + '.part', 'wb') as f:
+            f.write(png_bytes)
+        os.replace(path + '.part', path)
+        emit('captured', unit=unit, camera=camera_name, frame=frame, path=path,
+             bytes=len(png_bytes), seconds=round(seconds, 3))
+        succeeded += 1
+
+    if failed == 0:
+        return EXIT_OK
+    return EXIT_FAILED if succeeded == 0 else EXIT_PARTIAL
+
+
+def write_atomic(path, data):
+    """Write via a temporary name so other nodes never see partial files"""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def generate_unit(api_key, payload, png_bytes, unit, output_dir, save_inputs, record=None):
+    """Worker thread: request one generation and write the result
+
+    Returns (result_path, error). When `record` is given it is written next
+    to the image as <unit>.json.
+    """
+    image_bytes, info = pipeline.generate_from_capture(api_key, payload)
+    if image_bytes is None:
+        emit('frame_failed', unit=unit, stage='generate', error=info['error'],
+             seconds=round(info['elapsed'], 3))
+        return None, info['error']
+
+    result_path = os.path.join(output_dir, f"{unit}.png")
+    try:
+        if save_inputs:
+            write_atomic(os.path.join(output_dir, f"{unit}_input.png"), png_bytes)
+        write_atomic(result_path, image_bytes)
+        if record is not None:
+            record = dict(record, path=result_path, bytes=len(image_bytes),
+                          seconds=round(info['elapsed'], 3), finished=round(time.time(), 3))
+            write_atomic(os.path.join(output_dir, f"{unit}.json"),
+                         json.dumps(record, ensure_ascii=False, indent=2).encode('utf-8'))
+    except OSError as e:
+        emit('frame_failed', unit=unit, stage='save', error=str(e))
+        return None, str(e)
+
+    emit('frame_done', unit=unit, path=result_path, bytes=len(image_bytes),
+         seconds=round(info['elapsed'], 3))
+    return result_path, None
+
+
+def prepare_job(job, scene):
+    """Apply settings and resolve what every run mode needs
+
+    Returns (output_dir, api_key, concurrency, resolution, save_inputs).
+    """
+    props = scene.nano_banana
+    apply_settings(props, job.get('settings'))
+
+    output_dir = job.get('output_dir') or properties.get_nano_banana_output_dir()
+    output_dir = os.path.abspath(bpy.path.abspath(output_dir))
+    os.makedirs(output_dir, exist_ok=True)
+
+    api_key = resolve_api_key(job, props)
+    if not api_key:
+        raise JobEnvironmentError("未找到API密钥")
+    if not pipeline.REQUESTS_AVAILABLE:
+        raise JobEnvironmentError("requests库不可用")
+
+    concurrency = max(1, job_value(job, 'concurrency', 1))
+    resolution = job_value(job, 'capture_resolution', 512)
+    save_inputs = bool(job.get('save_inputs', False))
+    return output_dir, api_key, concurrency, resolution, save_inputs
+
+
+def run_job(job):
+    """Run a job in the current Blender session and return an exit code"""
+    scene = bpy.context.scene
+    props = scene.nano_banana
+
+    output_dir, api_key, concurrency, resolution, save_inputs = prepare_job(job, scene)
+    frames = parse_frames(job.get('frames'), scene)
+    cameras = resolve_cameras(job.get('cameras'), scene)
+
+    capture_workers = max(1, job_value(job, 'capture_workers', 1))
+    unit_count = len(frames) * len(cameras)
+    if not unit_count:
+        emit('error', message="任务中没有需要处理的帧")
+        return EXIT_BAD_JOB
+
+    job_start = time.time()
+    emit('job_start', blend=bpy.data.filepath, units=unit_count, frames=frames,
+         cameras=[camera.name for camera in cameras], concurrency=concurrency,
+         capture_workers=capture_workers, output_dir=output_dir)
+
+    if capture_workers > 1:
+        captures = iter_pool_captures(frames, cameras, resolution, capture_workers)
+        # 工作进程只负责捕获，提示词在本进程中构建一次即可
+        full_prompt = pipeline.build_image_generation_prompt(scene, props)
+    else:
+        captures = iter_local_captures(scene, frames, cameras, resolution)
+        full_prompt = None
+
+    results = []
+    in_flight = set()
+    # 上传队列有上限：捕获比生成快时（多进程捕获），后面的捕获留在磁盘上，
+    # 内存中最多只有这么多个请求的PNG和payload
+    max_in_flight = 2 * concurrency
+
+    def collect(done):
+        for future in done:
+            in_flight.discard(future)
+            result_path, _error = future.result()
+            results.append(result_path is not None)
+
+    # 捕获顺序进行（本进程主线程或工作进程），生成请求在线程池中与后续捕获重叠进行
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for unit, camera_name, frame, png_bytes, seconds in captures:
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            if png_bytes is None:
+                emit('frame_failed', unit=unit, stage='capture', error="捕获失败")
+                results.append(False)
+                continue
+            emit('captured', unit=unit, camera=camera_name, frame=frame, bytes=len(png_bytes),
+                 seconds=round(seconds, 3))
+
+            prompt = full_prompt or pipeline.build_image_generation_prompt(scene, props)
+            image_data = base64.b64encode(png_bytes).decode('utf-8')
+            payload = pipeline.build_generation_payload(props, prompt, image_data)
+            in_flight.add(executor.submit(
+                generate_unit, api_key, payload, png_bytes, unit, output_dir, save_inputs
+            ))
+            # 请求完成后线程池会释放参数，这里不再保留引用
+            del png_bytes, image_data, payload
+
+        collect(wait(in_flight).done)
+
+    succeeded = results.count(True)
+    failed = len(results) - succeeded
+    if failed == 0:
+        exit_code = EXIT_OK
+    elif succeeded == 0:
+        exit_code = EXIT_FAILED
+    else:
+        exit_code = EXIT_PARTIAL
+
+    emit('job_done', succeeded=succeeded, failed=failed,
+         seconds=round(time.time() - job_start, 3), exit_code=exit_code)
+    return exit_code
+
+
+def run_queue_worker(job, queue_path, node, seed):
+    """Pull frames from a shared queue until it is drained and return an exit code"""
+    scene = bpy.context.scene
+    props = scene.nano_banana
+
+    output_dir, api_key, concurrency, resolution, save_inputs = prepare_job(job, scene)
+    queue_config = job.get('queue') or {}
+    poll_interval = job_value(queue_config, 'poll_interval', 5.0, float)
+    queue = frame_queue.FrameQueue(
+        queue_path,
+        lease_seconds=job_value(queue_config, 'lease_seconds', 600, float),
+        max_attempts=job_value(queue_config, 'max_attempts', 3),
+    )
+
+    if seed:
+        frames = parse_frames(job.get('frames'), scene)
+        cameras = resolve_cameras(job.get('cameras'), scene)
+        queue.enqueue([(unit_name(camera.name, frame), camera.name, frame)
+                       for frame in frames for camera in cameras])
+
+    job_start = time.time()
+    emit('queue_start', queue=queue_path, node=node, concurrency=concurrency,
+         output_dir=output_dir, counts=queue.counts())
+
+    heartbeat = frame_queue.LeaseHeartbeat(queue, node)
+    heartbeat.start()
+
+    succeeded = failed = 0
+    in_flight = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                leased = queue.lease(node, concurrency - len(in_flight)) if len(in_flight) < concurrency else []
+
+                for entry in leased:
+                    unit = entry['unit']
+                    heartbeat.add(unit)
+                    emit('leased', unit=unit, node=node, attempt=entry['attempt'])
+
+                    camera = scene.objects.get(entry['camera'])
+                    png_bytes = None
+                    if camera is not None and camera.type == 'CAMERA':
+                        capture_start = time.time()
+                        png_bytes = pipeline.capture_camera_png(scene, camera=camera, frame=entry['frame'],
+                                                                resolution=resolution)
+                    if png_bytes is None:
+                        error = "捕获失败" if camera is not None else f"场景中没有摄像机 {entry['camera']}"
+                        emit('frame_failed', unit=unit, stage='capture', error=error)
+                        queue.fail(node, unit, error)
+                        heartbeat.discard(unit)
+                        failed += 1
+                        continue
+                    emit('captured', unit=unit, camera=camera.name, frame=entry['frame'],
+                         bytes=len(png_bytes), seconds=round(time.time() - capture_start, 3))
+
+                    full_prompt = pipeline.build_image_generation_prompt(scene, props)
+                    image_data = base64.b64encode(png_bytes).decode('utf-8')
+                    payload = pipeline.build_generation_payload(props, full_prompt, image_data)
+                    record = {'unit': unit, 'camera': camera.name, 'frame': entry['frame'],
+                              'node': node, 'attempt': entry['attempt'], 'blend': bpy.data.filepath}
+                    future = executor.submit(generate_unit, api_key, payload, png_bytes, unit,
+                                             output_dir, save_inputs, record)
+                    in_flight[future] = unit
+
+                if not in_flight:
+                    if not leased:
+                        # 其他节点仍持有租约时等待它们完成或租约过期
+                        if queue.is_finished():
+                            break
+                        time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(list(in_flight), timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    unit = in_flight.pop(future)
+                    heartbeat.discard(unit)
+                    result_path, error = future.result()
+                    if result_path:
+                        if queue.complete(node, unit, result_path):
+                            succeeded += 1
+                        else:
+                            # 租约已过期并被其他节点接手（或该帧已失败），结果不计入
+                            emit('lease_lost', unit=unit, node=node, path=result_path)
+                    else:
+                        queue.fail(node, unit, error)
+                        failed += 1
+    finally:
+        heartbeat.stop()
+
+    counts = queue.counts()
+    if counts[frame_queue.STATUS_FAILED] == 0:
+        exit_code = EXIT_OK
+    elif counts[frame_queue.STATUS_DONE] == 0:
+        exit_code = EXIT_FAILED
+    else:
+        exit_code = EXIT_PARTIAL
+
+    emit('queue_done', node=node, succeeded=succeeded, failed=failed, counts=counts,
+         seconds=round(time.time() - job_start, 3), exit_code=exit_code)
+    return exit_code
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+
+    args = build_parser().parse_args(argv)
+
+    try:
+        ensure_registered()
+        job = load_job(args)
+        if args.capture_worker:
+            return run_capture_worker(job, args.capture_dir)
+        if args.queue:
+            node = args.node_id or frame_queue.default_node_id()
+            return run_queue_worker(job, args.queue, node, args.enqueue)
+        return run_job(job)
+    except JobEnvironmentError as e:
+        emit('error', message=str(e))
+        return EXIT_ENVIRONMENT
+    except JobError as e:
+        emit('error', message=str(e))
+        return EXIT_BAD_JOB
+    except Exception as e:
+        # 运行中的错误（输出目录写满、网络存储不可用...）和意外错误都是
+        # EXIT_FAILED，农场和批处理调用方可以重试
+        traceback.print_exc()
+        emit('error', message=f"{type(e).__name__}: {e}")
+        return EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
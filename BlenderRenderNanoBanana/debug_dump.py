@@ -0,0 +1,118 @@
+"""
+Compact debug dumps for Nano Banana Renderer
+
+API 响应中的图像以 base64 字符串返回，一个响应可能有好几 MB。调试转储
+把这些二进制数据替换为占位符（解码后的字节数、sha256 和 MIME 类型），
+其余内容原样保留，然后用 gzip 压缩。需要时二进制数据可以按内容寻址
+保存到 .artifacts/ 中：相同内容只保存一次，占位符记录它的相对路径。
+不再被任何转储引用的内容由保留策略（retention.py）删除。
+
+本模块不访问 bpy，也可以直接运行来查看转储:
+
+    python BlenderRenderNanoBanana/debug_dump.py NanoBanana/Debug_Response_20241103_150110_000043.json.gz
+"""
+
+import os
+import re
+import sys
+import json
+import gzip
+import base64
+import hashlib
+import binascii
+import mimetypes
+
+DUMP_EXTENSION = ".json.gz"
+ARTIFACT_STORE_DIRNAME = ".artifacts"
+
+# 比这更短的字符串不会被当作二进制数据
+BLOB_MIN_CHARS = 1024
+_BASE64 = re.compile(r"[A-Za-z0-9+/_-]+={0,2}")
+
+# 占位符中标记二进制数据的键
+BLOB_KEY = "$blob"
+
+
+def _decode_base64(text):
+    """Decoded bytes of a base64 (or url-safe base64) string, or None"""
+    if len(text) < BLOB_MIN_CHARS or not _BASE64.fullmatch(text):
+        return None
+    try:
+        return base64.b64decode(text.replace('-', '+').replace('_', '/'), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def blob_path(store_dir, digest, mime_type=None):
+    """Content addressed path of a payload: <store>/<aa>/<sha256><ext>"""
+    extension = mimetypes.guess_extension(mime_type or "") or ".bin"
+    return os.path.join(store_dir, digest[:2], digest + extension)
+
+
+def compact(data, store=None, mime_type=None):
+    """Copy of a JSON value with base64 payloads replaced by placeholders
+
+    store(raw, digest, mime_type) may keep the payload somewhere and
+    return a path that is recorded in the placeholder.
+    """
+    if isinstance(data, dict):
+        mime_type = data.get('mimeType') or data.get('mime_type') or mime_type
+        return {key: compact(value, store, mime_type) for key, value in data.items()}
+    if isinstance(data, list):
+        return [compact(value, store, mime_type) for value in data]
+    if isinstance(data, str):
+        raw = _decode_base64(data)
+        if raw is None:
+            return data
+        digest = hashlib.sha256(raw).hexdigest()
+        placeholder = {BLOB_KEY: "base64", 'bytes': len(raw), 'sha256': digest}
+        if mime_type:
+            placeholder['mime_type'] = mime_type
+        if store is not None:
+            stored = store(raw, digest, mime_type)
+            if stored:
+                placeholder['stored'] = stored
+        return placeholder
+    return data
+
+
+def encode(data, store=None):
+    """gzip compressed compact JSON of a debug dump"""
+    text = json.dumps(compact(data, store), ensure_ascii=False, separators=(',', ':'))
+    # mtime=0: 相同内容得到相同的字节
+    return gzip.compress(text.encode('utf-8'), compresslevel=6, mtime=0)
+
+
+def stored_paths(data):
+    """Relative paths of all stored payloads referenced by a compact dump"""
+    paths = set()
+    if isinstance(data, dict):
+        if data.get(BLOB_KEY) and data.get('stored'):
+            paths.add(data['stored'])
+        for value in data.values():
+            paths |= stored_paths(value)
+    elif isinstance(data, list):
+        for value in data:
+            paths |= stored_paths(value)
+    return paths
+
+
+def load(path):
+    """Read a dump written by encode() (plain .json dumps work too)"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("用法: debug_dump.py <Debug_Response_*.json.gz> ...")
+        return 2
+    for path in argv:
+        print(json.dumps(load(path), indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Main-thread result delivery for Nano Banana Renderer
+
+批处理和动画任务可能一次完成很多帧。加载图像、更新图像编辑器和重绘
+界面都必须在主线程进行，一次全部处理会让界面明显卡顿。这里把这些工作
+放进队列，由 bpy.app.timers 逐个执行，每次回调最多只用几毫秒：
+
+- 同一个键（例如同一个镜头）还没执行的旧结果直接被新结果替换；
+- 图像编辑器正在显示的图像和当前帧的结果优先；
+- 重绘请求先合并，每次回调最后对每个区域只调用一次 tag_redraw()。
+"""
+
+import bpy
+import time
+import itertools
+
+# 每次定时器回调最多用于执行任务的时间(秒)
+TICK_BUDGET = 0.004
+TICK_INTERVAL = 0.02
+
+_pending = {}
+_sequence = itertools.count()
+_redraw = {'areas': set(), 'images': set()}
+
+
+class Delivery:
+    """One piece of main-thread work, usually applying one finished result"""
+
+    def __init__(self, key, apply, frame=None, image_name=None):
+        self.key = key
+        self.apply = apply
+        self.frame = frame
+        self.image_name = image_name
+        self.order = next(_sequence)
+
+    def priority(self, viewed_images, current_frame):
+        # 越小越先执行
+        return (
+            self.image_name not in viewed_images,
+            self.frame is not None and self.frame != current_frame,
+            self.order,
+        )
+
+
+def submit(key, apply, frame=None, image_name=None):
+    """Queue apply() to run on the main thread
+
+    A pending delivery with the same key is replaced. frame and image_name
+    are used for ordering (current frame and images on screen go first),
+    and Image Editors showing image_name are redrawn afterwards.
+    """
+    _pending[key] = Delivery(key, apply, frame, image_name)
+    _ensure_timer()
+
+
+def request_redraw(*area_types):
+    """Redraw all areas of these types once, at the end of the next tick"""
+    _redraw['areas'].update(area_types)
+    _ensure_timer()
+
+
+def _ensure_timer():
+    if not bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.register(_tick, first_interval=0.0)
+
+
+def _viewed_images():
+    names = set()
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'IMAGE_EDITOR' and area.spaces.active.image is not None:
+                names.add(area.spaces.active.image.name)
+    return names
+
+
+def _flush_redraws():
+    area_types = _redraw['areas']
+    images = _redraw['images']
+    if not area_types and not images:
+        return
+
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type in area_types:
+                area.tag_redraw()
+            elif area.type == 'IMAGE_EDITOR' and area.spaces.active.image is not None:
+                if area.spaces.active.image.name in images:
+                    area.tag_redraw()
+    _redraw['areas'] = set()
+    _redraw['images'] = set()
+
+
+def run(budget=TICK_BUDGET):
+    """Apply queued deliveries for at most `budget` seconds (at least one)"""
+    if _pending:
+        scene = getattr(bpy.context, 'scene', None)
+        current_frame = scene.frame_current if scene is not None else None
+        viewed = _viewed_images()
+        queue = sorted(_pending.values(), key=lambda delivery: delivery.priority(viewed, current_frame))
+
+        deadline = time.perf_counter() + budget
+        for delivery in queue:
+            # 之前执行的任务可能已经提交了同一个键的新结果
+            if _pending.get(delivery.key) is not delivery:
+                continue
+            del _pending[delivery.key]
+            try:
+                delivery.apply()
+            except Exception as e:
+                print(f"⚠️ 结果应用失败 ({delivery.key}): {e}")
+            else:
+                if delivery.image_name:
+                    _redraw['images'].add(delivery.image_name)
+            if time.perf_counter() >= deadline:
+                break
+
+    _flush_redraws()
+
+
+def _tick():
+    """Timer: deliver within the tick budget, keep running while work is queued"""
+    run()
+    return TICK_INTERVAL if _pending else None
+
+
+def unregister():
+    if bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.unregister(_tick)
+    _pending.clear()
+    _redraw['areas'] = set()
+    _redraw['images'] = set()
@@ -0,0 +1,178 @@
+"""
+Background disk writer for Nano Banana Renderer
+
+输出图像和调试文件在主线程中编码成字节后交给后台线程写入磁盘，网络存储
+上的慢速写入不再卡住界面。队列有上限：队列满时提交方会等待（背压），
+避免内存无限增长。保存 .blend 文件前、插件注销时和 Blender 退出时会等待
+所有待写入的文件完成。
+
+每个文件先写入同目录下的临时文件再原子替换，可选 fsync。
+"""
+
+import bpy
+import os
+import queue
+import atexit
+import threading
+from bpy.app.handlers import persistent
+
+# 最多排队的待写入文件数
+MAX_PENDING = 16
+
+
+class WriteRequest:
+    """One queued file write; wait() blocks until it is on disk"""
+
+    def __init__(self, path, data, fsync):
+        self.path = path
+        self.data = data
+        self.fsync = fsync
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Wait for the write; returns the error message or None"""
+        self.done.wait(timeout)
+        return self.error
+
+
+def write_file(path, data, fsync=False):
+    """Atomically write bytes to path, optionally fsyncing file and directory"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class DiskWriter:
+    """Bounded queue of file writes served by one background thread"""
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.bytes_written = 0
+
+    def _ensure_started(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="NanoBananaDiskWriter", daemon=True)
+            self.thread.start()
+
+    def submit(self, path, data, fsync=False):
+        """Queue bytes for writing; blocks while the queue is full"""
+        request = WriteRequest(path, data, fsync)
+        with self.lock:
+            self.pending.add(path)
+        self._ensure_started()
+
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            print(f"⏳ 写入队列已满 ({self.queue.maxsize})，等待后台写入...")
+            self.queue.put(request)
+        return request
+
+    def reserve(self, path):
+        """Mark a file written outside the queue (e.g. a streamed PNG) as pending"""
+        with self.lock:
+            self.pending.add(path)
+
+    def release(self, path):
+        with self.lock:
+            self.pending.discard(path)
+
+    def is_pending(self, path):
+        """True while path is queued but not written yet"""
+        with self.lock:
+            return path in self.pending
+
+    def _run(self):
+        while True:
+            request = self.queue.get()
+            if request is None:
+                self.queue.task_done()
+                return
+            try:
+                write_file(request.path, request.data, request.fsync)
+                self.bytes_written += len(request.data)
+            except OSError as e:
+                request.error = str(e)
+                print(f"❌ 后台写入失败: {request.path}: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(request.path)
+                request.data = None
+                request.done.set()
+                self.queue.task_done()
+
+    def flush(self):
+        """Block until every queued write has finished"""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.join()
+
+    def shutdown(self):
+        """Flush and stop the writer thread"""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.join()
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
+
+
+_writer = DiskWriter()
+
+
+def submit(path, data, fsync=False):
+    """Queue a write on the shared writer"""
+    return _writer.submit(path, data, fsync)
+
+
+def is_pending(path):
+    return _writer.is_pending(path)
+
+
+def reserve(path):
+    _writer.reserve(path)
+
+
+def release(path):
+    _writer.release(path)
+
+
+def flush():
+    """Wait for all pending writes of the shared writer"""
+    if _writer.queue.unfinished_tasks:
+        print(f"💾 等待 {_writer.queue.unfinished_tasks} 个文件写入完成...")
+    _writer.flush()
+
+
+@persistent
+def _flush_on_save(*args):
+    flush()
+
+
+def register():
+    if _flush_on_save not in bpy.app.handlers.save_pre:
+        bpy.app.handlers.save_pre.append(_flush_on_save)
+    atexit.register(flush)
+
+
+def unregister():
+    if _flush_on_save in bpy.app.handlers.save_pre:
+        bpy.app.handlers.save_pre.remove(_flush_on_save)
+    atexit.unregister(flush)
+    _writer.shutdown()
@@ -0,0 +1,456 @@
+"""
+Structured analysis and scene fix plans for Nano Banana Renderer
+
+分析请求要求模型按 ANALYSIS_SCHEMA 返回 JSON：一段建议文字，加上具体的
+灯光、渲染设置和材质修改。build_plan() 把这些建议与当前场景比较，只列出
+还没有生效的修改（类似 diff）；apply_plan() 只执行这些修改，并复用固定
+名称的数据块（AI_Key_Light、AI_<对象名> 材质...），重复应用不会产生新的
+灯光或材质。已有材质不会被替换：只调整它的 Principled BSDF；被其他对象
+共用时调整一个只链接到该对象的副本，没有材质的网格才会添加 AI_<对象名>。
+
+分析结果按场景指纹缓存在输出目录的 .fix_plans/ 中：指纹包含视野内对象的
+变换和网格数据、材质节点数值、灯光、摄像机、世界、渲染设置和提示词，
+这些都没有变化时，再次分析直接使用缓存，不再调用API。
+"""
+
+import bpy
+import os
+import re
+import json
+import hashlib
+
+from . import disk_writer
+from . import scene_summary
+from .pipeline import get_main_prompt
+
+CACHE_DIRNAME = ".fix_plans"
+
+LIGHT_ROLES = ('KEY', 'FILL', 'RIM', 'AMBIENT')
+LIGHT_TYPES = ('SUN', 'AREA', 'POINT', 'SPOT')
+ENGINES = ('EEVEE', 'CYCLES')
+
+# 数值比较的容差（重复应用时视为相同）
+TOLERANCE = 1e-3
+
+_NUMBER_ARRAY = {"type": "ARRAY", "items": {"type": "NUMBER"}}
+
+ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "advice": {"type": "STRING"},
+        "lights": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "role": {"type": "STRING", "enum": list(LIGHT_ROLES)},
+                    "type": {"type": "STRING", "enum": list(LIGHT_TYPES)},
+                    "energy": {"type": "NUMBER"},
+                    "color": _NUMBER_ARRAY,
+                    "location": _NUMBER_ARRAY,
+                    "reason": {"type": "STRING"},
+                },
+                "required": ["role", "type", "energy"],
+            },
+        },
+        "render": {
+            "type": "OBJECT",
+            "properties": {
+                "engine": {"type": "STRING", "enum": list(ENGINES)},
+                "samples": {"type": "INTEGER"},
+                "denoise": {"type": "BOOLEAN"},
+                "reason": {"type": "STRING"},
+            },
+        },
+        "materials": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "object": {"type": "STRING"},
+                    "base_color": _NUMBER_ARRAY,
+                    "metallic": {"type": "NUMBER"},
+                    "roughness": {"type": "NUMBER"},
+                    "reason": {"type": "STRING"},
+                },
+                "required": ["object"],
+            },
+        },
+    },
+    "required": ["advice"],
+    # advice 最先输出，流式显示时可以立即阅读
+    "propertyOrdering": ["advice", "lights", "render", "materials"],
+}
+
+
+# ================================
+# Parsing
+# ================================
+
+def _vector(value, default):
+    if isinstance(value, (list, tuple)) and len(value) >= 3:
+        try:
+            return [float(component) for component in value[:3]]
+        except (TypeError, ValueError):
+            pass
+    return list(default)
+
+
+def _number(value, default, low=None, high=None):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    if low is not None:
+        number = max(low, number)
+    if high is not None:
+        number = min(high, number)
+    return number
+
+
+def parse_analysis(text):
+    """Analysis dict from the model's JSON answer (free text becomes plain advice)"""
+    data = None
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        # 模型偶尔会把JSON包在代码块里
+        match = re.search(r"\{.*\}", text or "", re.DOTALL)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+            except ValueError:
+                data = None
+    if not isinstance(data, dict):
+        return {'advice': text or "", 'lights': [], 'render': {}, 'materials': []}
+
+    lights = []
+    for light in data.get('lights') or []:
+        if not isinstance(light, dict):
+            continue
+        role = str(light.get('role', 'KEY')).upper()
+        light_type = str(light.get('type', 'AREA')).upper()
+        lights.append({
+            'role': role if role in LIGHT_ROLES else 'KEY',
+            'type': light_type if light_type in LIGHT_TYPES else 'AREA',
+            'energy': _number(light.get('energy'), 10.0, low=0.0),
+            'color': _vector(light.get('color'), (1.0, 1.0, 1.0)),
+            'location': _vector(light.get('location'), (4.0, -4.0, 6.0)),
+            'reason': str(light.get('reason', "")),
+        })
+
+    render = {}
+    suggested = data.get('render') if isinstance(data.get('render'), dict) else {}
+    engine = str(suggested.get('engine', "")).upper()
+    if engine in ENGINES:
+        render['engine'] = engine
+    samples = int(_number(suggested.get('samples'), 0, 0, 65536))
+    if samples:
+        render['samples'] = samples
+    if isinstance(suggested.get('denoise'), bool):
+        render['denoise'] = suggested['denoise']
+    if suggested.get('reason'):
+        render['reason'] = str(suggested['reason'])
+
+    materials = [
+        {
+            'object': str(material['object']),
+            'base_color': _vector(material.get('base_color'), (0.8, 0.8, 0.8)),
+            'metallic': _number(material.get('metallic'), 0.0, 0.0, 1.0),
+            'roughness': _number(material.get('roughness'), 0.5, 0.0, 1.0),
+            'reason': str(material.get('reason', "")),
+        }
+        for material in data.get('materials') or []
+        if isinstance(material, dict) and material.get('object')
+    ]
+    return {'advice': str(data.get('advice', "")), 'lights': lights, 'render': render, 'materials': materials}
+
+
+def format_analysis(analysis):
+    """Readable text (markdown) of an analysis and its suggested changes"""
+    lines = [analysis['advice'].strip()]
+    changes = []
+    for light in analysis['lights']:
+        changes.append(f"- {light['role'].title()} light: {light['type'].lower()} {light['energy']:g} W"
+                       + (f" — {light['reason']}" if light['reason'] else ""))
+    render = analysis['render']
+    if render.get('engine'):
+        changes.append(f"- Render: {render['engine']}"
+                       + (f", {render['samples']} samples" if render.get('samples') else "")
+                       + (f" — {render['reason']}" if render.get('reason') else ""))
+    for material in analysis['materials']:
+        changes.append(f"- Material for {material['object']}: metallic {material['metallic']:g}, "
+                       f"roughness {material['roughness']:g}"
+                       + (f" — {material['reason']}" if material['reason'] else ""))
+    if changes:
+        lines += ["", "Suggested changes:"] + changes
+    return "\n".join(lines)
+
+
+# ================================
+# Fingerprint and cache
+# ================================
+
+def _rounded(values, digits=3):
+    return [round(value, digits) for value in values]
+
+
+def _socket_value(value):
+    if isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return round(value, 3)
+    try:
+        return _rounded(value)
+    except TypeError:
+        return None
+
+
+def _node_tree_state(tree):
+    """Unlinked input values and links of a node tree (material / world edits)"""
+    if tree is None:
+        return None
+    nodes = []
+    for node in sorted(tree.nodes, key=lambda node: node.name):
+        inputs = [[socket.identifier, _socket_value(socket.default_value)]
+                  for socket in node.inputs
+                  if not socket.is_linked and hasattr(socket, 'default_value')]
+        nodes.append([node.name, node.bl_idname, inputs])
+    links = sorted([link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier]
+                   for link in tree.links)
+    return [nodes, links]
+
+
+def _material_state(material):
+    if material.use_nodes:
+        return _node_tree_state(material.node_tree)
+    return [_rounded(material.diffuse_color), round(material.metallic, 3), round(material.roughness, 3)]
+
+
+def _object_state(obj):
+    """Name, transform and data identity of an object in view"""
+    state = [obj.name, obj.type, [_rounded(row) for row in obj.matrix_world]]
+    data = obj.data
+    if data is not None:
+        state.append(data.name)
+        if obj.type == 'MESH':
+            # 顶点/面数和局部包围盒足以发现大多数几何编辑
+            state.append([len(data.vertices), len(data.polygons)])
+        state.append([_rounded(corner) for corner in obj.bound_box])
+    return state
+
+
+def scene_fingerprint(scene, props):
+    """Hash of everything an analysis depends on (cheap: uses the scene summary)"""
+    summary = scene_summary.summary_for(scene)
+    lights = []
+    for name in sorted(summary.lights.values()):
+        obj = bpy.data.objects.get(name)
+        if obj is not None and obj.type == 'LIGHT':
+            lights.append([name, obj.data.type, round(obj.data.energy, 3),
+                           _rounded(obj.data.color), _rounded(obj.matrix_world.translation)])
+
+    in_view = []
+    for name in sorted(name for _radius, name in summary.in_view.values()):
+        obj = bpy.data.objects.get(name)
+        if obj is not None:
+            in_view.append(_object_state(obj))
+
+    materials = []
+    for name in sorted(name for name, count in summary.materials.items() if count > 0):
+        material = bpy.data.materials.get(name)
+        materials.append([name, _material_state(material) if material is not None else None])
+
+    camera = scene.camera
+    world = scene.world
+    state = {
+        'counts': dict(summary.type_counts),
+        'in_view': in_view,
+        'materials': materials,
+        'lights': lights,
+        'camera': [_rounded(row) for row in camera.matrix_world] if camera else None,
+        'lens': round(camera.data.lens, 3) if camera and camera.type == 'CAMERA' else None,
+        'engine': scene.render.engine,
+        'resolution': [scene.render.resolution_x, scene.render.resolution_y],
+        'world': [world.name, _node_tree_state(world.node_tree) if world.use_nodes else _rounded(world.color)]
+                 if world else None,
+        'prompt': get_main_prompt(props),
+        'style': props.style_prompt,
+    }
+    encoded = json.dumps(state, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class PlanCache:
+    """Parsed analyses keyed by scene fingerprint, one small JSON file each"""
+
+    def __init__(self, output_dir):
+        self.directory = os.path.join(output_dir, CACHE_DIRNAME)
+
+    def path_for(self, fingerprint):
+        return os.path.join(self.directory, f"{fingerprint}.json")
+
+    def get(self, fingerprint):
+        try:
+            with open(self.path_for(fingerprint), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, fingerprint, analysis):
+        data = json.dumps(analysis, ensure_ascii=False, indent=2).encode('utf-8')
+        disk_writer.write_file(self.path_for(fingerprint), data)
+
+
+# ================================
+# Diff and apply
+# ================================
+
+def light_name(role):
+    return f"AI_{role.title()}_Light"
+
+
+def material_name(obj):
+    return f"AI_{obj.name}"
+
+
+def engine_identifier(engine):
+    """Render engine id of this Blender version for 'EEVEE' / 'CYCLES'"""
+    if engine == 'CYCLES':
+        return 'CYCLES'
+    available = {item.identifier for item in bpy.types.RenderSettings.bl_rna.properties['engine'].enum_items}
+    # Blender 4.2-4.x 使用 BLENDER_EEVEE_NEXT
+    return 'BLENDER_EEVEE_NEXT' if 'BLENDER_EEVEE_NEXT' in available else 'BLENDER_EEVEE'
+
+
+def _close(current, wanted):
+    current = list(current) if hasattr(current, '__len__') else [current]
+    wanted = list(wanted) if isinstance(wanted, (list, tuple)) else [wanted]
+    return len(current) >= len(wanted) and all(abs(a - b) <= TOLERANCE for a, b in zip(current, wanted))
+
+
+def _principled(material):
+    if material is None or not material.use_nodes or material.node_tree is None:
+        return None
+    return next((node for node in material.node_tree.nodes if node.type == 'BSDF_PRINCIPLED'), None)
+
+
+def current_material(obj):
+    """Material in the first slot of an object, or None when it has no slot or an empty one"""
+    if obj.material_slots and obj.material_slots[0].material is not None:
+        return obj.material_slots[0].material
+    return None
+
+
+def _is_shared(obj, material):
+    """True when changing material would also change other objects"""
+    return material.users > 1 or obj.data.users > 1
+
+
+def build_plan(analysis, scene):
+    """Changes of an analysis that are not in the scene yet (list of dicts)"""
+    plan = []
+
+    for light in analysis['lights']:
+        name = light_name(light['role'])
+        obj = bpy.data.objects.get(name)
+        if (obj is not None and obj.type == 'LIGHT' and obj.data.type == light['type']
+                and _close([obj.data.energy], [light['energy']]) and _close(obj.data.color, light['color'])
+                and _close(obj.location, light['location']) and scene.collection.all_objects.get(name)):
+            continue
+        plan.append({'op': 'light', 'name': name, 'type': light['type'], 'energy': light['energy'],
+                     'color': light['color'], 'location': light['location']})
+
+    render = analysis['render']
+    if render.get('engine') in ENGINES:
+        engine = engine_identifier(render['engine'])
+        if scene.render.engine != engine:
+            plan.append({'op': 'engine', 'engine': engine})
+    if render.get('samples'):
+        samples = render['samples']
+        if render.get('engine') == 'CYCLES' or scene.render.engine == 'CYCLES':
+            if getattr(scene.cycles, 'samples', samples) != samples:
+                plan.append({'op': 'samples', 'engine': 'CYCLES', 'samples': samples})
+        elif scene.eevee.taa_render_samples != samples:
+            plan.append({'op': 'samples', 'engine': 'EEVEE', 'samples': samples})
+    if 'denoise' in render and hasattr(scene, 'cycles') and scene.cycles.use_denoising != bool(render['denoise']):
+        plan.append({'op': 'denoise', 'value': bool(render['denoise'])})
+
+    for suggestion in analysis['materials']:
+        obj = bpy.data.objects.get(suggestion['object'])
+        if obj is None or obj.type != 'MESH':
+            continue
+        material = current_material(obj)
+        bsdf = _principled(material)
+        if material is not None and bsdf is None:
+            # 不替换用户自己的非节点材质
+            continue
+        if (bsdf is not None
+                and _close(bsdf.inputs['Base Color'].default_value, suggestion['base_color'])
+                and _close([bsdf.inputs['Metallic'].default_value], [suggestion['metallic']])
+                and _close([bsdf.inputs['Roughness'].default_value], [suggestion['roughness']])):
+            continue
+        plan.append({'op': 'material', 'object': obj.name, 'name': material_name(obj),
+                     'base_color': suggestion['base_color'], 'metallic': suggestion['metallic'],
+                     'roughness': suggestion['roughness']})
+    return plan
+
+
+def apply_plan(plan, scene):
+    """Apply the changes of build_plan(); returns the number applied"""
+    applied = 0
+    for change in plan:
+        op = change['op']
+        if op == 'light':
+            obj = bpy.data.objects.get(change['name'])
+            if obj is None or obj.type != 'LIGHT':
+                data = bpy.data.lights.new(change['name'], change['type'])
+                obj = bpy.data.objects.new(change['name'], data)
+            elif obj.data.type != change['type']:
+                obj.data.type = change['type']
+            if not scene.collection.all_objects.get(obj.name):
+                scene.collection.objects.link(obj)
+            obj.data.energy = change['energy']
+            obj.data.color = change['color']
+            obj.location = change['location']
+        elif op == 'engine':
+            scene.render.engine = change['engine']
+        elif op == 'samples':
+            if change['engine'] == 'CYCLES':
+                scene.cycles.samples = change['samples']
+            else:
+                scene.eevee.taa_render_samples = change['samples']
+        elif op == 'denoise':
+            scene.cycles.use_denoising = change['value']
+        elif op == 'material':
+            obj = bpy.data.objects.get(change['object'])
+            if obj is None:
+                continue
+            material = current_material(obj)
+            if material is None:
+                # 只填充没有材质的网格或空槽位
+                material = bpy.data.materials.get(change['name'])
+                if material is None:
+                    material = bpy.data.materials.new(change['name'])
+                    material.use_nodes = True
+                if obj.material_slots:
+                    obj.material_slots[0].material = material
+                else:
+                    obj.data.materials.append(material)
+            elif _is_shared(obj, material) and material.name != change['name']:
+                # 已有材质被其他对象共用：修改它的副本，只链接到这个对象
+                material = material.copy()
+                material.name = change['name']
+                slot = obj.material_slots[0]
+                slot.link = 'OBJECT'
+                slot.material = material
+            bsdf = _principled(material)
+            if bsdf is None:
+                continue
+            bsdf.inputs['Base Color'].default_value = (*change['base_color'], 1.0)
+            bsdf.inputs['Metallic'].default_value = change['metallic']
+            bsdf.inputs['Roughness'].default_value = change['roughness']
+        else:
+            continue
+        applied += 1
+    return applied
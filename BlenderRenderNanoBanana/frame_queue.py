@@ -0,0 +1,212 @@
+"""
+Distributed frame queue for Nano Banana Renderer
+
+多个渲染节点上的无界面工作进程共享同一个SQLite数据库，从中租用(lease)
+待处理的帧。租约有过期时间，处理中的节点会定期续约；节点崩溃后租约过期，
+其他节点会自动接手这些帧，无需人工清理。失败的帧会重新排队，直到达到
+最大尝试次数。
+
+本模块不访问 bpy。每次操作都使用独立的连接，可以在多个线程中调用。
+数据库放在共享存储上时请勿开启WAL模式（网络文件系统不支持共享内存）。
+"""
+
+import os
+import time
+import socket
+import sqlite3
+import threading
+
+STATUS_PENDING = 'pending'
+STATUS_LEASED = 'leased'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    unit TEXT PRIMARY KEY,
+    camera TEXT NOT NULL,
+    frame INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    node TEXT,
+    lease_expires REAL,
+    result_path TEXT,
+    error TEXT,
+    updated REAL
+)
+"""
+
+
+def default_node_id():
+    """Identify this worker as host:pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class FrameQueue:
+    """SQLite backed frame leasing queue"""
+
+    def __init__(self, path, lease_seconds=600, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(SCHEMA)
+
+    def _connect(self):
+        # isolation_level=None: 自己控制事务，租用时使用 BEGIN IMMEDIATE 取得写锁
+        return _Connection(sqlite3.connect(self.path, timeout=60, isolation_level=None))
+
+    def enqueue(self, units):
+        """Add (unit, camera, frame) tuples; units already in the queue are kept as they are"""
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT OR IGNORE INTO frames (unit, camera, frame, status, updated) VALUES (?, ?, ?, ?, ?)",
+                [(unit, camera, frame, STATUS_PENDING, now) for unit, camera, frame in units]
+            )
+            connection.execute("COMMIT")
+
+    def lease(self, node, count=1):
+        """Lease up to `count` frames for `node`
+
+        Pending frames and frames whose lease has expired are both eligible.
+        An expired lease that already used up its attempts is marked failed
+        instead of being handed out again.
+        """
+        now = time.time()
+        leased = []
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute(
+                    "SELECT unit, camera, frame, attempts, status FROM frames "
+                    "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                    "ORDER BY frame, camera",
+                    (STATUS_PENDING, STATUS_LEASED, now)
+                ).fetchall()
+
+                for unit, camera, frame, attempts, status in rows:
+                    if len(leased) >= count:
+                        break
+                    if attempts >= self.max_attempts:
+                        connection.execute(
+                            "UPDATE frames SET status = ?, node = NULL, lease_expires = NULL, error = ?, updated = ? WHERE unit = ?",
+                            (STATUS_FAILED, "租约过期且已达到最大尝试次数", now, unit)
+                        )
+                        continue
+                    if status == STATUS_LEASED:
+                        print(f"⚠️ 接手过期租约: {unit}")
+                    connection.execute(
+                        "UPDATE frames SET status = ?, node = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE unit = ?",
+                        (STATUS_LEASED, node, now + self.lease_seconds, now, unit)
+                    )
+                    leased.append({'unit': unit, 'camera': camera, 'frame': frame, 'attempt': attempts + 1})
+
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return leased
+
+    def renew(self, node, units):
+        """Extend the leases `node` still holds on `units`"""
+        if not units:
+            return
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE frames SET lease_expires = ?, updated = ? WHERE unit = ? AND node = ? AND status = ?",
+                [(now + self.lease_seconds, now, unit, node, STATUS_LEASED) for unit in units]
+            )
+
+    def complete(self, node, unit, result_path):
+        """Record a finished frame; returns False when `node` no longer holds its lease
+
+        Like fail(), only the node holding the current lease may finish a unit:
+        a lease that expired and went to another node, or a unit that has
+        already failed, is left unchanged.
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE frames SET status = ?, lease_expires = NULL, result_path = ?, error = NULL, updated = ? "
+                "WHERE unit = ? AND node = ? AND status = ?",
+                (STATUS_DONE, result_path, time.time(), unit, node, STATUS_LEASED)
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, node, unit, error):
+        """Release a failed frame for retry, or mark it failed after max_attempts"""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE frames SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "node = NULL, lease_expires = NULL, error = ?, updated = ? "
+                "WHERE unit = ? AND node = ? AND status = ?",
+                (self.max_attempts, STATUS_FAILED, STATUS_PENDING, error, time.time(), unit, node, STATUS_LEASED)
+            )
+
+    def counts(self):
+        """Return {status: count}"""
+        with self._connect() as connection:
+            rows = connection.execute("SELECT status, COUNT(*) FROM frames GROUP BY status").fetchall()
+        counts = {STATUS_PENDING: 0, STATUS_LEASED: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def is_finished(self):
+        """True when no frame is pending or leased"""
+        counts = self.counts()
+        return counts[STATUS_PENDING] == 0 and counts[STATUS_LEASED] == 0
+
+
+class _Connection:
+    """Close the sqlite connection on exit (sqlite3's own context manager only commits)"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.close()
+
+
+class LeaseHeartbeat:
+    """Background thread renewing the leases a node currently holds"""
+
+    def __init__(self, queue, node):
+        self.queue = queue
+        self.node = node
+        self.units = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def add(self, unit):
+        with self.lock:
+            self.units.add(unit)
+
+    def discard(self, unit):
+        with self.lock:
+            self.units.discard(unit)
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _run(self):
+        interval = max(1.0, self.queue.lease_seconds / 3.0)
+        while not self.stop_event.wait(interval):
+            with self.lock:
+                units = list(self.units)
+            try:
+                self.queue.renew(self.node, units)
+            except sqlite3.Error as e:
+                print(f"⚠️ 续约失败: {e}")
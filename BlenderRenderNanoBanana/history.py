@@ -0,0 +1,317 @@
+"""
+Generation history index for Nano Banana Renderer
+
+输出目录 (NanoBanana/) 下的 history.sqlite 为每次生成记录一行：提示词、
+设置、请求哈希、耗时、输入/输出路径和状态。文件名中的编号来自这一行的
+id，不再需要扫描目录来找一个没被占用的名字。提示词（可用时使用FTS5全文
+索引）、日期和摄像机都有索引，查询很快。
+
+本模块不访问 bpy，也可以直接运行来查询历史:
+
+    python BlenderRenderNanoBanana/history.py /path/to/NanoBanana --prompt "rainy street" --since 2024-11-01
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime
+from contextlib import closing
+
+HISTORY_FILENAME = "history.sqlite"
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS generations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created REAL NOT NULL,
+        blend TEXT,
+        scene TEXT,
+        camera TEXT,
+        frame INTEGER,
+        source TEXT,
+        prompt TEXT NOT NULL DEFAULT '',
+        settings TEXT,
+        request_hash TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        error TEXT,
+        input_path TEXT,
+        output_path TEXT,
+        debug_path TEXT,
+        capture_seconds REAL,
+        generate_seconds REAL,
+        bytes_written INTEGER,
+        pinned INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS generations_created ON generations (created)",
+    "CREATE INDEX IF NOT EXISTS generations_camera ON generations (camera, created)",
+    "CREATE INDEX IF NOT EXISTS generations_hash ON generations (request_hash)",
+]
+
+# 提示词全文索引（Blender自带的sqlite通常支持FTS5，不支持时退回LIKE查询）
+FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5(prompt, content='generations', content_rowid='id')",
+    """
+    CREATE TRIGGER IF NOT EXISTS generations_fts_insert AFTER INSERT ON generations BEGIN
+        INSERT INTO generations_fts (rowid, prompt) VALUES (new.id, new.prompt);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS generations_fts_delete AFTER DELETE ON generations BEGIN
+        INSERT INTO generations_fts (generations_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS generations_fts_update AFTER UPDATE OF prompt ON generations BEGIN
+        INSERT INTO generations_fts (generations_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+        INSERT INTO generations_fts (rowid, prompt) VALUES (new.id, new.prompt);
+    END
+    """,
+]
+
+COLUMNS = (
+    'id', 'created', 'blend', 'scene', 'camera', 'frame', 'source', 'prompt', 'settings',
+    'request_hash', 'status', 'error', 'input_path', 'output_path', 'debug_path',
+    'capture_seconds', 'generate_seconds', 'bytes_written', 'pinned',
+)
+
+# 旧版本数据库中缺少的列: (列名, 定义)
+MIGRATIONS = (
+    ('pinned', "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# 记录到历史中的生成设置
+SETTINGS_KEYS = (
+    'ai_service', 'image_prompt', 'style_prompt', 'aspect_ratio', 'prompt_style',
+    'lighting_style', 'camera_angle', 'quality', 'include_scene_context',
+)
+
+
+def request_hash(payload):
+    """Stable hash of a generation request (prompt, settings and input image)"""
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def settings_snapshot(props):
+    """Plain dict of the generation settings worth keeping with a record"""
+    return {key: getattr(props, key) for key in SETTINGS_KEYS if hasattr(props, key)}
+
+
+def parse_day(value, end=False):
+    """'YYYY-MM-DD' → epoch seconds at the start (or end) of that local day"""
+    day = datetime.strptime(value, "%Y-%m-%d")
+    seconds = time.mktime(day.timetuple())
+    return seconds + 86400 if end else seconds
+
+
+class GenerationHistory:
+    """SQLite index of all generations in one output directory"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            existing = {row[1] for row in connection.execute("PRAGMA table_info(generations)")}
+            for column, definition in MIGRATIONS:
+                if column not in existing:
+                    connection.execute(f"ALTER TABLE generations ADD COLUMN {column} {definition}")
+            try:
+                for statement in FTS_SCHEMA:
+                    connection.execute(statement)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                self.has_fts = False
+            connection.commit()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def begin(self, **fields):
+        """Insert a pending record and return its id (used for file names)"""
+        fields.setdefault('status', STATUS_PENDING)
+        return self._insert(fields)
+
+    def record(self, **fields):
+        """Insert a finished record in one go; returns its id"""
+        fields.setdefault('status', STATUS_DONE)
+        return self._insert(fields)
+
+    def _insert(self, fields):
+        fields.setdefault('created', time.time())
+        fields = self._encode(fields)
+        names = list(fields)
+        with closing(self._connect()) as connection:
+            cursor = connection.execute(
+                f"INSERT INTO generations ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})",
+                [fields[name] for name in names]
+            )
+            connection.commit()
+            return cursor.lastrowid
+
+    def finish(self, record_id, **fields):
+        """Update a record with its results (status, paths, timings...)"""
+        fields = self._encode(fields)
+        if not fields:
+            return
+        with closing(self._connect()) as connection:
+            connection.execute(
+                f"UPDATE generations SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                list(fields.values()) + [record_id]
+            )
+            connection.commit()
+
+    def _encode(self, fields):
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"未知的历史字段: {', '.join(sorted(unknown))}")
+        if isinstance(fields.get('settings'), dict):
+            fields['settings'] = json.dumps(fields['settings'], ensure_ascii=False, sort_keys=True)
+        return fields
+
+    def get(self, record_id):
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT * FROM generations WHERE id = ?", (record_id,)).fetchone()
+        return dict(row) if row else None
+
+    def set_pinned(self, record_id, pinned):
+        """Pinned records are never removed by the retention policy"""
+        self.finish(record_id, pinned=1 if pinned else 0)
+
+    def pinned_paths(self):
+        """All input/output/debug paths of pinned records"""
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT input_path, output_path, debug_path FROM generations WHERE pinned = 1"
+            ).fetchall()
+        return {path for row in rows for path in row if path}
+
+    def forget_paths(self, paths):
+        """Clear input/output/debug paths that point at deleted files; returns the rows changed"""
+        paths = {os.path.normpath(path) for path in paths}
+        if not paths:
+            return 0
+        changed = 0
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT id, input_path, output_path, debug_path FROM generations "
+                "WHERE input_path IS NOT NULL OR output_path IS NOT NULL OR debug_path IS NOT NULL"
+            ).fetchall()
+            for row in rows:
+                cleared = [column for column in ('input_path', 'output_path', 'debug_path')
+                           if row[column] and os.path.normpath(row[column]) in paths]
+                if cleared:
+                    connection.execute(
+                        f"UPDATE generations SET {', '.join(f'{column} = NULL' for column in cleared)} WHERE id = ?",
+                        (row['id'],)
+                    )
+                    changed += 1
+            connection.commit()
+        return changed
+
+    def search(self, prompt=None, camera=None, since=None, until=None, status=None, request_hash=None,
+               limit=50, offset=0):
+        """Newest records matching all given filters
+
+        prompt matches words in the prompt (full text when available),
+        since/until are epoch seconds. limit/offset page through the results.
+        """
+        where, params = self._filters(prompt, camera, since, until, status, request_hash)
+        query = "SELECT * FROM generations" + where + " ORDER BY created DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+
+        with closing(self._connect()) as connection:
+            return [dict(row) for row in connection.execute(query, params).fetchall()]
+
+    def count(self, prompt=None, camera=None, since=None, until=None, status=None, request_hash=None):
+        """Number of records matching the same filters as search()"""
+        where, params = self._filters(prompt, camera, since, until, status, request_hash)
+        with closing(self._connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM generations" + where, params).fetchone()[0]
+
+    def _filters(self, prompt, camera, since, until, status, request_hash):
+        conditions = []
+        params = []
+        if prompt:
+            if self.has_fts:
+                conditions.append("id IN (SELECT rowid FROM generations_fts WHERE generations_fts MATCH ?)")
+                # 每个词作为一个带引号的短语，避免FTS语法错误
+                params.append(" ".join('"' + word.replace('"', '""') + '"' for word in prompt.split()))
+            else:
+                for word in prompt.split():
+                    conditions.append("prompt LIKE ?")
+                    params.append(f"%{word}%")
+        if camera:
+            conditions.append("camera = ?")
+            params.append(camera)
+        if since is not None:
+            conditions.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created < ?")
+            params.append(until)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if request_hash:
+            conditions.append("request_hash = ?")
+            params.append(request_hash)
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+
+def open_history(output_dir):
+    """History index of an output directory"""
+    return GenerationHistory(os.path.join(output_dir, HISTORY_FILENAME))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="nano_banana_history", description="Query the Nano Banana generation history")
+    parser.add_argument("output_dir", help="NanoBanana output directory containing history.sqlite")
+    parser.add_argument("--prompt", help="Words that must appear in the prompt")
+    parser.add_argument("--camera", help="Camera name")
+    parser.add_argument("--since", help="First day, YYYY-MM-DD")
+    parser.add_argument("--until", help="Last day, YYYY-MM-DD")
+    parser.add_argument("--status", choices=(STATUS_PENDING, STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED))
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="Print full records as JSON lines")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.output_dir, HISTORY_FILENAME)):
+        print(f"没有找到历史记录: {os.path.join(args.output_dir, HISTORY_FILENAME)}")
+        return 2
+
+    records = open_history(args.output_dir).search(
+        prompt=args.prompt,
+        camera=args.camera,
+        since=parse_day(args.since) if args.since else None,
+        until=parse_day(args.until, end=True) if args.until else None,
+        status=args.status,
+        limit=args.limit,
+    )
+    for record in records:
+        if args.json:
+            print(json.dumps(record, ensure_ascii=False))
+        else:
+            created = datetime.fromtimestamp(record['created']).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"#{record['id']:<6} {created}  {record['status']:<7} {record['camera'] or '-':<16} "
+                  f"{record['output_path'] or record['error'] or ''}\n        {record['prompt'][:100]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+History browser support for Nano Banana Renderer
+
+历史面板按页显示 history.sqlite 中的记录。缩略图只在某一页真正显示时才
+生成：原图在主线程的定时器中临时加载、缩小后保存到输出目录下的
+.thumbnails/ 缓存，再立即删除；面板通过 bpy.utils.previews 只加载这些
+小图，不会把全分辨率结果留在 bpy.data.images 里。缓存超过大小上限时按
+最近使用时间(LRU)淘汰。
+"""
+
+import bpy
+import os
+import time
+import bpy.utils.previews
+
+from . import history
+from . import disk_writer
+
+PAGE_SIZE = 6
+THUMBNAIL_SIZE = 128
+CACHE_DIRNAME = ".thumbnails"
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# 内存中最多保留的预览数量，超过后整体清空（当前页会按需重新加载）
+MAX_PREVIEWS = PAGE_SIZE * 8
+
+# 每次定时器回调最多用于生成缩略图的时间(秒)
+TIMER_BUDGET = 0.05
+TIMER_INTERVAL = 0.1
+
+_previews = None
+_pending = []
+_failed = set()
+_page_cache = {}
+
+
+class ThumbnailCache:
+    """Small PNG thumbnails on disk, evicted least recently used first"""
+
+    def __init__(self, output_dir, max_bytes=CACHE_MAX_BYTES):
+        self.directory = os.path.join(output_dir, CACHE_DIRNAME)
+        self.max_bytes = max_bytes
+
+    def path_for(self, record_id):
+        return os.path.join(self.directory, f"{record_id}.png")
+
+    def get(self, record_id):
+        """Cached thumbnail path (marked as recently used) or None"""
+        path = self.path_for(record_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            # 修改时间作为最近使用时间（很多文件系统不更新atime）
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def create(self, record_id, source_path):
+        """Make the thumbnail of source_path; must run on the main thread"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(record_id)
+
+        image = bpy.data.images.load(source_path, check_existing=False)
+        try:
+            width, height = image.size
+            if width == 0 or height == 0:
+                raise ValueError(f"无法读取图像: {source_path}")
+            scale = THUMBNAIL_SIZE / max(width, height)
+            if scale < 1.0:
+                image.scale(max(1, round(width * scale)), max(1, round(height * scale)))
+            image.filepath_raw = path
+            image.file_format = 'PNG'
+            image.save()
+        finally:
+            bpy.data.images.remove(image)
+
+        self.evict()
+        return path
+
+    def evict(self):
+        """Delete least recently used thumbnails until the cache fits max_bytes"""
+        try:
+            entries = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            return
+
+        total = sum(size for _mtime, size, _path in entries)
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def load_page(output_dir, prompt_filter, page):
+    """(records, total) of one history page, cached until the index changes"""
+    path = os.path.join(output_dir, history.HISTORY_FILENAME)
+    if not os.path.exists(path):
+        return [], 0
+
+    key = (path, prompt_filter, page, os.path.getmtime(path))
+    cached = _page_cache.get(key)
+    if cached is None:
+        index = history.GenerationHistory(path)
+        filters = {'prompt': prompt_filter} if prompt_filter.strip() else {}
+        total = index.count(**filters)
+        records = index.search(limit=PAGE_SIZE, offset=page * PAGE_SIZE, **filters)
+        _page_cache.clear()
+        cached = _page_cache[key] = (records, total)
+    return cached
+
+
+def invalidate():
+    _page_cache.clear()
+
+
+def get_icon(output_dir, record):
+    """Icon id of a record's thumbnail, or 0 while it is not ready yet"""
+    source = record.get('output_path')
+    if not source or _previews is None:
+        return 0
+
+    cache = ThumbnailCache(output_dir)
+    key = cache.path_for(record['id'])
+    if key in _previews:
+        return _previews[key].icon_id
+
+    path = cache.get(record['id'])
+    if path:
+        if len(_previews) >= MAX_PREVIEWS:
+            _previews.clear()
+        return _previews.load(key, path, 'IMAGE').icon_id
+
+    # 排队在定时器中生成（只处理当前显示的记录）
+    request = (output_dir, record['id'], source)
+    if key not in _failed and request not in _pending:
+        _pending.append(request)
+        if not bpy.app.timers.is_registered(_process_pending):
+            bpy.app.timers.register(_process_pending, first_interval=TIMER_INTERVAL)
+    return 0
+
+
+def _process_pending():
+    """Timer: create queued thumbnails within a small time budget per call"""
+    start = time.time()
+    deferred = []
+    while _pending and time.time() - start < TIMER_BUDGET:
+        output_dir, record_id, source = _pending.pop(0)
+        cache = ThumbnailCache(output_dir)
+        if disk_writer.is_pending(source):
+            # 结果文件还在后台写入，稍后再试
+            deferred.append((output_dir, record_id, source))
+            continue
+        if not os.path.exists(source):
+            _failed.add(cache.path_for(record_id))
+            continue
+        try:
+            cache.create(record_id, source)
+        except Exception as e:
+            print(f"⚠️ 生成缩略图失败 #{record_id}: {e}")
+            _failed.add(cache.path_for(record_id))
+    _pending.extend(deferred)
+
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'PROPERTIES':
+                area.tag_redraw()
+
+    return TIMER_INTERVAL if _pending else None
+
+
+def register():
+    global _previews
+    _previews = bpy.utils.previews.new()
+
+
+def unregister():
+    global _previews
+    if bpy.app.timers.is_registered(_process_pending):
+        bpy.app.timers.unregister(_process_pending)
+    _pending.clear()
+    _failed.clear()
+    _page_cache.clear()
+    if _previews is not None:
+        bpy.utils.previews.remove(_previews)
+        _previews = None
@@ -0,0 +1,120 @@
+"""
+Image datablocks for Nano Banana Renderer
+
+插件创建的所有图像数据块都由这里管理，并通过自定义属性标记用途：
+
+- 每个名称就是一个固定的槽位，再次使用时复用同一个数据块（必要时调整
+  尺寸或重新加载文件），不会产生 .001/.002 副本；
+- 捕获图像、临时保存用的图像等中间结果在任务结束时立即释放；
+- 生成结果直接从内存中的编码字节加载：字节被打包(pack)进复用的数据块，
+  由Blender自己解码，不需要等待文件写入磁盘。
+
+memory_usage() 估算这些图像当前占用的内存，显示在面板中。
+"""
+
+import bpy
+
+RENDER_IMAGE_NAME = "NanoBanana_Render"
+IMPROVED_IMAGE_NAME = "NanoBanana_Improved_Render"
+HISTORY_IMAGE_NAME = "NanoBanana_History"
+
+ROLE_PROPERTY = "nano_banana_role"
+# 任务结束后释放
+ROLE_INTERMEDIATE = 'INTERMEDIATE'
+# 保留并复用（结果、历史查看）
+ROLE_RESULT = 'RESULT'
+
+
+def _tag(image, role):
+    image[ROLE_PROPERTY] = role
+    return image
+
+
+def acquire(name, width, height, role=ROLE_INTERMEDIATE):
+    """Generated image datablock `name` of the given size, reused when it exists"""
+    image = bpy.data.images.get(name)
+    if image is not None and image.source != 'GENERATED':
+        bpy.data.images.remove(image)
+        image = None
+
+    if image is None:
+        image = bpy.data.images.new(name, width, height)
+    elif tuple(image.size) != (width, height):
+        image.generated_width = width
+        image.generated_height = height
+    return _tag(image, role)
+
+
+def load_file(name, filepath, role=ROLE_INTERMEDIATE):
+    """Image datablock `name` showing the file at filepath, reused when it exists"""
+    image = bpy.data.images.get(name)
+    if image is not None and (image.source != 'FILE' or image.packed_file is not None):
+        bpy.data.images.remove(image)
+        image = None
+
+    if image is None:
+        image = bpy.data.images.load(filepath, check_existing=False)
+        image.name = name
+    else:
+        image.filepath = filepath
+        image.reload()
+    return _tag(image, role)
+
+
+def load_image_from_memory(name, data, filepath=None):
+    """Show encoded image bytes (PNG/JPEG) in the reused image datablock `name`
+
+    filepath is only recorded on the image (where the bytes are, or will
+    be, saved); nothing is read from or written to disk here.
+    """
+    image = bpy.data.images.get(name)
+    if image is None:
+        image = bpy.data.images.new(name, width=8, height=8)
+    elif image.packed_file is not None:
+        # 丢弃上一次打包的结果，数据块本身保留
+        image.unpack(method='REMOVE')
+
+    image.filepath_raw = filepath or f"//{name}.png"
+    image.pack(data=data, data_len=len(data))
+    image.source = 'FILE'
+    image.reload()
+
+    if image.size[0] == 0 or image.size[1] == 0:
+        raise RuntimeError("Blender无法解码图像数据")
+    return _tag(image, ROLE_RESULT)
+
+
+def managed_images(role=None):
+    """Images created by the add-on (optionally only one role)"""
+    return [
+        image for image in bpy.data.images
+        if ROLE_PROPERTY in image and (role is None or image[ROLE_PROPERTY] == role)
+    ]
+
+
+def release_intermediates():
+    """Free every intermediate image; call when a job ends"""
+    released = 0
+    for image in managed_images(ROLE_INTERMEDIATE):
+        bpy.data.images.remove(image)
+        released += 1
+    if released:
+        print(f"🧹 已释放 {released} 个中间图像")
+    return released
+
+
+def image_memory(image):
+    """Approximate bytes held by an image (decoded buffer plus packed data)"""
+    size = 0
+    if image.has_data:
+        width, height = image.size
+        size += width * height * image.channels * (4 if image.is_float else 1)
+    if image.packed_file is not None:
+        size += image.packed_file.size
+    return size
+
+
+def memory_usage():
+    """(image count, approximate bytes) of all add-on images"""
+    images = managed_images()
+    return len(images), sum(image_memory(image) for image in images)
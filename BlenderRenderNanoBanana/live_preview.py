@@ -0,0 +1,245 @@
+"""
+AI live preview for Nano Banana Renderer
+
+打开 AI Live Preview 后，场景或提示词变化时会自动重新生成。为了不耗尽
+API 配额：
+
+- 防抖：最后一次变化之后静止 live_debounce 秒才发送请求；
+- 丢弃过时任务：更新的状态到来时，还没开始的请求直接取消，已经发出的
+  请求返回后结果被丢弃；
+- 限流：任意 60 秒内最多 live_max_per_minute 个请求；
+- 草稿捕获：256x256、EEVEE 4 采样，捕获只需要很短时间。
+
+变化来自 depsgraph_update_post（对象变换/几何、材质、灯光、世界、
+摄像机）和提示词属性的 update 回调。草稿结果只显示在 NanoBanana_Live
+图像中，不写入输出目录和历史记录。
+"""
+
+import bpy
+import time
+import base64
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from bpy.app.handlers import persistent
+
+from . import batch
+from . import pipeline
+from . import delivery
+from . import image_pool
+from . import async_render
+
+LIVE_IMAGE_NAME = "NanoBanana_Live"
+
+DRAFT_RESOLUTION = 256
+DRAFT_SAMPLES = 4
+
+TICK_INTERVAL = 0.25
+RATE_WINDOW = 60.0
+MAX_IN_FLIGHT = 2
+
+# 草稿捕获本身会修改渲染设置，之后短时间内的更新不算场景变化
+CAPTURE_QUIET = 0.5
+
+# 会改变画面的数据块类型
+WATCHED_TYPES = (
+    bpy.types.Mesh, bpy.types.Material, bpy.types.Light, bpy.types.Camera, bpy.types.World, bpy.types.NodeTree,
+)
+
+_sessions = {}
+
+
+class LiveSession:
+    """Debounced, rate limited regeneration for one scene"""
+
+    def __init__(self, scene_name):
+        self.scene_name = scene_name
+        # 每次变化加一；请求记录发送时的版本
+        self.version = 0
+        self.changed_at = None
+        self.sent = deque()
+        self.in_flight = {}
+        self.shown = False
+        self.quiet_until = 0.0
+        self.status = None
+        self.executor = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix="NanoBananaLive")
+
+    def mark_changed(self):
+        self.version += 1
+        self.changed_at = time.time()
+        # 还没开始的旧请求不再需要
+        for future in self.in_flight.values():
+            future.cancel()
+
+    def requests_left(self, now, limit):
+        while self.sent and now - self.sent[0] > RATE_WINDOW:
+            self.sent.popleft()
+        return limit - len(self.sent)
+
+    def close(self):
+        for future in self.in_flight.values():
+            future.cancel()
+        self.in_flight.clear()
+        self.executor.shutdown(wait=False)
+
+    # -- timer -----------------------------------------------------------
+
+    def tick(self, scene):
+        props = scene.nano_banana
+        self.collect()
+
+        now = time.time()
+        left = self.requests_left(now, props.live_max_per_minute)
+        if self.changed_at is None:
+            status = "Live: up to date" if not self.in_flight else "Live: generating..."
+        elif now - self.changed_at < props.live_debounce:
+            status = "Live: waiting for changes to settle..."
+        elif left <= 0:
+            wait = RATE_WINDOW - (now - self.sent[0])
+            status = f"Live: request limit reached, next in {wait:.0f}s"
+        elif len(self.in_flight) >= MAX_IN_FLIGHT:
+            status = "Live: generating..."
+        else:
+            self.send(scene)
+            status = "Live: generating..."
+        self.set_status(f"{status} ({len(self.sent)}/{props.live_max_per_minute} per minute)")
+
+    def collect(self):
+        """Handle finished requests; results of outdated versions are dropped"""
+        for version, future in list(self.in_flight.items()):
+            if not future.done():
+                continue
+            del self.in_flight[version]
+            if future.cancelled():
+                continue
+            image_bytes, info = future.result()
+            if version != self.version:
+                print(f"⏭️ 丢弃过时的实时预览结果 (版本 {version}，当前 {self.version})")
+                continue
+            if image_bytes is None:
+                print(f"❌ 实时预览失败: {info['error']}")
+                continue
+            self.deliver(image_bytes, info)
+
+    def deliver(self, image_bytes, info):
+        show = not self.shown
+        self.shown = True
+
+        def apply():
+            image = image_pool.load_image_from_memory(LIVE_IMAGE_NAME, image_bytes)
+            if show:
+                async_render.show_result(image)
+
+        delivery.submit(('live', self.scene_name), apply, image_name=LIVE_IMAGE_NAME)
+        print(f"✨ 实时预览已更新 ({info['elapsed']:.1f}s)")
+
+    def send(self, scene):
+        props = scene.nano_banana
+        version = self.version
+        self.changed_at = None
+
+        self.quiet_until = time.time() + CAPTURE_QUIET
+        png_bytes = pipeline.capture_camera_png(scene, resolution=DRAFT_RESOLUTION, samples=DRAFT_SAMPLES)
+        self.quiet_until = time.time() + CAPTURE_QUIET
+        if png_bytes is None:
+            return
+
+        prompt = pipeline.build_image_generation_prompt(scene, props)
+        payload = pipeline.build_generation_payload(props, prompt, base64.b64encode(png_bytes).decode('utf-8'))
+        self.in_flight[version] = self.executor.submit(pipeline.generate_from_capture, props.api_key, payload)
+        self.sent.append(time.time())
+
+    def set_status(self, text):
+        # 只在文字变化时更新，避免每次定时器都重绘面板
+        if text != self.status:
+            self.status = text
+            batch.set_status(self.scene_name, text)
+
+
+def set_enabled(scene, enabled):
+    """Start or stop live preview for a scene"""
+    session = _sessions.pop(scene.name, None)
+    if session is not None:
+        session.close()
+        batch.set_status(scene.name, "Live preview stopped")
+    if not enabled:
+        return
+    if not scene.nano_banana.api_key:
+        print("❌ 实时预览需要API密钥")
+        batch.set_status(scene.name, "Live preview needs an API key")
+        return
+
+    session = LiveSession(scene.name)
+    _sessions[scene.name] = session
+    # 立即生成第一张预览
+    session.mark_changed()
+    session.changed_at -= scene.nano_banana.live_debounce
+    if not bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.register(_tick, first_interval=TICK_INTERVAL)
+    print(f"🔴 实时预览已开启: {scene.name}")
+
+
+def notify_change(scene):
+    """A setting that affects the generated image changed"""
+    session = _sessions.get(scene.name)
+    if session is not None:
+        session.mark_changed()
+
+
+def _tick():
+    """Timer: advance every live session"""
+    for scene_name, session in list(_sessions.items()):
+        scene = bpy.data.scenes.get(scene_name)
+        if scene is None:
+            _sessions.pop(scene_name).close()
+            continue
+        try:
+            session.tick(scene)
+        except Exception as e:
+            print(f"⚠️ 实时预览出错: {e}")
+    return TICK_INTERVAL if _sessions else None
+
+
+def _is_visual_update(update):
+    datablock = update.id
+    if isinstance(datablock, bpy.types.Object):
+        return update.is_updated_transform or update.is_updated_geometry
+    return isinstance(datablock, WATCHED_TYPES)
+
+
+@persistent
+def _on_depsgraph_update(scene, depsgraph):
+    session = _sessions.get(scene.name)
+    if session is None or time.time() < session.quiet_until:
+        return
+    if any(_is_visual_update(update) for update in depsgraph.updates):
+        session.mark_changed()
+
+
+@persistent
+def _on_load(*args):
+    for session in _sessions.values():
+        session.close()
+    _sessions.clear()
+    # 打开文件时不自动开始调用API
+    for scene in bpy.data.scenes:
+        if scene.nano_banana.live_preview:
+            scene.nano_banana.live_preview = False
+
+
+def register():
+    if _on_depsgraph_update not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(_on_depsgraph_update)
+    if _on_load not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(_on_load)
+
+
+def unregister():
+    if _on_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_on_depsgraph_update)
+    if _on_load in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_on_load)
+    if bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.unregister(_tick)
+    for session in _sessions.values():
+        session.close()
+    _sessions.clear()
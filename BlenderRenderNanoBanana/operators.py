@@ -9,11 +9,30 @@ import json
 import tempfile
 import time
 import base64
+from concurrent.futures import Future, ThreadPoolExecutor
 from bpy.types import Operator
 from bpy.props import StringProperty, BoolProperty
 from mathutils import Matrix
 import bpy_extras
 from .properties import load_api_key, get_nano_banana_output_dir
+from . import pipeline
+from . import batch
+from . import output_manager
+from . import disk_writer
+from . import history
+from . import history_browser
+from . import image_pool
+from . import retention
+from . import scene_summary
+from . import fix_plan
+from . import render_budget
+from . import analysis_stream
+from . import delivery
+from . import async_render
+from . import roi
+from . import tiles
+from . import panorama
+from . import progressive
 
 # 尝试导入requests，如果失败则使用占位符
 try:
@@ -23,6 +42,102 @@ except ImportError:
     REQUESTS_AVAILABLE = False
     print("Warning: requests library not available. Some features may not work.")
 
+# ================================
+# Analysis results (also finished from a timer after streaming)
+# ================================
+
+def complete_analysis(scene, plan_cache, fingerprint, result, info, report=None):
+    """Report, cache and save the result of an analysis; returns its text or None
+
+    result is the model's JSON text, or an already parsed analysis from the
+    cache. report is the running operator's report(), if there still is one.
+    """
+    if not result:
+        error_msg = f"AI分析失败: {info['error']}"
+        print(f"❌ {error_msg}")
+        if report:
+            report({'WARNING'}, error_msg)
+        return None
+    
+    props = scene.nano_banana
+    if info.get('cached'):
+        analysis = result
+    else:
+        print(f"✅ AI分析完成 ({info['elapsed']:.1f}s)，长度: {len(result)} 字符")
+        analysis = fix_plan.parse_analysis(result)
+        try:
+            plan_cache.put(fingerprint, analysis)
+        except OSError as e:
+            print(f"⚠️ 无法缓存分析结果: {e}")
+    props.last_analysis_fingerprint = fingerprint
+    
+    analysis_text = fix_plan.format_analysis(analysis)
+    pending = fix_plan.build_plan(analysis, scene)
+    print(f"🛠️ 修复计划: {len(pending)} 项修改尚未应用")
+    if report:
+        report({'INFO'}, f"修复计划: {len(pending)} 项修改尚未应用")
+    
+    if not info.get('cached'):
+        save_analysis_result(scene, analysis_text, report)
+    return analysis_text
+
+def analysis_payload(scene, image_data):
+    """Structured analysis request for a captured view (base64 PNG)"""
+    props = scene.nano_banana
+    scene_info = pipeline.get_scene_context(scene, props.scene_context_budget)
+    return pipeline.build_analysis_payload(props, scene_info, image_data, schema=fix_plan.ANALYSIS_SCHEMA)
+
+def start_streamed_analysis(scene, plan_cache, fingerprint, image_data):
+    """Send the analysis of a captured view; the answer streams into the NanoBanana_Analysis text"""
+    scene_name = scene.name
+    
+    def on_finish(result, info):
+        scene = bpy.data.scenes.get(scene_name)
+        if scene is None:
+            return None
+        return complete_analysis(scene, plan_cache, fingerprint, result, info)
+    
+    analysis_stream.start(scene.nano_banana.api_key, analysis_payload(scene, image_data), on_finish)
+
+def save_analysis_result(scene, analysis_text, report=None):
+    """Save AI analysis result to file"""
+    try:
+        from datetime import datetime
+        
+        output_dir = get_nano_banana_output_dir()
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        # 创建带时间戳的文件名
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"AI_Analysis_{timestamp}.md"
+        filepath = os.path.join(output_dir, filename)
+        
+        # 格式化分析结果
+        formatted_content = f"""# NanoBanana AI 渲染分析报告
+
+**生成时间:** {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+## AI 分析和建议
+
+{analysis_text}
+
+---
+*由 Blender NanoBanana 插件生成*
+"""
+        
+        # 后台写入，不阻塞界面
+        disk_writer.submit(filepath, formatted_content.encode('utf-8'), scene.nano_banana.fsync_outputs)
+        
+        print(f"✅ 分析结果已保存到: {filepath}")
+        if report:
+            report({'INFO'}, f"分析结果已保存: {filename}")
+        
+    except Exception as e:
+        print(f"保存分析结果失败: {e}")
+        if report:
+            report({'WARNING'}, f"保存分析结果失败: {e}")
+
 class NANOBANANA_OT_api_key_dialog(Operator):
     """API Key Input Dialog"""
     bl_idname = "nano_banana.api_key_dialog"
@@ -130,7 +245,7 @@ class NANOBANANA_OT_capture_viewport(bpy.types.Operator):
                 print(f"✅ 获取到渲染结果: {render_result.name}, 尺寸: {render_result.size}")
                 
                 # 创建副本
-                test_image = bpy.data.images.new("Viewport_Test", 512, 512)
+                test_image = image_pool.acquire("Viewport_Test", 512, 512)
                 test_image.pixels = list(render_result.pixels)
                 
                 # 在图像编辑器中显示
@@ -214,8 +329,24 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
             
             print(f"使用摄像机: {context.scene.camera.name}")
             
+            # 场景没有变化时，分析直接来自缓存，不需要捕获也不调用API
+            if props.ai_service == 'ANALYSIS':
+                cached = self.cached_analysis(context)
+                if cached is not None:
+                    self.display_result(context, self.finish_analysis(context, cached, {'cached': True}))
+                    self.report({'INFO'}, "AI analysis loaded from cache (scene unchanged)")
+                    return {'FINISHED'}
+            
+            # 非阻塞捕获：显示渐进式渲染，渲染完成后由处理函数继续
+            # 渐进预览：预览和完整请求同时在后台进行
+            progressive_run = props.progressive_preview and props.ai_service != 'ANALYSIS'
+            if (props.non_blocking_capture or progressive_run) and not bpy.app.background:
+                return self.start_non_blocking(context)
+            
             # 直接使用标准渲染API
+            capture_start = time.time()
             viewport_image = self.capture_viewport(context)
+            self._capture_seconds = time.time() - capture_start
             
             if not viewport_image:
                 print("❌ 视口捕获失败")
@@ -232,7 +363,25 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
             print(f"渲染完成: {render_result.name}, 尺寸: {render_result.size}")
             self.report({'INFO'}, f"Render completed: {render_result.name}")
             
-            # Generate AI render
+            if props.ai_service == 'ANALYSIS':
+                print("步骤2: 调用Gemini API分析场景...")
+                self.report({'INFO'}, "Step 2: Analyzing scene with Gemini...")
+                
+                analysis = self.run_analysis(context, render_result)
+                if not analysis:
+                    self.report({'ERROR'}, "AI analysis failed - check console for details")
+                    return {'CANCELLED'}
+                
+                if analysis is True:
+                    self.report({'INFO'}, f"AI analysis is streaming into the '{analysis_stream.TEXT_NAME}' text")
+                    return {'FINISHED'}
+                
+                self.display_result(context, analysis)
+                print("=== AI分析完成！===")
+                self.report({'INFO'}, "AI analysis completed successfully!")
+                return {'FINISHED'}
+            
+            # Generate AI render (BOTH: the analysis runs concurrently)
             print("步骤2: 调用Gemini API生成AI渲染...")
             self.report({'INFO'}, "Step 2: Generating AI render with Gemini...")
             
@@ -242,9 +391,15 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
                 self.report({'INFO'}, "Step 3: Displaying AI generated result...")
                 
                 self.display_result(context, result_image)
+                if self._analysis_text:
+                    self.display_result(context, self._analysis_text)
                 print("=== AI渲染完成！===")
                 self.report({'INFO'}, "AI render completed successfully!")
                 return {'FINISHED'}
+            elif self._analysis_text:
+                self.display_result(context, self._analysis_text)
+                self.report({'WARNING'}, "AI analysis completed, but image generation failed - check console for details")
+                return {'FINISHED'}
             else:
                 print("错误：AI渲染生成失败")
                 self.report({'ERROR'}, "AI render generation failed - check console for details")
@@ -254,6 +409,61 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
             print(f"渲染过程出错: {e}")
             self.report({'ERROR'}, f"Render error: {str(e)}")
             return {'CANCELLED'}
+            
+        finally:
+            # 任务结束：释放捕获图像等中间结果
+            image_pool.release_intermediates()
+    
+    def start_non_blocking(self, context):
+        """Capture (with the progressive render window when non-blocking) and continue from timers"""
+        props = context.scene.nano_banana
+        service = props.ai_service
+        scene_name = context.scene.name
+        use_progressive = props.progressive_preview
+        
+        cached = None
+        plan_cache = fingerprint = None
+        if service in {'ANALYSIS', 'BOTH'}:
+            cached = self.cached_analysis(context)
+            plan_cache, fingerprint = self._plan_cache, self._analysis_fingerprint
+        
+        # 渲染完成时操作符早已结束：回调中不能再使用 self
+        def on_captured(png_bytes, capture_seconds):
+            scene = bpy.data.scenes.get(scene_name)
+            if scene is None:
+                return
+            if png_bytes is None:
+                batch.set_status(scene_name, "Capture cancelled")
+                return
+            
+            if service in {'ANALYSIS', 'BOTH'}:
+                if cached is not None:
+                    analysis_stream.show_text(complete_analysis(scene, plan_cache, fingerprint, cached, {'cached': True}))
+                else:
+                    start_streamed_analysis(scene, plan_cache, fingerprint, base64.b64encode(png_bytes).decode('utf-8'))
+            if service == 'ANALYSIS':
+                return
+            if use_progressive:
+                progressive.start(scene, png_bytes, capture_seconds)
+            else:
+                async_render.AsyncGeneration(scene, png_bytes, capture_seconds).start()
+        
+        if not props.non_blocking_capture:
+            capture_start = time.time()
+            png_bytes = pipeline.capture_camera_png(context.scene)
+            if png_bytes is None:
+                self.report({'ERROR'}, "Failed to capture viewport")
+                return {'CANCELLED'}
+            on_captured(png_bytes, time.time() - capture_start)
+            self.report({'INFO'}, "Preview and full render requested; the preview is shown as soon as it arrives")
+            return {'FINISHED'}
+        
+        if not async_render.start_capture(context, on_captured):
+            self.report({'ERROR'}, "Could not start the capture render (is another render running?)")
+            return {'CANCELLED'}
+        
+        self.report({'INFO'}, "Rendering capture... the AI request starts as soon as the render completes")
+        return {'FINISHED'}
     
     def capture_viewport(self, context):
         """详细调试的摄像机视口捕获 - 界面显示版本"""
@@ -292,20 +502,14 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
         # 步骤3: 检查场景内容
         print("步骤3: 检查场景内容...")
         self.report({'INFO'}, "步骤3: 检查场景内容...")
-        all_objects = list(scene.objects)
-        meshes = [obj for obj in all_objects if obj.type == 'MESH']
-        lights = [obj for obj in all_objects if obj.type == 'LIGHT']
-        cameras = [obj for obj in all_objects if obj.type == 'CAMERA']
-        
-        scene_info = f"总对象: {len(all_objects)}, 网格: {len(meshes)}, 灯光: {len(lights)}, 摄像机: {len(cameras)}"
+        # 场景统计由 scene_summary 增量维护，不再遍历所有对象
+        summary = scene_summary.summary_for(scene)
+        counts = summary.type_counts
+        scene_info = (f"总对象: {len(summary.entries)}, 网格: {counts['MESH']}, "
+                      f"灯光: {counts['LIGHT']}, 摄像机: {counts['CAMERA']}, 视野内: {len(summary.in_view)}")
         print(f"   {scene_info}")
         self.report({'INFO'}, scene_info)
         
-        for i, mesh in enumerate(meshes[:3]):  # 只显示前3个
-            mesh_info = f"网格 {i+1}: {mesh.name} (可见: {mesh.visible_get()})"
-            print(f"   {mesh_info}")
-            self.report({'INFO'}, mesh_info)
-        
         # 步骤4: 保存原始设置
         print("步骤4: 保存原始渲染设置...")
         self.report({'INFO'}, "步骤4: 保存原始渲染设置...")
@@ -461,8 +665,7 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
                     self.report({'INFO'}, file_info)
                     
                     # 加载图像并保存临时文件路径
-                    viewport_image = bpy.data.images.load(temp_file)
-                    viewport_image.name = "Camera_Capture_FromFile"
+                    viewport_image = image_pool.load_file("Camera_Capture_FromFile", temp_file)
                     
                     # 重要：保存临时文件路径到图像的自定义属性
                     viewport_image["temp_file_path"] = temp_file
@@ -500,7 +703,7 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
                     width, height = render_result.size
                     if width > 0 and height > 0:
                         # 创建新图像
-                        viewport_image = bpy.data.images.new("Camera_Capture_Manual", width, height)
+                        viewport_image = image_pool.acquire("Camera_Capture_Manual", width, height)
                         
                         # 尝试直接访问像素
                         if hasattr(render_result, 'pixels') and render_result.pixels is not None:
@@ -537,19 +740,18 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
                 self.report({'INFO'}, "最后手段: 创建智能回退图像...")
                 
                 width, height = 512, 512
-                viewport_image = bpy.data.images.new("Camera_Capture_Fallback", width, height)
+                viewport_image = image_pool.acquire("Camera_Capture_Fallback", width, height)
                 
                 # 获取场景信息来创建有意义的图像
-                meshes = [obj for obj in scene.objects if obj.type == 'MESH' and obj.visible_get()]
-                lights = [obj for obj in scene.objects if obj.type == 'LIGHT']
+                counts = scene_summary.summary_for(scene).type_counts
                 
                 # 创建基于场景内容的图像
                 pixels = []
                 for y in range(height):
                     for x in range(width):
                         # 基于场景内容创建模式
-                        mesh_factor = min(len(meshes) / 5.0, 1.0)
-                        light_factor = min(len(lights) / 3.0, 1.0)
+                        mesh_factor = min(counts['MESH'] / 5.0, 1.0)
+                        light_factor = min(counts['LIGHT'] / 3.0, 1.0)
                         
                         # 创建渐变和图案
                         r = 0.4 + mesh_factor * 0.4 + (x / width) * 0.2
@@ -562,7 +764,7 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
                 viewport_image.pixels = pixels
                 viewport_image.update()
                 
-                scene_info = f"场景包含: {len(meshes)} 个网格, {len(lights)} 个灯光"
+                scene_info = f"场景包含: {counts['MESH']} 个网格, {counts['LIGHT']} 个灯光"
                 fallback_info = f"✅ 回退图像创建成功"
                 print(f"   {fallback_info}")
                 print(f"   {scene_info}")
@@ -589,7 +791,7 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
             print(f"   {size_info}")
             self.report({'INFO'}, size_info)
             
-            viewport_image = bpy.data.images.new("Camera_Capture_Debug", width, height)
+            viewport_image = image_pool.acquire("Camera_Capture_Debug", width, height)
             created_info = f"创建了新图像: {viewport_image.name}"
             print(f"   {created_info}")
             self.report({'INFO'}, created_info)
@@ -635,15 +837,13 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
             height = 1024
             image_name = "Scene_Representation"
             
-            if image_name in bpy.data.images:
-                bpy.data.images.remove(bpy.data.images[image_name])
-            
-            image = bpy.data.images.new(image_name, width, height)
+            image = image_pool.acquire(image_name, width, height)
             
             # 基于场景中的对象创建简单的可视化
             scene = context.scene
-            mesh_count = len([obj for obj in scene.objects if obj.type == 'MESH'])
-            light_count = len([obj for obj in scene.objects if obj.type == 'LIGHT'])
+            counts = scene_summary.summary_for(scene).type_counts
+            mesh_count = counts['MESH']
+            light_count = counts['LIGHT']
             
             # 创建基于场景内容的颜色模式
             pixels = []
@@ -675,10 +875,7 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
             
             # 创建新图像
             image_name = "Viewport_Capture"
-            if image_name in bpy.data.images:
-                bpy.data.images.remove(bpy.data.images[image_name])
-            
-            image = bpy.data.images.new(image_name, width, height)
+            image = image_pool.acquire(image_name, width, height)
             
             # 这里应该实现实际的截图功能
             # 由于Blender API限制，我们创建一个基本图像
@@ -702,10 +899,7 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
             height = 512
             image_name = "Test_Viewport"
             
-            if image_name in bpy.data.images:
-                bpy.data.images.remove(bpy.data.images[image_name])
-            
-            image = bpy.data.images.new(image_name, width, height)
+            image = image_pool.acquire(image_name, width, height)
             
             # 创建一个简单的测试图案
             pixels = []
@@ -729,15 +923,22 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
     def generate_ai_render(self, context, viewport_image):
         """Generate AI render using Gemini 2.5 Flash Image model"""
         props = context.scene.nano_banana
+        self._history = None
+        self._history_id = None
+        self._history_record = {'status': history.STATUS_FAILED}
+        self._analysis_text = None
+        analysis_future = None
         
         try:
             print("=== 开始AI渲染生成 ===")
             self.report({'INFO'}, "=== 开始AI渲染生成 ===")
             
-            # 步骤1: 保存输入图像用于调试
-            print("步骤1: 保存输入图像用于调试...")
-            self.report({'INFO'}, "步骤1: 保存输入图像...")
-            self.save_input_image(viewport_image)
+            # 历史记录的id同时用作文件编号
+            output_dir = get_nano_banana_output_dir(context)
+            record_id = self.begin_history(context, output_dir)
+            
+            # 本次生成的所有产物只写入一次
+            self._output_job = output_manager.OutputJob(output_dir, props.save_artifacts, props.fsync_outputs, name_id=record_id)
             
             # 步骤2: 转换图像为base64
             print("步骤2: 转换图像为base64...")
@@ -747,6 +948,7 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
                 error_msg = "无法保存临时图像文件"
                 print(f"❌ {error_msg}")
                 self.report({'ERROR'}, error_msg)
+                self._history_record['error'] = error_msg
                 return None
             
             print(f"临时文件路径: {temp_path}")
@@ -761,10 +963,14 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
                 print(f"文件大小: {file_size} bytes, Base64大小: {base64_size} 字符")
                 self.report({'INFO'}, f"文件大小: {file_size} bytes")
                 
+                # 保存输入图像（捕获时的原始PNG字节，不再重新编码）
+                self._output_job.write_bytes(output_manager.ARTIFACT_INPUT, image_bytes)
+                
             except Exception as e:
                 error_msg = f"读取图像文件失败: {e}"
                 print(f"❌ {error_msg}")
                 self.report({'ERROR'}, error_msg)
+                self._history_record['error'] = error_msg
                 return None
             
             # 步骤3: 构建提示词
@@ -779,132 +985,80 @@ class NANOBANANA_OT_render_viewport(bpy.types.Operator):
             self.report({'INFO'}, "步骤4: 准备Gemini API请求...")
             
             # 使用正确的 Gemini 2.5 Flash Image 模型进行图像生成
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image:generateContent?key={props.api_key}"
+            payload = pipeline.build_generation_payload(props, full_prompt, image_data)
+            self._history_record['prompt'] = full_prompt
+            self._history_record['request_hash'] = history.request_hash(payload)
             
-            payload = {
-                "contents": [{
-                    "parts": [
-                        {
-                            "text": f"""Based on this 3D viewport image, generate a new enhanced image. 
-
-User prompt: {full_prompt}
-
-Please transform this 3D scene into: {props.image_prompt if props.image_prompt.strip() else props.prompt}
-
-Style: {props.style_prompt}
-
-Generate a photorealistic image that transforms the reference viewport into the requested style while maintaining the basic composition and camera angle."""
-                        },
-                        {
-                            "inline_data": {
-                                "mime_type": "image/png",
-                                "data": image_data
-                            }
-                        }
-                    ]
-                }],
-                "generationConfig": {
-                    "response_modalities": ["Image"],
-                    "temperature": 0.8,
-                    "candidateCount": 1,
-                    "maxOutputTokens": 8192
-                },
-                "systemInstruction": {
-                    "parts": [{
-                        "text": "You are an expert image generation AI. When given a 3D viewport reference image and a text prompt, generate a new enhanced image that transforms the scene according to the prompt. Always return actual image data, not just descriptions."
-                    }]
-                }
-            }
-            
-            # Add aspect ratio configuration if not default
-            if props.aspect_ratio != '1:1':
-                if "image_config" not in payload["generationConfig"]:
-                    payload["generationConfig"]["image_config"] = {}
-                payload["generationConfig"]["image_config"]["aspect_ratio"] = props.aspect_ratio
-            
-            headers = {
-                'Content-Type': 'application/json',
-            }
-            
-            print(f"API URL: {url[:80]}...")
             self.report({'INFO'}, "API请求准备完成")
             
+            # BOTH: 分析请求使用同一张捕获图像（同一份base64），与生成请求同时进行
+            if props.ai_service == 'BOTH':
+                analysis_future = self.start_analysis(context, image_data)
+            
             # 步骤5: 发送API请求
             print("步骤5: 发送API请求...")
             self.report({'INFO'}, "步骤5: 发送API请求...")
             
-            try:
-                response = requests.post(url, headers=headers, json=payload, timeout=120)
-                
-                status_info = f"API响应状态码: {response.status_code}"
-                print(status_info)
-                self.report({'INFO'}, status_info)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    response_info = f"API响应成功，数据长度: {len(str(result))} 字符"
-                    print(response_info)
-                    self.report({'INFO'}, response_info)
-                    
-                    # 步骤6: 处理API响应
-                    print("步骤6: 处理API响应...")
-                    self.report({'INFO'}, "步骤6: 处理API响应...")
-                    
-                    generated_image = self.process_gemini_image_response(result)
-                    if generated_image:
-                        success_info = "✅ 成功从API响应中提取生成的图像"
-                        print(success_info)
-                        self.report({'INFO'}, success_info)
-                        
-                        # 保存生成的图像到输出目录
-                        self.save_generated_image(context, generated_image)
-                        
-                        # 🎉 显示完成信息
-                        completion_msg = "🎉 AI图像生成完成！图像已自动显示"
-                        print(completion_msg)
-                        self.report({'INFO'}, completion_msg)
-                        
-                        return generated_image
-                    else:
-                        print("API响应中没有图像数据")
-                        self.report({'WARNING'}, "API响应中没有图像数据")
-                        
-                        # 如果没有图像，至少保存响应文本用于调试
-                        self.save_debug_response(context, result)
-                        return None
-                else:
-                    error_text = response.text[:500] if response.text else "无响应内容"
-                    error_msg = f"Gemini API错误: {response.status_code} - {error_text}"
-                    print(f"❌ {error_msg}")
-                    self.report({'ERROR'}, f"API错误: {response.status_code}")
-                    return None
-                    
-            except requests.exceptions.Timeout:
-                error_msg = "API请求超时（120秒）"
+            request_start = time.time()
+            result, error_msg = pipeline.request_generation(props.api_key, payload)
+            self._history_record['generate_seconds'] = time.time() - request_start
+            if result is None:
                 print(f"❌ {error_msg}")
                 self.report({'ERROR'}, error_msg)
+                self._history_record['error'] = error_msg
                 return None
-            except requests.exceptions.ConnectionError:
-                error_msg = "网络连接错误"
-                print(f"❌ {error_msg}")
-                self.report({'ERROR'}, error_msg)
-                return None
-            except Exception as api_error:
-                error_msg = f"API请求失败: {api_error}"
-                print(f"❌ {error_msg}")
-                self.report({'ERROR'}, error_msg)
+            
+            response_info = f"API响应成功，数据长度: {len(str(result))} 字符"
+            print(response_info)
+            self.report({'INFO'}, response_info)
+            
+            # 步骤6: 处理API响应
+            print("步骤6: 处理API响应...")
+            self.report({'INFO'}, "步骤6: 处理API响应...")
+            
+            generated_image = self.process_gemini_image_response(result)
+            if generated_image:
+                success_info = "✅ 成功从API响应中提取生成的图像"
+                print(success_info)
+                self.report({'INFO'}, success_info)
+                
+                # 生成的图像在加载时已经保存（原始字节，只写一次）
+                self._history_record['status'] = history.STATUS_DONE
+                if props.debug_level != 'ERRORS':
+                    self.save_debug_response(context, result)
+                self.report_output_job()
+                
+                # 🎉 显示完成信息
+                completion_msg = "🎉 AI图像生成完成！图像已自动显示"
+                print(completion_msg)
+                self.report({'INFO'}, completion_msg)
+                
+                return generated_image
+            else:
+                print("API响应中没有图像数据")
+                self.report({'WARNING'}, "API响应中没有图像数据")
+                
+                # 如果没有图像，至少保存响应文本用于调试
+                self._history_record['error'] = "API响应中没有图像数据"
+                self.save_debug_response(context, result)
+                self.report_output_job()
                 return None
                 
         except Exception as e:
             error_msg = f"AI渲染生成过程出错: {e}"
             print(f"❌ {error_msg}")
             self.report({'ERROR'}, error_msg)
+            self._history_record['error'] = error_msg
             import traceback
             print("详细错误信息:")
             traceback.print_exc()
             return None
             
         finally:
+            if analysis_future is not None:
+                self._analysis_text = self.finish_analysis(context, *analysis_future.result())
+            self.finish_history()
+            
             # 清理临时文件
             try:
                 if 'temp_path' in locals() and temp_path and os.path.exists(temp_path):
@@ -978,15 +1132,15 @@ Generate a photorealistic image that transforms the reference viewport into the
                     
                     print(f"像素数据长度: {len(pixels)}")
                     
-                    # 创建临时图像并保存
-                    temp_image = bpy.data.images.new("temp_for_ai_save", width, height)
-                    temp_image.pixels = pixels
-                    temp_image.file_format = 'PNG'
-                    temp_image.filepath_raw = temp_path
-                    temp_image.save()
-                    
-                    # 清理临时图像
-                    bpy.data.images.remove(temp_image)
+                    # 创建临时图像并保存（失败时也立即清理）
+                    temp_image = image_pool.acquire("temp_for_ai_save", width, height)
+                    try:
+                        temp_image.pixels = pixels
+                        temp_image.file_format = 'PNG'
+                        temp_image.filepath_raw = temp_path
+                        temp_image.save()
+                    finally:
+                        bpy.data.images.remove(temp_image)
                     
                     if os.path.exists(temp_path):
                         size = os.path.getsize(temp_path)
@@ -1031,106 +1185,87 @@ Generate a photorealistic image that transforms the reference viewport into the
     
     def build_image_generation_prompt(self, context, props):
         """Build comprehensive prompt for AI image generation with enhanced templates"""
-        # 1. Get main prompt
-        main_prompt = props.image_prompt.strip() if props.image_prompt.strip() else props.prompt.strip()
-        if not main_prompt:
-            main_prompt = "generate a high quality image"
-        
-        # 2. Apply prompt style templates
-        enhanced_prompt = self.apply_prompt_template(main_prompt, props)
-        
-        # 3. Add lighting and camera details
-        enhanced_prompt = self.add_technical_details(enhanced_prompt, props)
-        
-        # 4. Add scene context if enabled
-        if props.include_scene_context:
-            scene_info = self.get_scene_context(context)
-            enhanced_prompt += f" | Scene context: {scene_info}"
-        
-        # 5. Add quality specifications
-        quality_specs = {
-            'LOW': "quick generation, basic quality",
-            'MEDIUM': "balanced quality and detail, photorealistic",
-            'HIGH': "high quality, ultra-detailed, professional photography, 8K resolution"
-        }
-        
-        if props.quality in quality_specs:
-            enhanced_prompt += f" | Quality: {quality_specs[props.quality]}"
-        
-        # 6. Add aspect ratio hint
-        aspect_descriptions = {
-            '1:1': "square composition",
-            '2:3': "vertical portrait composition", 
-            '3:2': "horizontal landscape composition",
-            '3:4': "portrait orientation",
-            '4:3': "landscape orientation",
-            '4:5': "portrait format",
-            '5:4': "landscape format",
-            '9:16': "vertical mobile format",
-            '16:9': "widescreen cinematic format",
-            '21:9': "ultra-wide cinematic format"
-        }
-        
-        if props.aspect_ratio in aspect_descriptions:
-            enhanced_prompt += f" | Composition: {aspect_descriptions[props.aspect_ratio]}"
-        
-        return enhanced_prompt
+        return pipeline.build_image_generation_prompt(context.scene, props)
     
     def apply_prompt_template(self, main_prompt, props):
         """Apply style-specific prompt templates"""
-        if props.prompt_style == 'PHOTOREALISTIC':
-            return f"A photorealistic scene of {main_prompt}, captured with professional camera equipment, emphasizing natural lighting and fine details"
+        return pipeline.apply_prompt_template(main_prompt, props)
+    
+    def add_technical_details(self, prompt, props):
+        """Add lighting and camera angle details to prompt"""
+        return pipeline.add_technical_details(prompt, props)
+    
+    def cached_analysis(self, context):
+        """Analysis of an unchanged scene from the fix plan cache, or None"""
+        props = context.scene.nano_banana
+        self._analysis_fingerprint = fix_plan.scene_fingerprint(context.scene, props)
+        self._plan_cache = fix_plan.PlanCache(get_nano_banana_output_dir(context))
+        analysis = self._plan_cache.get(self._analysis_fingerprint)
+        if analysis is not None:
+            print("♻️ 场景没有变化，使用缓存的分析结果（不调用API）")
+        return analysis
+    
+    def start_analysis(self, context, image_data):
+        """Send the analysis request on a worker thread; returns its future"""
+        cached = self.cached_analysis(context)
+        if cached is not None:
+            future = Future()
+            future.set_result((cached, {'elapsed': 0.0, 'error': None, 'response': None, 'cached': True}))
+            return future
         
-        elif props.prompt_style == 'ARTISTIC':
-            return f"A stylized artistic illustration of {main_prompt}, featuring creative interpretation and enhanced visual appeal"
+        props = context.scene.nano_banana
+        payload = analysis_payload(context.scene, image_data)
         
-        elif props.prompt_style == 'PRODUCT':
-            return f"A high-resolution, studio-lit product photograph of {main_prompt}, with clean background and professional lighting setup to showcase key features"
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="NanoBananaAnalysis")
+        future = executor.submit(pipeline.analyze_capture, props.api_key, payload)
+        # 不等待：线程在请求结束后自行退出
+        executor.shutdown(wait=False)
+        print("🔍 分析请求已并行发送")
+        return future
+    
+    def finish_analysis(self, context, result, info):
+        """Report, cache and save the result of an analysis; returns its text or None
+
+        result is the model's JSON text, or an already parsed analysis from the cache.
+        """
+        return complete_analysis(
+            context.scene, self._plan_cache, self._analysis_fingerprint, result, info, self.report
+        )
+    
+    def run_analysis(self, context, viewport_image):
+        """Analyze the captured view only (ai_service ANALYSIS)
+
+        The answer streams into the NanoBanana_Analysis text and is saved
+        once complete; returns True when the request is under way. Without
+        a UI (timers do not run) the analysis runs synchronously and its
+        text is returned instead. cached_analysis() must have been called
+        first (it sets the fingerprint).
+        """
+        props = context.scene.nano_banana
+        temp_path = self.save_temp_image(viewport_image)
+        if not temp_path:
+            self.report({'ERROR'}, "无法保存临时图像文件")
+            return None
         
-        elif props.prompt_style == 'MINIMALIST':
-            return f"A minimalist composition featuring {main_prompt}, with significant negative space, clean lines, and subtle lighting"
+        try:
+            with open(temp_path, 'rb') as f:
+                image_data = base64.b64encode(f.read()).decode('utf-8')
+        except OSError as e:
+            self.report({'ERROR'}, f"读取图像文件失败: {e}")
+            return None
+        finally:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
         
-        elif props.prompt_style == 'COMIC':
-            return f"A comic book style panel showing {main_prompt}, with bold lines, dynamic composition and vivid colors"
+        if bpy.app.background:
+            payload = analysis_payload(context.scene, image_data)
+            return self.finish_analysis(context, *pipeline.analyze_capture(props.api_key, payload))
         
-        else:  # CUSTOM
-            return main_prompt
-    
-    def add_technical_details(self, prompt, props):
-        """Add lighting and camera angle details to prompt"""
-        technical_parts = [prompt]
-        
-        # Add lighting style
-        if props.lighting_style != 'AUTO':
-            lighting_descriptions = {
-                'NATURAL': "natural sunlight, soft daylight illumination",
-                'STUDIO': "professional studio lighting, three-point lighting setup",
-                'CINEMATIC': "dramatic cinematic lighting with strong contrast",
-                'GOLDEN_HOUR': "warm golden hour lighting, soft sunset glow",
-                'BLUE_HOUR': "cool blue hour atmosphere, twilight ambiance",
-                'LOW_KEY': "low key lighting, dramatic shadows and highlights",
-                'HIGH_KEY': "high key lighting, bright and evenly illuminated"
-            }
-            
-            if props.lighting_style in lighting_descriptions:
-                technical_parts.append(f"Lighting: {lighting_descriptions[props.lighting_style]}")
-        
-        # Add camera angle
-        if props.camera_angle != 'AUTO':
-            angle_descriptions = {
-                'EYE_LEVEL': "eye-level perspective, natural human viewpoint",
-                'LOW_ANGLE': "low angle shot, looking up from below",
-                'HIGH_ANGLE': "high angle shot, looking down from above", 
-                'BIRDS_EYE': "bird's eye view, top-down aerial perspective",
-                'WORMS_EYE': "worm's eye view, extreme low angle upward",
-                'CLOSE_UP': "close-up shot, detailed macro perspective",
-                'WIDE_SHOT': "wide shot, expansive environmental view"
-            }
-            
-            if props.camera_angle in angle_descriptions:
-                technical_parts.append(f"Camera: {angle_descriptions[props.camera_angle]}")
-        
-        return " | ".join(technical_parts)
+        # 操作符结束后才会收到完整结果：回调中不能再使用 self
+        start_streamed_analysis(context.scene, self._plan_cache, self._analysis_fingerprint, image_data)
+        return True
     
     def process_gemini_analysis_response(self, response):
         """Process Gemini analysis response and extract rendering advice"""
@@ -1158,185 +1293,89 @@ Generate a photorealistic image that transforms the reference viewport into the
             traceback.print_exc()
             return None
     
-    def save_analysis_result(self, context, analysis_text):
-        """Save AI analysis result to file"""
-        try:
-            from .properties import get_nano_banana_output_dir
-            import os
-            from datetime import datetime
-            
-            output_dir = get_nano_banana_output_dir(context)
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
-            # 创建带时间戳的文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"AI_Analysis_{timestamp}.md"
-            filepath = os.path.join(output_dir, filename)
-            
-            # 格式化分析结果
-            formatted_content = f"""# NanoBanana AI 渲染分析报告
-
-**生成时间:** {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-
-## AI 分析和建议
-
-{analysis_text}
-
----
-*由 Blender NanoBanana 插件生成*
-"""
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(formatted_content)
-            
-            print(f"✅ 分析结果已保存到: {filepath}")
-            self.report({'INFO'}, f"分析结果已保存: {filename}")
-            
-        except Exception as e:
-            print(f"保存分析结果失败: {e}")
-            self.report({'WARNING'}, f"保存分析结果失败: {e}")
+    def save_debug_response(self, context, response_data):
+        """Save API response for debugging"""
+        job = getattr(self, '_output_job', None)
+        if job is None:
+            job = output_manager.OutputJob(get_nano_banana_output_dir(context), {output_manager.ARTIFACT_DEBUG})
+        
+        store_payloads = context.scene.nano_banana.debug_level == 'PAYLOADS'
+        filepath = job.write_debug(response_data, store_payloads=store_payloads)
+        if filepath:
+            print(f"✅ 调试响应已保存到: {filepath}")
+            self.report({'INFO'}, f"调试响应已保存: {os.path.basename(filepath)}")
     
-    def save_generated_image(self, context, blender_image):
-        """Save generated image to output directory with version control"""
+    def begin_history(self, context, output_dir):
+        """Open this generation's history record; returns its id or None"""
+        scene = context.scene
         try:
-            from .properties import get_nano_banana_output_dir
-            import os
-            from datetime import datetime
-            
-            output_dir = get_nano_banana_output_dir(context)
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
-            # 创建带版本控制的文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_filename = f"Generated_Image_{timestamp}"
-            
-            # 检查是否存在同名文件，添加版本后缀
-            version = 1
-            filename = f"{base_filename}.png"
-            filepath = os.path.join(output_dir, filename)
-            
-            while os.path.exists(filepath):
-                filename = f"{base_filename}.{version:03d}.png"
-                filepath = os.path.join(output_dir, filename)
-                version += 1
-            
-            # 保存Blender图像到文件
-            blender_image.save_render(filepath)
-            
-            print(f"✅ 生成的图像已保存到: {filepath}")
-            self.report({'INFO'}, f"生成图像已保存: {filename}")
-            
+            self._history = history.open_history(output_dir)
+            self._history_id = self._history.begin(
+                blend=bpy.data.filepath,
+                scene=scene.name,
+                camera=scene.camera.name if scene.camera else None,
+                frame=scene.frame_current,
+                source='viewport',
+                settings=history.settings_snapshot(scene.nano_banana),
+                capture_seconds=getattr(self, '_capture_seconds', None),
+            )
         except Exception as e:
-            print(f"保存生成图像失败: {e}")
-            self.report({'WARNING'}, f"保存生成图像失败: {e}")
+            print(f"⚠️ 历史记录不可用: {e}")
+            self._history = None
+        return self._history_id
     
-    def save_debug_response(self, context, response_data):
-        """Save API response for debugging"""
+    def finish_history(self):
+        """Store status, paths, timings and bytes of this generation"""
+        if self._history is None or self._history_id is None:
+            return
+        record = dict(self._history_record)
+        job = getattr(self, '_output_job', None)
+        if job is not None:
+            record['input_path'] = job.files.get(output_manager.ARTIFACT_INPUT)
+            record['output_path'] = job.files.get(output_manager.ARTIFACT_RESULT)
+            record['debug_path'] = job.files.get(output_manager.ARTIFACT_DEBUG)
+            record['bytes_written'] = job.bytes_written
         try:
-            from .properties import get_nano_banana_output_dir
-            import json
-            import os
-            from datetime import datetime
-            
-            output_dir = get_nano_banana_output_dir(context)
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
-            # 创建带时间戳的文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"Debug_Response_{timestamp}.json"
-            filepath = os.path.join(output_dir, filename)
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(response_data, f, indent=2, ensure_ascii=False)
-            
-            print(f"✅ 调试响应已保存到: {filepath}")
-            self.report({'INFO'}, f"调试响应已保存: {filename}")
-            
+            self._history.finish(self._history_id, **record)
+            print(f"📒 历史记录 #{self._history_id}: {record['status']}")
         except Exception as e:
-            print(f"保存调试响应失败: {e}")
+            print(f"⚠️ 更新历史记录失败: {e}")
     
-    def apply_ai_suggestions_and_render(self, context, analysis_text):
-        """Apply AI suggestions to scene and create improved render"""
+    def report_output_job(self):
+        """Report the files and bytes this generation wrote"""
+        job = getattr(self, '_output_job', None)
+        if job is None:
+            return
+        summary = f"💾 本次输出: {job.summary()}"
+        print(summary)
+        self.report({'INFO'}, summary)
+    
+    def apply_ai_suggestions_and_render(self, context, analysis):
+        """Apply the missing changes of a structured analysis and create an improved render"""
         try:
             print("=== 应用AI建议到场景 ===")
             scene = context.scene
+            props = scene.nano_banana
             
-            # 保存原始设置
-            original_engine = scene.render.engine
-            original_samples = getattr(scene.cycles, 'samples', 128) if hasattr(scene, 'cycles') else 128
-            
-            # 1. 改进照明设置
-            self.improve_lighting_based_on_analysis(context, analysis_text)
+            # 1-3. 照明、渲染设置和材质：只应用还没有生效的修改
+            applied = fix_plan.apply_plan(fix_plan.build_plan(analysis, scene), scene)
+            print(f"已应用 {applied} 项修改")
             
-            # 2. 优化渲染设置
-            self.optimize_render_settings(context, analysis_text)
-            
-            # 3. 改进材质（如果分析中提到）
-            self.improve_materials_based_on_analysis(context, analysis_text)
-            
-            # 4. 重新渲染场景
+            # 4. 在时间预算内重新渲染场景（由探测渲染校准采样和分辨率）
             print("重新渲染改进的场景...")
-            self.report({'INFO'}, "重新渲染改进的场景...")
-            
-            # 使用更高质量的设置渲染
-            if scene.render.engine == 'BLENDER_EEVEE':
-                # EEVEE优化设置
-                eevee = scene.eevee
-                eevee.use_ssr = True
-                eevee.use_ssr_refraction = True  
-                eevee.use_bloom = True
-                eevee.bloom_intensity = 0.1
-                
-            elif scene.render.engine == 'CYCLES':
-                # Cycles优化设置
-                scene.cycles.samples = 256
-                scene.cycles.use_denoising = True
-                
-            # 渲染到临时文件
-            import tempfile
-            import os
-            
-            temp_dir = tempfile.gettempdir()
-            improved_file = os.path.join(temp_dir, "nano_banana_improved_render.png")
-            
-            original_filepath = scene.render.filepath
-            scene.render.filepath = improved_file
-            
-            # 执行渲染
-            bpy.ops.render.render(write_still=True)
-            
-            # 恢复原始设置
-            scene.render.filepath = original_filepath
-            scene.render.engine = original_engine
-            if hasattr(scene, 'cycles'):
-                scene.cycles.samples = original_samples
+            self.report({'INFO'}, f"重新渲染改进的场景（预算 {props.improved_render_budget:.0f}s）...")
             
-            # 检查文件并加载
-            if os.path.exists(improved_file):
-                file_size = os.path.getsize(improved_file)
-                print(f"改进的渲染文件创建成功: {file_size} bytes")
-                
-                # 加载改进的图像
-                improved_image = bpy.data.images.load(improved_file)
-                improved_image.name = "NanoBanana_Improved_Render"
-                
-                # 保存到输出目录
-                self.save_improved_render(context, improved_file)
-                
-                # 清理临时文件
-                try:
-                    os.unlink(improved_file)
-                except:
-                    pass
-                    
-                return improved_image
-            else:
+            improved_image, saved_path, settings = render_budget.render_improved(
+                scene, props.improved_render_budget, get_nano_banana_output_dir(context), props.fsync_outputs
+            )
+            if improved_image is None:
                 print("改进的渲染文件未创建")
                 self.report({'WARNING'}, "改进的渲染文件未创建")
                 return None
+            
+            print(f"改进的渲染已保存到: {saved_path}")
+            self.report({'INFO'}, f"改进渲染已保存: {os.path.basename(saved_path)} ({settings['render_seconds']:.1f}s)")
+            return improved_image
                 
         except Exception as e:
             print(f"应用AI建议失败: {e}")
@@ -1345,108 +1384,6 @@ Generate a photorealistic image that transforms the reference viewport into the
             traceback.print_exc()
             return None
     
-    def improve_lighting_based_on_analysis(self, context, analysis_text):
-        """Improve lighting based on AI analysis"""
-        try:
-            scene = context.scene
-            
-            # 检查是否提到了照明改进
-            lighting_keywords = ['照明', '光源', '主光源', '补充光', 'lighting', 'light']
-            if any(keyword in analysis_text for keyword in lighting_keywords):
-                print("根据AI建议改进照明...")
-                
-                # 添加主光源（如果不存在）
-                lights = [obj for obj in scene.objects if obj.type == 'LIGHT']
-                if len(lights) < 2:
-                    # 添加主光源
-                    bpy.ops.object.light_add(type='SUN', location=(5, 5, 10))
-                    sun_light = context.active_object
-                    sun_light.name = "AI_Main_Light"
-                    sun_light.data.energy = 3.0
-                    
-                    # 添加补充光
-                    bpy.ops.object.light_add(type='AREA', location=(-3, 2, 5))
-                    area_light = context.active_object
-                    area_light.name = "AI_Fill_Light"
-                    area_light.data.energy = 1.5
-                    area_light.data.size = 2.0
-                
-                print("照明改进完成")
-                
-        except Exception as e:
-            print(f"照明改进失败: {e}")
-    
-    def optimize_render_settings(self, context, analysis_text):
-        """Optimize render settings based on AI analysis"""
-        try:
-            scene = context.scene
-            
-            # 根据分析建议优化渲染引擎
-            if 'cycles' in analysis_text.lower() or '光线追踪' in analysis_text:
-                scene.render.engine = 'CYCLES'
-                if hasattr(scene, 'cycles'):
-                    scene.cycles.samples = 256
-                    scene.cycles.use_denoising = True
-                print("切换到Cycles渲染引擎")
-            else:
-                scene.render.engine = 'BLENDER_EEVEE'
-                print("使用EEVEE渲染引擎")
-                
-        except Exception as e:
-            print(f"渲染设置优化失败: {e}")
-    
-    def improve_materials_based_on_analysis(self, context, analysis_text):
-        """Improve materials based on AI analysis"""
-        try:
-            # 检查是否提到了材质改进
-            material_keywords = ['材质', '纹理', 'material', 'texture', 'PBR']
-            if any(keyword in analysis_text for keyword in material_keywords):
-                print("根据AI建议改进材质...")
-                
-                # 为场景中的网格对象添加基本的PBR材质
-                for obj in context.scene.objects:
-                    if obj.type == 'MESH' and len(obj.material_slots) == 0:
-                        # 创建新材质
-                        mat = bpy.data.materials.new(name=f"AI_Enhanced_{obj.name}")
-                        mat.use_nodes = True
-                        
-                        # 获取材质节点
-                        nodes = mat.node_tree.nodes
-                        bsdf = nodes.get("Principled BSDF")
-                        
-                        if bsdf:
-                            # 设置基本的PBR属性
-                            bsdf.inputs['Base Color'].default_value = (0.7, 0.7, 0.7, 1.0)
-                            bsdf.inputs['Metallic'].default_value = 0.1
-                            bsdf.inputs['Roughness'].default_value = 0.4
-                            
-                        # 分配材质到对象
-                        obj.data.materials.append(mat)
-                
-                print("材质改进完成")
-                
-        except Exception as e:
-            print(f"材质改进失败: {e}")
-    
-    def save_improved_render(self, context, temp_file_path):
-        """Save improved render to output directory"""
-        try:
-            from .properties import get_nano_banana_output_dir
-            import shutil
-            from datetime import datetime
-            
-            output_dir = get_nano_banana_output_dir(context)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            final_filename = f"Improved_Render_{timestamp}.png"
-            final_path = os.path.join(output_dir, final_filename)
-            
-            shutil.copy2(temp_file_path, final_path)
-            print(f"改进的渲染已保存到: {final_path}")
-            self.report({'INFO'}, f"改进渲染已保存: {final_filename}")
-            
-        except Exception as e:
-            print(f"保存改进渲染失败: {e}")
-    
     def process_gemini_image_response(self, response):
         """Process Gemini 2.5 Flash Image API response"""
         try:
@@ -1541,43 +1478,30 @@ Generate a photorealistic image that transforms the reference viewport into the
     def create_blender_image_from_bytes(self, image_bytes):
         """Create Blender image from bytes data"""
         try:
-            import tempfile
-            from datetime import datetime
-            
-            # 创建时间戳
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # 确定保存路径
-            if bpy.data.is_saved:
-                # 如果文件已保存，保存到同一目录下的NanoBanana文件夹
-                blend_dir = os.path.dirname(bpy.data.filepath)
-                output_dir = os.path.join(blend_dir, "NanoBanana")
-                os.makedirs(output_dir, exist_ok=True)
-                permanent_path = os.path.join(output_dir, f"AI_Generated_{timestamp}.png")
-            else:
-                # 如果文件未保存，保存到临时目录
-                output_dir = tempfile.gettempdir()
-                permanent_path = os.path.join(output_dir, f"NanoBanana_AI_Generated_{timestamp}.png")
-            
-            # 保存图像数据到永久文件
-            with open(permanent_path, 'wb') as perm_file:
-                perm_file.write(image_bytes)
-            
-            print(f"✅ 图像已保存到: {permanent_path}")
+            # 结果文件在后台写入，不等待磁盘
+            job = getattr(self, '_output_job', None)
+            permanent_path = job.write_bytes(output_manager.ARTIFACT_RESULT, image_bytes) if job else None
             
-            # 加载到Blender
-            image_name = "NanoBanana_Render"
-            if image_name in bpy.data.images:
-                bpy.data.images.remove(bpy.data.images[image_name])
-            
-            image = bpy.data.images.load(permanent_path)
-            image.name = image_name
+            # 从内存加载到重复使用的 NanoBanana_Render 数据块
+            image_name = image_pool.RENDER_IMAGE_NAME
+            try:
+                image = image_pool.load_image_from_memory(image_name, image_bytes, permanent_path)
+            except Exception as e:
+                # 备用方法：写入临时文件再加载
+                print(f"⚠️ 从内存加载失败，改用临时文件: {e}")
+                from datetime import datetime
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                temp_path = os.path.join(tempfile.gettempdir(), f"NanoBanana_AI_Generated_{timestamp}.png")
+                with open(temp_path, 'wb') as temp_file:
+                    temp_file.write(image_bytes)
+                image = image_pool.load_file(image_name, temp_path, image_pool.ROLE_RESULT)
             
             # 🎯 自动弹出渲染结果窗口 (像F12一样)
             self.show_render_result(image)
             
-            print(f"✅ 成功创建Blender图像: {image_name}")
-            print(f"📁 图像文件保存位置: {permanent_path}")
+            print(f"✅ 成功创建Blender图像: {image_name}, 尺寸: {image.size[0]}x{image.size[1]}")
+            if permanent_path:
+                print(f"📁 图像文件保存位置: {permanent_path}")
             
             return image
             
@@ -1649,20 +1573,7 @@ Generate a photorealistic image that transforms the reference viewport into the
     
     def get_scene_context(self, context):
         """Extract context from current scene"""
-        scene = context.scene
-        
-        # Count objects by type
-        mesh_count = len([obj for obj in scene.objects if obj.type == 'MESH'])
-        light_count = len([obj for obj in scene.objects if obj.type == 'LIGHT'])
-        camera_count = len([obj for obj in scene.objects if obj.type == 'CAMERA'])
-        
-        context_info = f"Scene with {mesh_count} meshes, {light_count} lights, {camera_count} cameras"
-        
-        # Add lighting info if available
-        if scene.world and scene.world.use_nodes:
-            context_info += ", world lighting enabled"
-        
-        return context_info
+        return pipeline.get_scene_context(context.scene)
     
     def process_gemini_response(self, response):
         """Process Gemini API response"""
@@ -1688,15 +1599,11 @@ Generate a photorealistic image that transforms the reference viewport into the
         """Display the generated result"""
         if isinstance(result, bpy.types.Image):
             print(f"Displaying generated image: {result.name}")
-            # Display image in Image Editor
+            # Display image in Image Editor (already saved when it was loaded)
             self.show_image_in_editor(context, result)
             
-            # Also save to file
-            self.save_result_image(result)
-            
-            # Force UI update
-            for area in context.screen.areas:
-                area.tag_redraw()
+            # Force UI update (merged with other pending redraws)
+            delivery.request_redraw('IMAGE_EDITOR', 'PROPERTIES', 'VIEW_3D')
             
             print(f"AI Render completed! Image: {result.name} is now available in Image Editor")
         elif isinstance(result, str):
@@ -1853,136 +1760,132 @@ Generate a photorealistic image that transforms the reference viewport into the
             
         except Exception as e:
             print(f"Error copying to render result: {e}")
+
+class NANOBANANA_OT_batch_generate(Operator):
+    """Generate AI images for several cameras or marker-bound shots at once"""
+    bl_idname = "nano_banana.batch_generate"
+    bl_label = "Batch Generate Shots"
+    bl_description = "Capture every chosen camera / marker shot and generate all of them concurrently"
     
-    def save_input_image(self, image):
-        """Save the input viewport image for debugging purposes"""
-        try:
-            import time
-            
-            print("开始保存输入视口图像...")
-            
-            # 使用新的NanoBanana输出目录
-            output_dir = get_nano_banana_output_dir()
-            print(f"使用NanoBanana输出目录: {output_dir}")
-            
-            # 生成时间戳文件名
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = f"nano_banana_INPUT_{timestamp}.png"
-            filepath = os.path.join(output_dir, filename)
-            
-            print(f"输入图像保存路径: {filepath}")
-            
-            # 保存图像
-            # 确保图像数据是最新的
-            image.update()
-            
-            # 设置文件格式
-            scene = bpy.context.scene
-            original_format = scene.render.image_settings.file_format
-            scene.render.image_settings.file_format = 'PNG'
-            
-            try:
-                # 保存图像
-                image.save_render(filepath)
-                print(f"输入视口图像已保存到: {filepath}")
-                
-                # 验证文件是否存在
-                if os.path.exists(filepath):
-                    file_size = os.path.getsize(filepath)
-                    print(f"输入图像文件保存成功，大小: {file_size} 字节")
-                else:
-                    print("警告：输入图像文件保存失败，文件不存在")
-                    
-            finally:
-                # 恢复原始格式
-                scene.render.image_settings.file_format = original_format
-                
-        except Exception as e:
-            print(f"保存输入图像时出错: {e}")
+    def execute(self, context):
+        props = context.scene.nano_banana
+        
+        if not props.api_key:
+            self.report({'ERROR'}, "Please setup API key first")
+            return {'CANCELLED'}
+        
+        if not REQUESTS_AVAILABLE:
+            self.report({'ERROR'}, "Requests library not available. Please install requests in Blender Python.")
+            return {'CANCELLED'}
+        
+        views = batch.collect_views(context, props)
+        if not views:
+            self.report({'ERROR'}, "No cameras or camera-bound markers found for this batch")
+            return {'CANCELLED'}
+        
+        print(f"=== 开始批量生成: {len(views)} 个镜头 ===")
+        self.report({'INFO'}, f"Capturing {len(views)} shots...")
+        
+        run = batch.start_batch(context, views)
+        
+        if run.capture_failures:
+            self.report({'WARNING'}, f"Capture failed for: {', '.join(run.capture_failures)}")
+        
+        if not run.futures:
+            self.report({'ERROR'}, "All captures failed")
+            return {'CANCELLED'}
+        
+        run.start()
+        self.report({'INFO'}, f"Generating {len(run.futures)} shots with {props.batch_concurrency} concurrent requests → {run.output_dir}")
+        return {'FINISHED'}
+
 
-    def save_result_image(self, image):
-        """Save the generated image to file"""
+class NANOBANANA_OT_generate_tiled(Operator):
+    """Generate a high-resolution image from overlapping tiles"""
+    bl_idname = "nano_banana.generate_tiled"
+    bl_label = "Generate Tiled High-Res"
+    bl_description = "Capture overlapping tiles at the tiled resolution, generate them concurrently and stitch them with blended seams"
+    
+    def execute(self, context):
+        props = context.scene.nano_banana
+        
+        if not props.api_key:
+            self.report({'ERROR'}, "Please setup API key first")
+            return {'CANCELLED'}
+        
+        if not REQUESTS_AVAILABLE:
+            self.report({'ERROR'}, "Requests library not available. Please install requests in Blender Python.")
+            return {'CANCELLED'}
+        
+        if not context.scene.camera:
+            self.report({'ERROR'}, "No active camera")
+            return {'CANCELLED'}
+        
+        run, error = tiles.start_tiled(context)
+        if error:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
+        
         try:
-            import time
-            
-            print("开始保存AI渲染结果...")
-            
-            # 使用新的NanoBanana输出目录
-            output_dir = get_nano_banana_output_dir()
-            print(f"使用NanoBanana输出目录: {output_dir}")
-            
-            # 生成时间戳文件名
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = f"nano_banana_RESULT_{timestamp}.png"
-            filepath = os.path.join(output_dir, filename)
-            
-            print(f"AI结果保存路径: {filepath}")
-            
-            # 保存图像
-            image.update()
-            
-            # 设置文件格式
-            scene = bpy.context.scene
-            original_format = scene.render.image_settings.file_format
-            scene.render.image_settings.file_format = 'PNG'
-            
-            try:
-                # 保存图像
-                image.save_render(filepath)
-                print(f"AI渲染结果已保存到: {filepath}")
-                
-                # 验证文件是否存在
-                if os.path.exists(filepath):
-                    file_size = os.path.getsize(filepath)
-                    print(f"AI结果文件保存成功，大小: {file_size} 字节")
-                    return filepath
-                else:
-                    print("警告：AI结果文件保存失败，文件不存在")
-                    return None
-                    
-            finally:
-                # 恢复原始格式
-                scene.render.image_settings.file_format = original_format
-                
-        except Exception as e:
-            print(f"保存AI结果时出错: {e}")
-            return None
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = f"nano_banana_render_{timestamp}.png"
-            filepath = os.path.join(output_dir, filename)
-            
-            print(f"保存路径: {filepath}")
-            
-            # 保存图像
-            # 确保图像数据是最新的
-            image.update()
-            
-            # 设置文件格式
-            scene = bpy.context.scene
-            original_format = scene.render.image_settings.file_format
-            scene.render.image_settings.file_format = 'PNG'
-            
-            try:
-                # 保存图像
-                image.save_render(filepath)
-                print(f"AI渲染图像已保存到: {filepath}")
-                
-                # 验证文件是否存在
-                if os.path.exists(filepath):
-                    file_size = os.path.getsize(filepath)
-                    print(f"文件保存成功，大小: {file_size} 字节")
-                else:
-                    print("警告：文件保存失败，文件不存在")
-                    
-            finally:
-                # 恢复原始格式
-                scene.render.image_settings.file_format = original_format
-            
-            return filepath
-            
-        except Exception as e:
-            print(f"保存图像时出错: {e}")
-            return None
+            run.start()
+        except OSError as e:
+            self.report({'ERROR'}, f"Cannot write {run.output_path}: {e}")
+            return {'CANCELLED'}
+        
+        self.report({'INFO'}, f"Generating {len(run.futures)} tiles ({run.width}x{run.height}) with {props.batch_concurrency} concurrent requests")
+        return {'FINISHED'}
+
+class NANOBANANA_OT_generate_panorama(Operator):
+    """Generate a 360° equirectangular panorama from six cube faces"""
+    bl_idname = "nano_banana.generate_panorama"
+    bl_label = "Generate 360° Panorama"
+    bl_description = "Capture the six cube faces from the camera position, generate them concurrently and assemble an equirectangular image"
+    
+    def execute(self, context):
+        props = context.scene.nano_banana
+        
+        if not props.api_key:
+            self.report({'ERROR'}, "Please setup API key first")
+            return {'CANCELLED'}
+        
+        if not REQUESTS_AVAILABLE:
+            self.report({'ERROR'}, "Requests library not available. Please install requests in Blender Python.")
+            return {'CANCELLED'}
+        
+        if not context.scene.camera:
+            self.report({'ERROR'}, "No active camera")
+            return {'CANCELLED'}
+        
+        run, error = panorama.start_panorama(context)
+        if error:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
+        
+        run.start()
+        self.report({'INFO'}, "🌐 正在并发生成六个立方体面...")
+        return {'FINISHED'}
+
+class NANOBANANA_OT_cancel_progressive(Operator):
+    """Cancel the preview or the full request of a progressive generation"""
+    bl_idname = "nano_banana.cancel_progressive"
+    bl_label = "Cancel"
+    bl_description = "Cancel this request; the other one keeps running"
+    
+    target: bpy.props.EnumProperty(
+        name="Request",
+        items=[
+            (progressive.TARGET_PREVIEW, "Preview", "The quick low quality preview"),
+            (progressive.TARGET_FULL, "Full", "The full quality request"),
+        ],
+        default=progressive.TARGET_FULL
+    )
+    
+    def execute(self, context):
+        if not progressive.cancel(context.scene.name, self.target):
+            self.report({'WARNING'}, "This request is no longer running")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"{self.target.title()} request cancelled")
+        return {'FINISHED'}
 
 class NANOBANANA_OT_render_animation(Operator):
     """Render animation sequence using Gemini AI"""
@@ -2007,11 +1910,13 @@ class NANOBANANA_OT_save_image(bpy.types.Operator):
         if self.image_name and self.image_name in bpy.data.images:
             image = bpy.data.images[self.image_name]
             
-            # Use the save method from main operator
-            main_op = NANOBANANA_OT_render_with_ai()
-            main_op.save_result_image(image)
+            try:
+                filepath = output_manager.save_image_copy(image, get_nano_banana_output_dir(context))
+            except Exception as e:
+                self.report({'ERROR'}, f"保存图片失败: {e}")
+                return {'CANCELLED'}
             
-            self.report({'INFO'}, f"图片已保存: {self.image_name}")
+            self.report({'INFO'}, f"图片已保存: {os.path.basename(filepath)}")
         else:
             self.report({'ERROR'}, "图片不存在")
         
@@ -2058,6 +1963,213 @@ class NANOBANANA_OT_view_in_editor(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class NANOBANANA_OT_history_page(Operator):
+    """Show another page of the generation history"""
+    bl_idname = "nano_banana.history_page"
+    bl_label = "History Page"
+    bl_options = {'REGISTER'}
+    
+    delta: bpy.props.IntProperty(name="Delta", default=1)
+    
+    def execute(self, context):
+        props = context.scene.nano_banana
+        output_dir = get_nano_banana_output_dir(context)
+        _records, total = history_browser.load_page(output_dir, props.history_filter, 0)
+        last_page = max(0, (total - 1) // history_browser.PAGE_SIZE)
+        props.history_page = min(max(props.history_page + self.delta, 0), last_page)
+        return {'FINISHED'}
+
+
+class NANOBANANA_OT_history_apply(Operator):
+    """Restore the prompt and settings of a past generation"""
+    bl_idname = "nano_banana.history_apply"
+    bl_label = "Apply Settings"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    record_id: bpy.props.IntProperty(name="Record")
+    
+    def execute(self, context):
+        props = context.scene.nano_banana
+        record = history.open_history(get_nano_banana_output_dir(context)).get(self.record_id)
+        if not record or not record['settings']:
+            self.report({'ERROR'}, f"历史记录 #{self.record_id} 没有保存设置")
+            return {'CANCELLED'}
+        
+        settings = json.loads(record['settings'])
+        skipped = []
+        for key in history.SETTINGS_KEYS:
+            if key not in settings:
+                continue
+            try:
+                setattr(props, key, settings[key])
+            except (TypeError, ValueError):
+                # 旧记录中的选项可能已不存在
+                skipped.append(key)
+        
+        if skipped:
+            self.report({'WARNING'}, f"已恢复 #{self.record_id} 的设置，跳过: {', '.join(skipped)}")
+        else:
+            self.report({'INFO'}, f"已恢复 #{self.record_id} 的设置")
+        return {'FINISHED'}
+
+
+class NANOBANANA_OT_history_open(Operator):
+    """Open the full-resolution result of a past generation in the Image Editor"""
+    bl_idname = "nano_banana.history_open"
+    bl_label = "Open Result"
+    bl_options = {'REGISTER'}
+    
+    record_id: bpy.props.IntProperty(name="Record")
+    
+    def execute(self, context):
+        record = history.open_history(get_nano_banana_output_dir(context)).get(self.record_id)
+        path = record and record['output_path']
+        if not path or not os.path.exists(path):
+            self.report({'ERROR'}, f"历史记录 #{self.record_id} 的结果文件不存在")
+            return {'CANCELLED'}
+        
+        # 复用同一个数据块查看历史结果
+        image = image_pool.load_file(image_pool.HISTORY_IMAGE_NAME, path, image_pool.ROLE_RESULT)
+        bpy.ops.nano_banana.view_in_editor(image_name=image.name)
+        return {'FINISHED'}
+
+
+class NANOBANANA_OT_free_images(Operator):
+    """Free the images the add-on keeps in memory"""
+    bl_idname = "nano_banana.free_images"
+    bl_label = "Free Add-on Images"
+    bl_options = {'REGISTER'}
+    
+    def execute(self, context):
+        released = image_pool.release_intermediates()
+        
+        # 结果图像只释放解码后的像素，显示时会从文件/打包数据重新解码
+        for image in image_pool.managed_images(image_pool.ROLE_RESULT):
+            if image.has_data:
+                image.buffers_free()
+                released += 1
+        
+        self.report({'INFO'}, f"已释放 {released} 个图像缓冲")
+        return {'FINISHED'}
+
+
+class NANOBANANA_OT_history_pin(Operator):
+    """Pin or unpin a past generation (pinned files are never cleaned up)"""
+    bl_idname = "nano_banana.history_pin"
+    bl_label = "Pin Generation"
+    bl_options = {'REGISTER'}
+    
+    record_id: bpy.props.IntProperty(name="Record")
+    
+    def execute(self, context):
+        index = history.open_history(get_nano_banana_output_dir(context))
+        record = index.get(self.record_id)
+        if not record:
+            self.report({'ERROR'}, f"没有找到历史记录 #{self.record_id}")
+            return {'CANCELLED'}
+        
+        pinned = not record['pinned']
+        index.set_pinned(self.record_id, pinned)
+        history_browser.invalidate()
+        self.report({'INFO'}, f"{'已固定' if pinned else '已取消固定'} #{self.record_id}")
+        return {'FINISHED'}
+
+
+class NANOBANANA_OT_retention_cleanup(Operator):
+    """Apply the retention limits to the NanoBanana folder now"""
+    bl_idname = "nano_banana.retention_cleanup"
+    bl_label = "Clean Up Now"
+    bl_options = {'REGISTER'}
+    
+    dry_run: bpy.props.BoolProperty(
+        name="Dry Run",
+        description="Only list the files that would be deleted (see the console)",
+        default=False
+    )
+    
+    def execute(self, context):
+        if retention.is_running():
+            self.report({'WARNING'}, "清理正在进行中")
+            return {'CANCELLED'}
+        
+        output_dir = get_nano_banana_output_dir(context)
+        if not retention.start(context.scene.nano_banana, output_dir, dry_run=self.dry_run):
+            self.report({'ERROR'}, "无法开始清理，详见控制台")
+            return {'CANCELLED'}
+        
+        self.report({'INFO'}, f"🧹 正在后台清理: {output_dir}")
+        return {'FINISHED'}
+
+
+class NANOBANANA_OT_apply_fix_plan(Operator):
+    """Apply the changes suggested by the last scene analysis that are not in the scene yet"""
+    bl_idname = "nano_banana.apply_fix_plan"
+    bl_label = "Apply Suggested Fixes"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    render: BoolProperty(
+        name="Improved Render",
+        description="Render the fixed scene within the improved render time budget",
+        default=False
+    )
+    
+    def execute(self, context):
+        props = context.scene.nano_banana
+        cache = fix_plan.PlanCache(get_nano_banana_output_dir(context))
+        analysis = cache.get(props.last_analysis_fingerprint) if props.last_analysis_fingerprint else None
+        if analysis is None:
+            self.report({'ERROR'}, "没有可用的分析结果，请先分析场景")
+            return {'CANCELLED'}
+        
+        plan = fix_plan.build_plan(analysis, context.scene)
+        if plan:
+            applied = fix_plan.apply_plan(plan, context.scene)
+            self.report({'INFO'}, f"🛠️ 已应用 {applied} 项修改")
+        else:
+            self.report({'INFO'}, "所有建议的修改都已生效")
+        
+        if self.render:
+            image, saved_path, settings = render_budget.render_improved(
+                context.scene, props.improved_render_budget, get_nano_banana_output_dir(context), props.fsync_outputs
+            )
+            if image is None:
+                self.report({'WARNING'}, "改进的渲染文件未创建")
+                return {'FINISHED'}
+            bpy.ops.nano_banana.view_in_editor(image_name=image.name)
+            self.report({'INFO'}, f"改进渲染已保存: {os.path.basename(saved_path)} ({settings['render_seconds']:.1f}s)")
+        return {'FINISHED'}
+
+
+class NANOBANANA_OT_regenerate_region(Operator):
+    """Regenerate only the render region (or masked area) and blend it into the last AI render"""
+    bl_idname = "nano_banana.regenerate_region"
+    bl_label = "Regenerate Region"
+    bl_description = "Capture only the render border or mask area plus a margin, generate it and blend it back into the last AI render"
+    
+    def execute(self, context):
+        props = context.scene.nano_banana
+        
+        if not props.api_key:
+            self.report({'ERROR'}, "Please setup API key first")
+            return {'CANCELLED'}
+        
+        if not REQUESTS_AVAILABLE:
+            self.report({'ERROR'}, "Requests library not available. Please install requests in Blender Python.")
+            return {'CANCELLED'}
+        
+        if not context.scene.camera:
+            self.report({'ERROR'}, "No active camera")
+            return {'CANCELLED'}
+        
+        error = roi.start_region_generation(context.scene, props.roi_margin, props.roi_mask)
+        if error:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
+        
+        self.report({'INFO'}, "🧩 区域已捕获，正在生成...")
+        return {'FINISHED'}
+
+
 # Export all operator classes
 __all__ = [
     'NANOBANANA_OT_api_key_dialog',
@@ -2065,6 +2177,18 @@ __all__ = [
     'NANOBANANA_OT_capture_viewport',
     'NANOBANANA_OT_render_viewport',
     'NANOBANANA_OT_render_animation',
+    'NANOBANANA_OT_batch_generate',
+    'NANOBANANA_OT_generate_tiled',
+    'NANOBANANA_OT_generate_panorama',
+    'NANOBANANA_OT_cancel_progressive',
     'NANOBANANA_OT_save_image',
     'NANOBANANA_OT_view_in_editor',
+    'NANOBANANA_OT_history_page',
+    'NANOBANANA_OT_history_apply',
+    'NANOBANANA_OT_history_open',
+    'NANOBANANA_OT_free_images',
+    'NANOBANANA_OT_history_pin',
+    'NANOBANANA_OT_retention_cleanup',
+    'NANOBANANA_OT_apply_fix_plan',
+    'NANOBANANA_OT_regenerate_region',
 ]
\ No newline at end of file
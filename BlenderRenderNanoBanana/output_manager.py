@@ -0,0 +1,141 @@
+"""
+Output manager for Nano Banana Renderer
+
+每次生成只把每个产物写入磁盘一次，尽量保存原始编码字节（API返回的PNG、
+捕获时渲染出的PNG），不再通过 save_render 重新编码。保存哪些产物由
+"Save Artifacts" 设置决定，每个任务结束后汇报写入的字节数。
+实际写入由 disk_writer 在后台线程中完成。
+"""
+
+import bpy
+import os
+from datetime import datetime
+
+from . import disk_writer
+from . import debug_dump
+
+ARTIFACT_INPUT = 'INPUT'
+ARTIFACT_RESULT = 'RESULT'
+ARTIFACT_DEBUG = 'DEBUG'
+
+# 各类产物的文件名前缀
+ARTIFACT_PREFIXES = {
+    ARTIFACT_INPUT: "nano_banana_INPUT",
+    ARTIFACT_RESULT: "AI_Generated",
+    ARTIFACT_DEBUG: "Debug_Response",
+}
+
+
+def format_bytes(size):
+    """Human readable byte count"""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} GB"
+
+
+def unique_path(output_dir, base_filename, extension):
+    """Path in output_dir that does not exist (or wait to be written) yet, adding a .001 style suffix if needed"""
+    filepath = os.path.join(output_dir, f"{base_filename}{extension}")
+    version = 1
+    while os.path.exists(filepath) or disk_writer.is_pending(filepath):
+        filepath = os.path.join(output_dir, f"{base_filename}.{version:03d}{extension}")
+        version += 1
+    return filepath
+
+
+class OutputJob:
+    """Artifacts of one generation, written once each
+
+    All artifacts of a job share one timestamp so input, result and debug
+    files belong together. With a history record id (name_id) the names
+    are unique by construction and the directory is not probed.
+    """
+
+    def __init__(self, output_dir, kinds, fsync=False, name_id=None):
+        self.output_dir = output_dir
+        self.kinds = set(kinds)
+        self.fsync = fsync
+        self.name_id = name_id
+        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.files = {}
+        self.bytes_written = 0
+
+    def wants(self, kind):
+        return kind in self.kinds
+
+    def write_bytes(self, kind, data, extension=".png", wait=False):
+        """Queue already encoded bytes as one artifact; returns the path or None
+
+        With wait=True the call returns only once the file is on disk
+        (needed when Blender loads the file right away).
+        """
+        if not self.wants(kind) or not data:
+            return None
+        filepath = self.artifact_path(kind, extension)
+        request = disk_writer.submit(filepath, data, self.fsync)
+        if wait:
+            error = request.wait()
+            if error:
+                print(f"❌ 保存{kind}产物失败: {error}")
+                return None
+
+        self.files[kind] = filepath
+        self.bytes_written += len(data)
+        print(f"💾 {kind}: {filepath} ({format_bytes(len(data))})")
+        return filepath
+
+    def artifact_path(self, kind, extension):
+        base_filename = f"{ARTIFACT_PREFIXES[kind]}_{self.timestamp}"
+        if self.name_id is not None:
+            return os.path.join(self.output_dir, f"{base_filename}_{self.name_id:06d}{extension}")
+        return unique_path(self.output_dir, base_filename, extension)
+
+    def write_debug(self, data, store_payloads=False):
+        """Queue a compact, gzip compressed debug dump of an API response
+
+        Binary payloads are replaced by size/hash placeholders; with
+        store_payloads they are also kept once in the artifact store.
+        """
+        if not self.wants(ARTIFACT_DEBUG):
+            return None
+        store = self.store_payload if store_payloads else None
+        return self.write_bytes(ARTIFACT_DEBUG, debug_dump.encode(data, store), extension=debug_dump.DUMP_EXTENSION)
+
+    def store_payload(self, raw, digest, mime_type):
+        """Write a payload to the content addressed store (once); returns its relative path"""
+        store_dir = os.path.join(self.output_dir, debug_dump.ARTIFACT_STORE_DIRNAME)
+        filepath = debug_dump.blob_path(store_dir, digest, mime_type)
+        if not os.path.exists(filepath) and not disk_writer.is_pending(filepath):
+            disk_writer.submit(filepath, raw, self.fsync)
+            self.bytes_written += len(raw)
+        return os.path.relpath(filepath, self.output_dir)
+
+    def summary(self):
+        """One line describing what this job wrote"""
+        return f"{len(self.files)} 个文件, {format_bytes(self.bytes_written)}"
+
+
+def save_image_copy(image, output_dir):
+    """Save a Blender image to output_dir, copying its file bytes when it has one
+
+    Images loaded from disk (every generated result) are copied byte for
+    byte; only images that exist purely in memory are encoded with
+    save_render.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(output_dir, exist_ok=True)
+    filepath = unique_path(output_dir, f"nano_banana_RESULT_{timestamp}", ".png")
+
+    source_path = bpy.path.abspath(image.filepath_raw) if image.filepath_raw else None
+    if image.packed_file is not None:
+        disk_writer.submit(filepath, image.packed_file.data)
+    elif source_path and os.path.exists(source_path):
+        with open(source_path, 'rb') as f:
+            disk_writer.submit(filepath, f.read())
+    else:
+        image.save_render(filepath)
+
+    print(f"💾 图片已保存到: {filepath}")
+    return filepath
@@ -3,7 +3,13 @@ UI Panels for Nano Banana Renderer
 """
 
 import bpy
+from datetime import datetime
 from bpy.types import Panel
+from .properties import get_nano_banana_output_dir
+from . import history_browser
+from . import image_pool
+from . import analysis_stream
+from . import progressive
 
 class NANOBANANA_PT_render_panel(Panel):
     """Main panel for Nano Banana Renderer"""
@@ -89,6 +95,27 @@ class NANOBANANA_PT_render_panel(Panel):
             col.separator()
             col.prop(props, "use_viewport_camera", text="Use Viewport Camera")
             col.prop(props, "include_scene_context", text="Include Scene Context")
+            if props.include_scene_context:
+                col.prop(props, "scene_context_budget", text="Context Budget")
+            
+            col.separator()
+            col.label(text="Save Artifacts:")
+            col.row().prop(props, "save_artifacts", expand=True)
+            if 'DEBUG' in props.save_artifacts:
+                col.prop(props, "debug_level")
+            col.prop(props, "fsync_outputs", text="Sync Writes to Disk")
+            
+            # 输出目录保留策略
+            col.separator()
+            col.prop(props, "retention_enabled")
+            sub = col.column(align=True)
+            sub.active = props.retention_enabled
+            sub.prop(props, "retention_max_age_days")
+            sub.prop(props, "retention_max_count")
+            sub.prop(props, "retention_max_size_mb")
+            row = col.row(align=True)
+            row.operator("nano_banana.retention_cleanup", icon='TRASH')
+            row.operator("nano_banana.retention_cleanup", text="Dry Run").dry_run = True
         
         # ================================
         # MAIN RENDER BUTTON - ALWAYS VISIBLE
@@ -126,6 +153,45 @@ class NANOBANANA_PT_render_panel(Panel):
         
         # 主渲染按钮 - 强制显示
         col.operator("nano_banana.render_viewport_fixed", text=button_text, icon=button_icon)
+        render_box.prop(props, "non_blocking_capture")
+        render_box.prop(props, "progressive_preview")
+        
+        # 渐进生成进行中：预览和完整请求可以分别取消
+        running = progressive.running(context.scene.name)
+        if running:
+            row = render_box.row(align=True)
+            if progressive.TARGET_PREVIEW in running:
+                row.operator("nano_banana.cancel_progressive", text="Cancel Preview", icon='CANCEL').target = progressive.TARGET_PREVIEW
+            if progressive.TARGET_FULL in running:
+                row.operator("nano_banana.cancel_progressive", text="Cancel Full", icon='CANCEL').target = progressive.TARGET_FULL
+        
+        # 实时预览：场景或提示词变化时自动生成草稿
+        live_col = render_box.column(align=True)
+        live_col.prop(props, "live_preview", icon='REC' if props.live_preview else 'PLAY')
+        if props.live_preview:
+            row = live_col.row(align=True)
+            row.prop(props, "live_debounce")
+            row.prop(props, "live_max_per_minute", text="Per Minute")
+        
+        # 只重新生成渲染边框或遮罩区域，混合回上一次结果
+        if current_service != 'ANALYSIS':
+            roi_col = render_box.column(align=True)
+            roi_col.operator("nano_banana.regenerate_region", icon='SELECT_SUBTRACT')
+            row = roi_col.row(align=True)
+            row.prop(props, "roi_margin", text="Margin")
+            row.prop(props, "roi_mask", text="")
+        
+        # 流式分析进行中：文本实时写入 NanoBanana_Analysis
+        stream_status = analysis_stream.status()
+        if stream_status:
+            render_box.label(text=stream_status, icon='TEXT')
+        
+        # 应用上一次分析中还没有生效的修改
+        if current_service in {'ANALYSIS', 'BOTH'} and props.last_analysis_fingerprint:
+            row = render_box.row(align=True)
+            row.operator("nano_banana.apply_fix_plan", icon='MODIFIER')
+            row.operator("nano_banana.apply_fix_plan", text="Fix + Render", icon='RENDER_STILL').render = True
+            render_box.prop(props, "improved_render_budget", text="Render Budget")
         
         # 服务信息
         render_box.separator()
@@ -140,7 +206,7 @@ class NANOBANANA_PT_render_panel(Panel):
             info_col.label(text="• Get improvement suggestions", icon='FILE_TEXT')
         elif current_service == 'BOTH':
             info_col.label(text="• Complete AI workflow", icon='SEQUENCE')
-            info_col.label(text="• Analysis + Image generation", icon='RENDER_STILL')
+            info_col.label(text="• Analysis and generation run in parallel", icon='RENDER_STILL')
         
         # Prompt输入
         layout.separator()
@@ -153,12 +219,106 @@ class NANOBANANA_PT_render_panel(Panel):
         settings_row.prop(props, "aspect_ratio", text="")
         settings_row.prop(props, "prompt_style", text="")
         
+        # 批量镜头生成
+        layout.separator()
+        batch_box = layout.box()
+        batch_box.label(text="Batch Shots", icon='OUTLINER_OB_CAMERA')
+        col = batch_box.column()
+        col.prop(props, "batch_source", text="Shots")
+        row = col.row()
+        row.prop(props, "batch_turntable_views", text="Turntable")
+        if props.batch_turntable_views > 0:
+            row.prop(props, "batch_turntable_target", text="")
+        col.prop(props, "batch_concurrency", text="Concurrent Requests")
+        batch_box.operator("nano_banana.batch_generate", text="Generate All Shots", icon='RENDER_ANIMATION')
+        
+        # 分块高分辨率生成
+        layout.separator()
+        tiled_box = layout.box()
+        tiled_box.label(text="Tiled High-Res", icon='MESH_GRID')
+        col = tiled_box.column(align=True)
+        col.prop(props, "tiled_long_side", text="Long Side")
+        row = col.row(align=True)
+        row.prop(props, "tile_size", text="Tile")
+        row.prop(props, "tile_overlap", text="Overlap")
+        tiled_box.operator("nano_banana.generate_tiled", text="Generate Tiled", icon='RENDER_STILL')
+        
+        # 360° 全景（六个立方体面）
+        layout.separator()
+        panorama_box = layout.box()
+        panorama_box.label(text="360° Panorama", icon='WORLD')
+        row = panorama_box.row(align=True)
+        row.prop(props, "panorama_face_size")
+        row.prop(props, "panorama_set_world", text="World")
+        panorama_box.operator("nano_banana.generate_panorama", text="Generate Panorama", icon='WORLD_DATA')
+        
         # 状态显示
-        if hasattr(context.scene, 'nano_banana_status'):
+        if getattr(context.scene, 'nano_banana_status', ""):
             layout.separator()
             status_box = layout.box()
             status_box.label(text="Status", icon='INFO')
             status_box.label(text=context.scene.nano_banana_status)
+        
+        # 插件图像占用的内存
+        image_count, image_bytes = image_pool.memory_usage()
+        row = layout.row()
+        row.label(text=f"Add-on images: {image_count} ({image_bytes / (1024 * 1024):.1f} MB)", icon='IMAGE_DATA')
+        row.operator("nano_banana.free_images", text="", icon='TRASH')
+
+
+class NANOBANANA_PT_history_panel(Panel):
+    """Browse past generations of this project"""
+    bl_label = "Nano Banana History"
+    bl_idname = "NANOBANANA_PT_history_panel"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = "render"
+    bl_options = {'DEFAULT_CLOSED'}
+    
+    def draw(self, context):
+        layout = self.layout
+        props = context.scene.nano_banana
+        output_dir = get_nano_banana_output_dir(context)
+        
+        layout.prop(props, "history_filter", text="", icon='VIEWZOOM')
+        
+        records, total = history_browser.load_page(output_dir, props.history_filter, props.history_page)
+        if not records:
+            layout.label(text="No generations recorded yet", icon='INFO')
+            return
+        
+        # 只为当前页的记录加载缩略图
+        for record in records:
+            box = layout.box()
+            row = box.row()
+            icon_id = history_browser.get_icon(output_dir, record)
+            if icon_id:
+                row.template_icon(icon_value=icon_id, scale=4.0)
+            else:
+                row.label(text="", icon='IMAGE_DATA' if record['output_path'] else 'ERROR')
+            
+            col = row.column(align=True)
+            created = datetime.fromtimestamp(record['created']).strftime("%Y-%m-%d %H:%M")
+            col.label(text=f"#{record['id']}  {created}  {record['camera'] or ''}")
+            col.label(text=record['prompt'][:60] or record['status'])
+            buttons = col.row(align=True)
+            op = buttons.operator("nano_banana.history_pin", text="",
+                                  icon='PINNED' if record['pinned'] else 'UNPINNED')
+            op.record_id = record['id']
+            op = buttons.operator("nano_banana.history_apply", text="Apply", icon='LOOP_BACK')
+            op.record_id = record['id']
+            if record['output_path']:
+                op = buttons.operator("nano_banana.history_open", text="Open", icon='IMAGE_DATA')
+                op.record_id = record['id']
+        
+        # 翻页
+        page_count = (total + history_browser.PAGE_SIZE - 1) // history_browser.PAGE_SIZE
+        row = layout.row(align=True)
+        op = row.operator("nano_banana.history_page", text="", icon='TRIA_LEFT')
+        op.delta = -1
+        row.label(text=f"Page {props.history_page + 1} / {page_count}  ({total})")
+        op = row.operator("nano_banana.history_page", text="", icon='TRIA_RIGHT')
+        op.delta = 1
 
 
 class NANOBANANA_PT_viewport_panel(Panel):
@@ -205,6 +365,10 @@ class NANOBANANA_PT_viewport_panel(Panel):
         col.scale_y = 2.0
         col.operator("nano_banana.render_viewport_fixed", text=button_text, icon=button_icon)
         
+        stream_status = analysis_stream.status()
+        if stream_status:
+            layout.label(text=stream_status, icon='TEXT')
+        
         # 简化的信息
         layout.separator()
         box = layout.box()
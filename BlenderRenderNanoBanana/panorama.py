@@ -0,0 +1,339 @@
+"""
+Cube-face panorama generation for Nano Banana Renderer
+
+环境 lookdev 需要 360° 的 AI 画面。从摄像机位置用 90° 视角的临时摄像机
+捕获立方体的六个面（与世界坐标轴对齐），六个请求同时发出，总时间接近
+一次生成。
+
+六个面都返回后，在工作线程中用 NumPy 向量化地把等距柱状投影
+（equirectangular，宽 = 4 × 面大小，高 = 2 × 面大小）的每个像素方向映射到
+对应的立方体面并双线性采样，按行带写入 PNG。方向与 Cycles 环境纹理的
+映射一致，所以结果可以直接作为世界的 Environment Texture 使用。
+"""
+
+import bpy
+import os
+import math
+import time
+import base64
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from mathutils import Matrix, Vector
+
+import numpy as np
+
+from . import roi
+from . import tiles
+from . import batch
+from . import history
+from . import pipeline
+from . import delivery
+from . import image_pool
+from . import async_render
+from . import output_manager
+from .properties import get_nano_banana_output_dir
+
+PANORAMA_IMAGE_NAME = "NanoBanana_Panorama"
+PANORAMA_CAMERA_NAME = "NanoBanana_Panorama"
+WORLD_NODE_NAME = "NanoBanana Panorama"
+
+POLL_INTERVAL = 0.1
+
+# 每次重投影的输出行数
+BAND_ROWS = 128
+
+# (名称, 朝向, 上方向)，都是世界坐标
+FACES = (
+    ('+X', (1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+    ('-X', (-1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+    ('+Y', (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)),
+    ('-Y', (0.0, -1.0, 0.0), (0.0, 0.0, 1.0)),
+    ('+Z', (0.0, 0.0, 1.0), (0.0, -1.0, 0.0)),
+    ('-Z', (0.0, 0.0, -1.0), (0.0, 1.0, 0.0)),
+)
+
+FACE_INSTRUCTION = (
+    "This image is the {name} face of a 360 degree cube map: six 90 degree views captured from the same point. "
+    "Keep its exact framing and perspective, and keep lighting, colors and style consistent with an environment "
+    "seen from one position so the edges of neighbouring faces line up."
+)
+
+
+# ================================
+# Cube faces and reprojection
+# ================================
+
+def face_axes():
+    """(forward, right, up) arrays of shape (6, 3) for FACES"""
+    forward = np.array([face[1] for face in FACES], dtype=np.float32)
+    up = np.array([face[2] for face in FACES], dtype=np.float32)
+    return forward, np.cross(forward, up), up
+
+
+def face_matrix(location, forward, up):
+    """World matrix of a camera at location looking along forward"""
+    forward, up = Vector(forward), Vector(up)
+    right = forward.cross(up)
+    rotation = Matrix((right, up, -forward)).transposed()
+    return Matrix.Translation(location) @ rotation.to_4x4()
+
+
+def equirect_directions(row_start, rows, width, height):
+    """Unit view directions (rows, width, 3) of equirectangular pixels, top row first
+
+    Uses the Cycles mapping: u = 0.5 - atan2(y, x) / 2pi, v = 0.5 + elevation / pi.
+    """
+    u = (np.arange(width, dtype=np.float32) + 0.5) / width
+    v = 1.0 - (np.arange(row_start, row_start + rows, dtype=np.float32) + 0.5) / height
+    longitude = (0.5 - u) * (2.0 * np.pi)
+    latitude = (v - 0.5) * np.pi
+    cos_lat = np.cos(latitude)[:, None]
+    return np.stack(np.broadcast_arrays(
+        cos_lat * np.cos(longitude)[None, :],
+        cos_lat * np.sin(longitude)[None, :],
+        np.sin(latitude)[:, None],
+    ), axis=-1)
+
+
+def sample_cube(faces, directions):
+    """Bilinearly sample (6, n, n, 3) uint8 faces (rows bottom-up) along directions"""
+    size = faces.shape[1]
+    forward, right, up = face_axes()
+    facing = directions @ forward.T
+    face = np.argmax(facing, axis=-1)
+    depth = np.take_along_axis(facing, face[..., None], axis=-1)[..., 0]
+    x = np.einsum('...k,...k->...', directions, right[face]) / depth
+    y = np.einsum('...k,...k->...', directions, up[face]) / depth
+
+    fx = (x + 1.0) * 0.5 * size - 0.5
+    fy = (y + 1.0) * 0.5 * size - 0.5
+    x0, y0 = np.floor(fx), np.floor(fy)
+    wx, wy = (fx - x0)[..., None], (fy - y0)[..., None]
+    x0 = x0.astype(np.int64)
+    y0 = y0.astype(np.int64)
+    x1 = np.clip(x0 + 1, 0, size - 1)
+    y1 = np.clip(y0 + 1, 0, size - 1)
+    x0 = np.clip(x0, 0, size - 1)
+    y0 = np.clip(y0, 0, size - 1)
+
+    def at(rows, cols):
+        return faces[face, rows, cols].astype(np.float32)
+
+    top = at(y0, x0) * (1.0 - wx) + at(y0, x1) * wx
+    bottom = at(y1, x0) * (1.0 - wx) + at(y1, x1) * wx
+    return top * (1.0 - wy) + bottom * wy
+
+
+def write_equirect(faces, path, width, height):
+    """Reproject the cube faces into an equirectangular PNG, one row band at a time
+
+    The PNG only appears at `path` once it is complete; on failure the
+    partial file is removed.
+    """
+    png = tiles.PngStream(path, width, height)
+    try:
+        for row_start in range(0, height, BAND_ROWS):
+            rows = min(BAND_ROWS, height - row_start)
+            band = sample_cube(faces, equirect_directions(row_start, rows, width, height))
+            png.write_rows(np.clip(band + 0.5, 0, 255).astype(np.uint8))
+    except Exception:
+        png.abort()
+        raise
+    png.close()
+    return path
+
+
+def set_world_texture(scene, image):
+    """Use image as the scene world's environment texture"""
+    world = scene.world
+    if world is None:
+        world = bpy.data.worlds.new(PANORAMA_IMAGE_NAME)
+        scene.world = world
+    world.use_nodes = True
+    nodes = world.node_tree.nodes
+    links = world.node_tree.links
+
+    background = next((node for node in nodes if node.type == 'BACKGROUND'), None)
+    if background is None:
+        background = nodes.new('ShaderNodeBackground')
+        output = next((node for node in nodes if node.type == 'OUTPUT_WORLD'), None) or nodes.new('ShaderNodeOutputWorld')
+        links.new(background.outputs['Background'], output.inputs['Surface'])
+
+    environment = nodes.get(WORLD_NODE_NAME)
+    if environment is None:
+        environment = nodes.new('ShaderNodeTexEnvironment')
+        environment.name = WORLD_NODE_NAME
+        environment.location = background.location.x - 300, background.location.y
+    environment.image = image
+    links.new(environment.outputs['Color'], background.inputs['Color'])
+    print(f"🌍 全景图已设置为世界环境纹理: {world.name}")
+
+
+# ================================
+# Panorama run
+# ================================
+
+class PanoramaRun:
+    """Six concurrent face requests, reprojected on a worker thread when all are back"""
+
+    # 正在运行的全景任务，防止定时器回调引用的对象被回收
+    active = []
+
+    def __init__(self, scene, face_size, output_path, set_world=True):
+        props = scene.nano_banana
+        self.scene_name = scene.name
+        self.api_key = props.api_key
+        self.face_size = face_size
+        self.output_path = output_path
+        self.set_world = set_world
+        self.start_time = time.time()
+        self.prompt = ""
+        self.settings = history.settings_snapshot(props)
+        self.capture_seconds = 0.0
+
+        self.captures = {}
+        self.futures = {}
+        self.faces = np.zeros((len(FACES), face_size, face_size, 3), dtype=np.uint8)
+        self.decoded = set()
+        self.failed = 0
+        self.assembly = None
+        # 六个面同时请求
+        self.executor = ThreadPoolExecutor(max_workers=len(FACES), thread_name_prefix="NanoBananaPanorama")
+
+    def submit(self, index, payload, png_bytes):
+        self.captures[index] = png_bytes
+        self.futures[index] = self.executor.submit(pipeline.generate_from_capture, self.api_key, payload)
+
+    def start(self):
+        PanoramaRun.active.append(self)
+        self.executor.shutdown(wait=False)
+        batch.set_status(self.scene_name, f"Panorama: 0/{len(FACES)} faces")
+        bpy.app.timers.register(self.poll, first_interval=POLL_INTERVAL)
+
+    def decode_one(self):
+        """Decode one finished face on the main thread; False when none was ready"""
+        for index, future in self.futures.items():
+            if index in self.decoded or not future.done():
+                continue
+            image_bytes, info = future.result()
+            face = None
+            if image_bytes is not None:
+                face = roi.decode_patch(image_bytes, self.face_size, self.face_size)
+            if face is None:
+                self.failed += 1
+                print(f"⚠️ 立方体面 {FACES[index][0]} 生成失败，使用捕获图: {info['error']}")
+                face = roi.decode_patch(self.captures[index], self.face_size, self.face_size)
+            self.faces[index] = (np.clip(face[..., :3], 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+            self.decoded.add(index)
+            self.captures.pop(index, None)
+            return True
+        return False
+
+    def poll(self):
+        if self.assembly is None:
+            self.decode_one()
+            batch.set_status(self.scene_name, f"Panorama: {len(self.decoded)}/{len(FACES)} faces")
+            if len(self.decoded) < len(FACES):
+                return POLL_INTERVAL
+            width, height = 4 * self.face_size, 2 * self.face_size
+            batch.set_status(self.scene_name, f"Panorama: reprojecting {width}x{height}...")
+            worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="NanoBananaEquirect")
+            self.assembly = worker.submit(write_equirect, self.faces, self.output_path, width, height)
+            worker.shutdown(wait=False)
+            return POLL_INTERVAL
+
+        if not self.assembly.done():
+            return POLL_INTERVAL
+        self.finish()
+        return None
+
+    def finish(self):
+        PanoramaRun.active.remove(self)
+        error = None
+        try:
+            self.assembly.result()
+        except Exception as e:
+            error = f"全景图重投影失败: {e}"
+        self.faces = None
+
+        elapsed = time.time() - self.start_time
+        if error:
+            print(f"❌ {error}")
+            batch.set_status(self.scene_name, f"Panorama failed: {error}")
+        else:
+            print(f"🎉 全景图完成 ({self.failed} 个面失败), {elapsed:.1f}s → {self.output_path}")
+            batch.set_status(self.scene_name, f"Panorama done ({elapsed:.0f}s) → {os.path.basename(self.output_path)}")
+            delivery.submit(('panorama', self.scene_name), self.apply, image_name=PANORAMA_IMAGE_NAME)
+        self.record_history(error, elapsed)
+
+    def apply(self):
+        image = image_pool.load_file(PANORAMA_IMAGE_NAME, self.output_path, image_pool.ROLE_RESULT)
+        scene = bpy.data.scenes.get(self.scene_name)
+        if self.set_world and scene is not None:
+            set_world_texture(scene, image)
+        async_render.show_result(image)
+
+    def record_history(self, error, elapsed):
+        scene = bpy.data.scenes.get(self.scene_name)
+        try:
+            index = history.open_history(os.path.dirname(self.output_path))
+            index.record(
+                blend=bpy.data.filepath,
+                scene=self.scene_name,
+                camera=scene.camera.name if scene is not None and scene.camera else None,
+                frame=scene.frame_current if scene is not None else None,
+                source='panorama',
+                prompt=self.prompt,
+                settings=self.settings,
+                status=history.STATUS_FAILED if error else history.STATUS_DONE,
+                error=error,
+                output_path=None if error else self.output_path,
+                capture_seconds=round(self.capture_seconds, 3),
+                generate_seconds=round(elapsed, 3),
+                bytes_written=None if error else os.path.getsize(self.output_path),
+            )
+        except Exception as e:
+            print(f"⚠️ 写入历史记录失败: {e}")
+
+
+def start_panorama(context):
+    """Capture the six cube faces from the camera position and start generating them
+
+    Returns (run, error); run is None when nothing could be started.
+    """
+    scene = context.scene
+    props = scene.nano_banana
+    location = scene.camera.matrix_world.translation.copy()
+
+    output_dir = get_nano_banana_output_dir(context)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_path = output_manager.unique_path(output_dir, f"AI_Panorama_{timestamp}", ".png")
+    run = PanoramaRun(scene, props.panorama_face_size, output_path, props.panorama_set_world)
+    run.prompt = pipeline.build_image_generation_prompt(scene, props)
+
+    capture_start = time.time()
+    camera = batch.create_turntable_camera(scene, PANORAMA_CAMERA_NAME)
+    try:
+        camera.data.type = 'PERSP'
+        camera.data.sensor_fit = 'AUTO'
+        camera.data.lens_unit = 'FOV'
+        camera.data.angle = math.pi / 2.0
+        camera.data.shift_x = camera.data.shift_y = 0.0
+
+        for index, (name, forward, up) in enumerate(FACES):
+            camera.matrix_world = face_matrix(location, forward, up)
+            png_bytes = pipeline.capture_camera_png(scene, camera=camera)
+            if png_bytes is None:
+                run.executor.shutdown(wait=False, cancel_futures=True)
+                return None, f"Capture of face {name} failed"
+            payload = pipeline.build_generation_payload(
+                props, run.prompt, base64.b64encode(png_bytes).decode('utf-8'),
+                extra_instruction=FACE_INSTRUCTION.format(name=name), aspect_ratio='1:1',
+            )
+            run.submit(index, payload, png_bytes)
+    finally:
+        batch.remove_turntable_camera(camera)
+
+    run.capture_seconds = time.time() - capture_start
+    print(f"🌐 六个立方体面已捕获 ({run.capture_seconds:.1f}s)，正在并发生成")
+    return run, None
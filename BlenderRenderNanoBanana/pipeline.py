@@ -0,0 +1,593 @@
+"""
+UI-free generation pipeline for Nano Banana Renderer
+
+这里的函数不依赖 context.screen / IMAGE_EDITOR 等界面对象，可以在
+`blender -b` 无界面模式下运行。网络相关的函数不访问 bpy，可以安全地
+在工作线程中调用；捕获相关的函数必须在主线程调用。
+"""
+
+import bpy
+import os
+import json
+import math
+import time
+import base64
+import tempfile
+import threading
+
+from . import scene_summary
+
+# 尝试导入requests，如果失败则使用占位符
+try:
+    import requests
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+GEMINI_IMAGE_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image:generateContent?key={api_key}"
+GEMINI_ANALYSIS_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={api_key}"
+GEMINI_ANALYSIS_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:streamGenerateContent?alt=sse&key={api_key}"
+
+REQUEST_TIMEOUT = 120
+
+QUALITY_SPECS = {
+    'LOW': "quick generation, basic quality",
+    'MEDIUM': "balanced quality and detail, photorealistic",
+    'HIGH': "high quality, ultra-detailed, professional photography, 8K resolution"
+}
+
+ASPECT_DESCRIPTIONS = {
+    '1:1': "square composition",
+    '2:3': "vertical portrait composition",
+    '3:2': "horizontal landscape composition",
+    '3:4': "portrait orientation",
+    '4:3': "landscape orientation",
+    '4:5': "portrait format",
+    '5:4': "landscape format",
+    '9:16': "vertical mobile format",
+    '16:9': "widescreen cinematic format",
+    '21:9': "ultra-wide cinematic format"
+}
+
+LIGHTING_DESCRIPTIONS = {
+    'NATURAL': "natural sunlight, soft daylight illumination",
+    'STUDIO': "professional studio lighting, three-point lighting setup",
+    'CINEMATIC': "dramatic cinematic lighting with strong contrast",
+    'GOLDEN_HOUR': "warm golden hour lighting, soft sunset glow",
+    'BLUE_HOUR': "cool blue hour atmosphere, twilight ambiance",
+    'LOW_KEY': "low key lighting, dramatic shadows and highlights",
+    'HIGH_KEY': "high key lighting, bright and evenly illuminated"
+}
+
+ANGLE_DESCRIPTIONS = {
+    'EYE_LEVEL': "eye-level perspective, natural human viewpoint",
+    'LOW_ANGLE': "low angle shot, looking up from below",
+    'HIGH_ANGLE': "high angle shot, looking down from above",
+    'BIRDS_EYE': "bird's eye view, top-down aerial perspective",
+    'WORMS_EYE': "worm's eye view, extreme low angle upward",
+    'CLOSE_UP': "close-up shot, detailed macro perspective",
+    'WIDE_SHOT': "wide shot, expansive environmental view"
+}
+
+SYSTEM_INSTRUCTION = "You are an expert image generation AI. When given a 3D viewport reference image and a text prompt, generate a new enhanced image that transforms the scene according to the prompt. Always return actual image data, not just descriptions."
+
+ANALYSIS_INSTRUCTION = "You are an expert 3D lighting, shading and rendering supervisor. Review the rendered Blender camera view and give concise, actionable advice on lighting, materials, composition and render settings."
+
+
+# ================================
+# Prompt building
+# ================================
+
+def get_scene_context(scene, budget=scene_summary.DEFAULT_BUDGET):
+    """Extract context from a scene (kept up to date incrementally, at most `budget` characters)"""
+    return scene_summary.describe(scene, budget)
+
+
+def apply_prompt_template(main_prompt, props):
+    """Apply style-specific prompt templates"""
+    if props.prompt_style == 'PHOTOREALISTIC':
+        return f"A photorealistic scene of {main_prompt}, captured with professional camera equipment, emphasizing natural lighting and fine details"
+
+    elif props.prompt_style == 'ARTISTIC':
+        return f"A stylized artistic illustration of {main_prompt}, featuring creative interpretation and enhanced visual appeal"
+
+    elif props.prompt_style == 'PRODUCT':
+        return f"A high-resolution, studio-lit product photograph of {main_prompt}, with clean background and professional lighting setup to showcase key features"
+
+    elif props.prompt_style == 'MINIMALIST':
+        return f"A minimalist composition featuring {main_prompt}, with significant negative space, clean lines, and subtle lighting"
+
+    elif props.prompt_style == 'COMIC':
+        return f"A comic book style panel showing {main_prompt}, with bold lines, dynamic composition and vivid colors"
+
+    else:  # CUSTOM
+        return main_prompt
+
+
+def add_technical_details(prompt, props):
+    """Add lighting and camera angle details to prompt"""
+    technical_parts = [prompt]
+
+    # Add lighting style
+    if props.lighting_style != 'AUTO' and props.lighting_style in LIGHTING_DESCRIPTIONS:
+        technical_parts.append(f"Lighting: {LIGHTING_DESCRIPTIONS[props.lighting_style]}")
+
+    # Add camera angle
+    if props.camera_angle != 'AUTO' and props.camera_angle in ANGLE_DESCRIPTIONS:
+        technical_parts.append(f"Camera: {ANGLE_DESCRIPTIONS[props.camera_angle]}")
+
+    return " | ".join(technical_parts)
+
+
+def get_main_prompt(props):
+    """Return the user prompt, preferring image_prompt over the legacy prompt"""
+    main_prompt = props.image_prompt.strip() if props.image_prompt.strip() else props.prompt.strip()
+    if not main_prompt:
+        main_prompt = "generate a high quality image"
+    return main_prompt
+
+
+def build_image_generation_prompt(scene, props, quality=None):
+    """Build comprehensive prompt for AI image generation with enhanced templates
+
+    quality overrides the quality setting (e.g. 'LOW' for quick previews).
+    """
+    quality = quality or props.quality
+    # 1. Get main prompt
+    main_prompt = get_main_prompt(props)
+
+    # 2. Apply prompt style templates
+    enhanced_prompt = apply_prompt_template(main_prompt, props)
+
+    # 3. Add lighting and camera details
+    enhanced_prompt = add_technical_details(enhanced_prompt, props)
+
+    # 4. Add scene context if enabled
+    if props.include_scene_context:
+        scene_info = get_scene_context(scene, getattr(props, 'scene_context_budget', scene_summary.DEFAULT_BUDGET))
+        enhanced_prompt += f" | Scene context: {scene_info}"
+
+    # 5. Add quality specifications
+    if quality in QUALITY_SPECS:
+        enhanced_prompt += f" | Quality: {QUALITY_SPECS[quality]}"
+
+    # 6. Add aspect ratio hint
+    if props.aspect_ratio in ASPECT_DESCRIPTIONS:
+        enhanced_prompt += f" | Composition: {ASPECT_DESCRIPTIONS[props.aspect_ratio]}"
+
+    return enhanced_prompt
+
+
+def build_generation_payload(props, full_prompt, image_data, extra_instruction=None, aspect_ratio=None,
+                             context_image_data=None):
+    """Build the Gemini image generation request body
+
+    image_data is the base64 encoded PNG of the captured view. The returned
+    dict is plain data and can be handed to a worker thread. extra_instruction
+    is appended to the request text and aspect_ratio overrides the setting;
+    context_image_data is sent as a second reference image.
+    """
+    aspect_ratio = aspect_ratio or props.aspect_ratio
+    transform_prompt = props.image_prompt if props.image_prompt.strip() else props.prompt
+
+    payload = {
+        "contents": [{
+            "parts": [
+                {
+                    "text": f"""Based on this 3D viewport image, generate a new enhanced image.
+
+User prompt: {full_prompt}
+
+Please transform this 3D scene into: {transform_prompt}
+
+Style: {props.style_prompt}
+
+Generate a photorealistic image that transforms the reference viewport into the requested style while maintaining the basic composition and camera angle.""" + (f"\n\n{extra_instruction}" if extra_instruction else "")
+                },
+                {
+                    "inline_data": {
+                        "mime_type": "image/png",
+                        "data": image_data
+                    }
+                }
+            ]
+        }],
+        "generationConfig": {
+            "response_modalities": ["Image"],
+            "temperature": 0.8,
+            "candidateCount": 1,
+            "maxOutputTokens": 8192
+        },
+        "systemInstruction": {
+            "parts": [{
+                "text": SYSTEM_INSTRUCTION
+            }]
+        }
+    }
+
+    if context_image_data:
+        payload["contents"][0]["parts"].append({
+            "inline_data": {
+                "mime_type": "image/png",
+                "data": context_image_data
+            }
+        })
+
+    # Add aspect ratio configuration if not default
+    if aspect_ratio != '1:1':
+        payload["generationConfig"]["image_config"] = {"aspect_ratio": aspect_ratio}
+
+    return payload
+
+
+def nearest_aspect_ratio(width, height):
+    """Supported aspect ratio setting closest to width:height"""
+    def ratio(key):
+        a, b = key.split(':')
+        return float(a) / float(b)
+    target = width / float(max(height, 1))
+    return min(ASPECT_DESCRIPTIONS, key=lambda key: abs(math.log(ratio(key) / target)))
+
+
+def build_analysis_payload(props, scene_info, image_data, schema=None):
+    """Build the Gemini analysis request body for the same captured view
+
+    image_data is the (shared) base64 encoded PNG also sent for generation.
+    With a response schema the model answers with JSON matching it.
+    """
+    text = f"""Analyze this Blender render of the current camera view.
+
+Scene: {scene_info}
+Intended result: {get_main_prompt(props)}
+Style: {props.style_prompt}
+
+Give specific suggestions for lighting, materials, composition and render settings that would bring the render closer to the intended result."""
+    if schema is not None:
+        text += "\n\nAnswer with JSON only. Put the written advice in \"advice\" and list concrete changes in \"lights\", \"render\" and \"materials\". Only name objects that appear in the scene description."
+
+    payload = {
+        "contents": [{
+            "parts": [
+                {"text": text},
+                {
+                    "inline_data": {
+                        "mime_type": "image/png",
+                        "data": image_data
+                    }
+                }
+            ]
+        }],
+        "generationConfig": {
+            "temperature": 0.4,
+            "candidateCount": 1,
+            "maxOutputTokens": 2048
+        },
+        "systemInstruction": {
+            "parts": [{
+                "text": ANALYSIS_INSTRUCTION
+            }]
+        }
+    }
+
+    if schema is not None:
+        payload["generationConfig"]["responseMimeType"] = "application/json"
+        payload["generationConfig"]["responseSchema"] = schema
+
+    return payload
+
+
+# ================================
+# Network (thread-safe, no bpy access)
+# ================================
+
+def request_generation(api_key, payload, timeout=REQUEST_TIMEOUT, url=GEMINI_IMAGE_URL):
+    """POST a generateContent request
+
+    Returns (response_dict, error_message). Exactly one of them is None.
+    Safe to call from worker threads.
+    """
+    if not REQUESTS_AVAILABLE:
+        return None, "requests库不可用"
+
+    url = url.format(api_key=api_key)
+    headers = {
+        'Content-Type': 'application/json',
+    }
+
+    try:
+        response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+    except requests.exceptions.Timeout:
+        return None, f"API请求超时（{timeout}秒）"
+    except requests.exceptions.ConnectionError:
+        return None, "网络连接错误"
+    except Exception as e:
+        return None, f"API请求失败: {e}"
+
+    if response.status_code != 200:
+        error_text = response.text[:500] if response.text else "无响应内容"
+        return None, f"Gemini API错误: {response.status_code} - {error_text}"
+
+    try:
+        return response.json(), None
+    except ValueError as e:
+        return None, f"无法解析API响应: {e}"
+
+
+def request_analysis(api_key, payload, timeout=REQUEST_TIMEOUT):
+    """POST an analysis request to the text model; same contract as request_generation"""
+    return request_generation(api_key, payload, timeout=timeout, url=GEMINI_ANALYSIS_URL)
+
+
+def extract_image_bytes(response):
+    """Return the first decoded inlineData image in a Gemini response, or None"""
+    try:
+        for candidate in response.get('candidates') or []:
+            for part in candidate.get('content', {}).get('parts', []):
+                inline_data = part.get('inlineData') if isinstance(part, dict) else None
+                if isinstance(inline_data, dict) and 'data' in inline_data:
+                    return base64.b64decode(inline_data['data'])
+    except Exception as e:
+        print(f"❌ 解码inlineData失败: {e}")
+    return None
+
+
+def extract_text(response):
+    """Return the first text part in a Gemini response, or None"""
+    try:
+        for candidate in response.get('candidates') or []:
+            for part in candidate.get('content', {}).get('parts', []):
+                if isinstance(part, dict) and 'text' in part:
+                    return part['text']
+    except Exception as e:
+        print(f"处理响应文本时出错: {e}")
+    return None
+
+
+def generate_from_capture(api_key, payload, timeout=REQUEST_TIMEOUT):
+    """Run one generation request and return (image_bytes, info)
+
+    info holds 'elapsed', 'error' and the raw 'response' (None on network
+    errors) so callers can log or dump it. Safe to call from worker threads.
+    """
+    start = time.time()
+    response, error = request_generation(api_key, payload, timeout=timeout)
+    info = {'elapsed': time.time() - start, 'error': error, 'response': response}
+
+    if response is None:
+        return None, info
+
+    image_bytes = extract_image_bytes(response)
+    if image_bytes is None:
+        info['error'] = "API响应中没有图像数据"
+    return image_bytes, info
+
+
+def analyze_capture(api_key, payload, timeout=REQUEST_TIMEOUT):
+    """Run one analysis request and return (analysis_text, info)
+
+    info has the same keys as for generate_from_capture. Safe to call from
+    worker threads.
+    """
+    start = time.time()
+    response, error = request_analysis(api_key, payload, timeout=timeout)
+    info = {'elapsed': time.time() - start, 'error': error, 'response': response}
+
+    if response is None:
+        return None, info
+
+    text = extract_text(response)
+    if not text:
+        info['error'] = "API响应中没有分析文本"
+    return text, info
+
+
+def _event_text(event):
+    """All text parts of one streamed response chunk joined together"""
+    texts = []
+    for candidate in event.get('candidates') or []:
+        for part in candidate.get('content', {}).get('parts', []):
+            if isinstance(part, dict) and isinstance(part.get('text'), str):
+                texts.append(part['text'])
+    return "".join(texts)
+
+
+def stream_analysis(api_key, payload, on_text, cancelled=None, timeout=REQUEST_TIMEOUT):
+    """Run one analysis request on the streaming endpoint; returns (analysis_text, info)
+
+    on_text(chunk) is called with every piece of text as soon as it
+    arrives, cancelled() is polled between chunks. info has the keys of
+    analyze_capture plus 'first_text' (seconds until the first piece);
+    'response' is the last chunk, which carries finishReason and usage.
+    Safe to call from worker threads (on_text runs on the calling thread).
+    """
+    start = time.time()
+    info = {'elapsed': 0.0, 'error': None, 'response': None, 'first_text': None}
+    if not REQUESTS_AVAILABLE:
+        info['error'] = "requests库不可用"
+        return None, info
+
+    url = GEMINI_ANALYSIS_STREAM_URL.format(api_key=api_key)
+    headers = {
+        'Content-Type': 'application/json',
+    }
+
+    chunks = []
+    try:
+        with requests.post(url, headers=headers, json=payload, timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                error_text = response.text[:500] if response.text else "无响应内容"
+                info['error'] = f"Gemini API错误: {response.status_code} - {error_text}"
+            else:
+                # text/event-stream 没有声明编码，requests 会按 ISO-8859-1 解码
+                response.encoding = 'utf-8'
+                for line in response.iter_lines(decode_unicode=True):
+                    if cancelled is not None and cancelled():
+                        info['error'] = "分析已取消"
+                        break
+                    if not line or not line.startswith("data:"):
+                        continue
+                    try:
+                        event = json.loads(line[5:])
+                    except ValueError:
+                        continue
+                    if 'error' in event:
+                        info['error'] = f"Gemini API错误: {event['error'].get('message', event['error'])}"
+                        break
+                    info['response'] = event
+                    text = _event_text(event)
+                    if text:
+                        if info['first_text'] is None:
+                            info['first_text'] = time.time() - start
+                        chunks.append(text)
+                        on_text(text)
+    except requests.exceptions.Timeout:
+        info['error'] = f"API请求超时（{timeout}秒）"
+    except requests.exceptions.ConnectionError:
+        info['error'] = "网络连接错误"
+    except Exception as e:
+        info['error'] = f"API请求失败: {e}"
+
+    info['elapsed'] = time.time() - start
+    if info['error'] is not None:
+        return None, info
+
+    text = "".join(chunks)
+    if not text:
+        info['error'] = "API响应中没有分析文本"
+        return None, info
+    return text, info
+
+
+def generate_to_file(api_key, payload, path, timeout=REQUEST_TIMEOUT):
+    """Run one generation and write the returned image bytes to path
+
+    Returns (path, info); path is None on failure. Safe to call from worker
+    threads.
+    """
+    image_bytes, info = generate_from_capture(api_key, payload, timeout=timeout)
+    if image_bytes is None:
+        return None, info
+
+    try:
+        with open(path, 'wb') as f:
+            f.write(image_bytes)
+    except OSError as e:
+        info['error'] = f"保存失败: {e}"
+        return None, info
+
+    info['bytes'] = len(image_bytes)
+    return path, info
+
+
+# ================================
+# Capture (main thread only)
+# ================================
+
+def set_fast_engine(scene):
+    """Switch Cycles scenes to EEVEE for a quick capture"""
+    if scene.render.engine != 'CYCLES':
+        return
+    for engine in ('BLENDER_EEVEE', 'BLENDER_EEVEE_NEXT'):
+        try:
+            scene.render.engine = engine
+            return
+        except TypeError:
+            continue
+
+
+def capture_temp_path():
+    """Temporary PNG path for one capture (unique per process and thread)"""
+    return os.path.join(
+        tempfile.gettempdir(),
+        f"nano_banana_capture_{os.getpid()}_{threading.get_ident()}.png"
+    )
+
+
+def apply_capture_settings(scene, temp_file, resolution=512, samples=None):
+    """Set up a quick square PNG render to temp_file; returns the settings to restore
+
+    samples caps the EEVEE render samples (draft captures).
+    """
+    render = scene.render
+    saved = {
+        'resolution_x': render.resolution_x,
+        'resolution_y': render.resolution_y,
+        'resolution_percentage': render.resolution_percentage,
+        'filepath': render.filepath,
+        'file_format': render.image_settings.file_format,
+        'engine': render.engine,
+        'eevee_samples': scene.eevee.taa_render_samples,
+    }
+
+    render.resolution_x = resolution
+    render.resolution_y = resolution
+    render.resolution_percentage = 100
+    set_fast_engine(scene)
+    if samples is not None:
+        scene.eevee.taa_render_samples = min(samples, saved['eevee_samples'])
+
+    render.filepath = temp_file
+    render.image_settings.file_format = 'PNG'
+    return saved
+
+
+def restore_capture_settings(scene, saved):
+    render = scene.render
+    render.resolution_x = saved['resolution_x']
+    render.resolution_y = saved['resolution_y']
+    render.resolution_percentage = saved['resolution_percentage']
+    render.filepath = saved['filepath']
+    render.image_settings.file_format = saved['file_format']
+    render.engine = saved['engine']
+    scene.eevee.taa_render_samples = saved['eevee_samples']
+
+
+def capture_camera_png(scene, camera=None, frame=None, resolution=512, samples=None):
+    """Render a camera of the scene and return the encoded PNG bytes
+
+    Uses the normal render pipeline writing to a temporary file, so it works
+    in background mode. Render settings, the active camera and the current
+    frame are restored afterwards. Returns None on failure.
+    """
+    original_camera = scene.camera
+    original_frame = scene.frame_current
+    saved = None
+
+    temp_file = capture_temp_path()
+
+    try:
+        # 先切换帧再指定摄像机：绑定了摄像机的时间线标记会在切换帧时改写 scene.camera
+        if frame is not None and frame != scene.frame_current:
+            scene.frame_set(frame)
+        if camera is not None:
+            scene.camera = camera
+        if not scene.camera:
+            print("❌ 没有活动摄像机")
+            return None
+
+        saved = apply_capture_settings(scene, temp_file, resolution, samples)
+
+        bpy.ops.render.render(write_still=True, scene=scene.name)
+
+        if not os.path.exists(temp_file):
+            print("❌ 捕获失败: 临时文件未创建")
+            return None
+
+        with open(temp_file, 'rb') as f:
+            return f.read()
+
+    except Exception as e:
+        print(f"❌ 捕获过程中出错: {e}")
+        return None
+
+    finally:
+        if saved is not None:
+            restore_capture_settings(scene, saved)
+        scene.camera = original_camera
+        if scene.frame_current != original_frame:
+            scene.frame_set(original_frame)
+        try:
+            if os.path.exists(temp_file):
+                os.unlink(temp_file)
+        except OSError:
+            pass
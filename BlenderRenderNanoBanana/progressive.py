@@ -0,0 +1,164 @@
+"""
+Progressive preview for Nano Banana Renderer
+
+HIGH 质量的生成要等很久才知道构图对不对。渐进模式在捕获之后同时发出
+两个请求：
+
+- 预览：捕获图缩小到 256，提示词使用 LOW 质量，通常很快返回，立即显示
+  在 NanoBanana_Render 中；预览不写入输出目录和历史记录；
+- 完整请求：与普通非阻塞生成相同（AsyncGeneration），返回后替换预览。
+
+完整结果先到时迟到的预览被丢弃。两个请求可以分别取消。
+"""
+
+import bpy
+import time
+import base64
+from concurrent.futures import ThreadPoolExecutor
+
+from . import batch
+from . import pipeline
+from . import delivery
+from . import image_pool
+from . import async_render
+
+PREVIEW_RESOLUTION = 256
+PREVIEW_QUALITY = 'LOW'
+PREVIEW_IMAGE_NAME = "NanoBanana_Preview_Capture"
+
+POLL_INTERVAL = 0.1
+
+TARGET_PREVIEW = 'PREVIEW'
+TARGET_FULL = 'FULL'
+
+# 每个场景正在进行的预览和完整请求
+_runs = {}
+
+
+def downscale_png(data, size=PREVIEW_RESOLUTION):
+    """Encoded image bytes scaled so the longer side is `size`, as PNG bytes (None on failure)"""
+    image = bpy.data.images.new(PREVIEW_IMAGE_NAME, width=8, height=8)
+    try:
+        image.pack(data=data, data_len=len(data))
+        image.source = 'FILE'
+        image.reload()
+        width, height = image.size
+        if width == 0 or height == 0:
+            return None
+        scale = size / float(max(width, height))
+        if scale < 1.0:
+            image.scale(max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+            image.file_format = 'PNG'
+            # 重新打包缩小后的像素
+            image.pack()
+        return bytes(image.packed_file.data)
+    finally:
+        bpy.data.images.remove(image)
+
+
+class PreviewRequest:
+    """A quick low quality request shown until the full result arrives"""
+
+    def __init__(self, scene, png_bytes):
+        props = scene.nano_banana
+        self.scene_name = scene.name
+        self.cancelled = False
+        self.running = True
+        self.start_time = time.time()
+        self.full = None
+
+        prompt = pipeline.build_image_generation_prompt(scene, props, quality=PREVIEW_QUALITY)
+        payload = pipeline.build_generation_payload(props, prompt, base64.b64encode(png_bytes).decode('utf-8'))
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="NanoBananaPreview")
+        self.future = executor.submit(pipeline.generate_from_capture, props.api_key, payload)
+        executor.shutdown(wait=False)
+
+    def start(self):
+        bpy.app.timers.register(self.poll, first_interval=POLL_INTERVAL)
+
+    def cancel(self):
+        self.cancelled = True
+        self.future.cancel()
+
+    def poll(self):
+        if not self.cancelled and not self.future.done():
+            return POLL_INTERVAL
+        self.running = False
+        # 面板上的取消按钮
+        delivery.request_redraw('PROPERTIES', 'VIEW_3D')
+
+        if self.cancelled:
+            print("⏹️ 预览请求已取消")
+            return None
+        image_bytes, info = self.future.result()
+        if image_bytes is None:
+            print(f"⚠️ 预览生成失败: {info['error']}")
+            return None
+        if self.full is not None and self.full.succeeded:
+            print("⏭️ 完整结果已先到，丢弃预览")
+            return None
+
+        def apply():
+            async_render.show_result(image_pool.load_image_from_memory(image_pool.RENDER_IMAGE_NAME, image_bytes))
+
+        # 与完整结果同一个键：还没显示的预览会被完整结果替换
+        delivery.submit(('async_render', self.scene_name), apply, image_name=image_pool.RENDER_IMAGE_NAME)
+        print(f"👀 预览已显示 ({info['elapsed']:.1f}s)，完整结果生成中...")
+        batch.set_status(self.scene_name, f"Preview shown ({info['elapsed']:.1f}s), full render generating...")
+        return None
+
+
+def start(scene, png_bytes, capture_seconds):
+    """Send the preview and the full request for one capture"""
+    previous = _runs.get(scene.name)
+    if previous is not None and previous['preview'] is not None and previous['preview'].running:
+        # 旧的预览已经没有意义
+        previous['preview'].cancel()
+
+    preview = None
+    preview_bytes = downscale_png(png_bytes)
+    if preview_bytes is None:
+        print("⚠️ 无法缩小捕获图，跳过预览")
+    else:
+        preview = PreviewRequest(scene, preview_bytes)
+
+    full = async_render.AsyncGeneration(scene, png_bytes, capture_seconds)
+    full.start()
+    if preview is not None:
+        preview.full = full
+        preview.start()
+    _runs[scene.name] = {'preview': preview, 'full': full}
+    print(f"🚀 渐进生成: 预览 ({PREVIEW_RESOLUTION}px, {PREVIEW_QUALITY}) 和完整请求已同时发出")
+
+
+def running(scene_name):
+    """Set of targets (PREVIEW / FULL) still running for a scene"""
+    run = _runs.get(scene_name)
+    if run is None:
+        return set()
+    targets = set()
+    if run['preview'] is not None and run['preview'].running and not run['preview'].cancelled:
+        targets.add(TARGET_PREVIEW)
+    if run['full'] in async_render.AsyncGeneration.active and not run['full'].cancelled:
+        targets.add(TARGET_FULL)
+    if not targets:
+        del _runs[scene_name]
+    return targets
+
+
+def cancel(scene_name, target):
+    """Cancel the preview or the full request; returns False when it was not running"""
+    if target not in running(scene_name):
+        return False
+    run = _runs[scene_name]
+    run['preview' if target == TARGET_PREVIEW else 'full'].cancel()
+    delivery.request_redraw('PROPERTIES', 'VIEW_3D')
+    return True
+
+
+def unregister():
+    for run in _runs.values():
+        for request in run.values():
+            if request is not None:
+                request.cancel()
+    _runs.clear()
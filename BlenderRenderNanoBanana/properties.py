@@ -5,7 +5,7 @@ Properties for Nano Banana Renderer
 import bpy
 import os
 from bpy.types import PropertyGroup
-from bpy.props import StringProperty, IntProperty, FloatProperty, BoolProperty, EnumProperty
+from bpy.props import StringProperty, IntProperty, FloatProperty, BoolProperty, EnumProperty, PointerProperty
 
 def get_config_file_path():
     """Get path to config file for storing API key"""
@@ -52,6 +52,20 @@ def update_api_key(self, context):
     if self.api_key:
         save_api_key(self.api_key)
 
+def update_live_preview(self, context):
+    """Start or stop the AI live preview of this scene"""
+    from . import live_preview
+    live_preview.set_enabled(self.id_data, self.live_preview)
+
+def update_live_input(self, context):
+    """Regenerate the live preview when a prompt setting changes"""
+    from . import live_preview
+    live_preview.notify_change(self.id_data)
+
+def update_history_filter(self, context):
+    """Go back to the first history page when the search changes"""
+    self.history_page = 0
+
 class NanoBananaProperties(PropertyGroup):
     # AI Service Selection
     ai_service: EnumProperty(
@@ -65,6 +79,72 @@ class NanoBananaProperties(PropertyGroup):
         default='IMAGE_TO_IMAGE'
     )
     
+    non_blocking_capture: BoolProperty(
+        name="Non-blocking Capture",
+        description="Show the normal progressive render while capturing and keep the UI responsive; the AI request starts as soon as the render completes",
+        default=False
+    )
+    
+    progressive_preview: BoolProperty(
+        name="Progressive Preview",
+        description="Also send a small, fast low quality request and show it right away; the full result replaces it when it arrives",
+        default=False
+    )
+    
+    live_preview: BoolProperty(
+        name="AI Live Preview",
+        description="Regenerate a draft AI image automatically when the scene or prompt changes (debounced and rate limited)",
+        default=False,
+        update=update_live_preview
+    )
+    
+    live_debounce: FloatProperty(
+        name="Debounce",
+        description="Seconds without changes before a live preview request is sent",
+        default=1.5,
+        min=0.2,
+        max=30.0
+    )
+    
+    live_max_per_minute: IntProperty(
+        name="Max Requests / Minute",
+        description="Upper limit for live preview requests in any 60 second window",
+        default=4,
+        min=1,
+        max=30
+    )
+    
+    roi_margin: FloatProperty(
+        name="Region Margin",
+        description="Context added around the region, as a fraction of the frame width; the blend is feathered across it",
+        default=0.05,
+        min=0.0,
+        max=0.25,
+        subtype='FACTOR'
+    )
+    
+    roi_mask: PointerProperty(
+        name="Region Mask",
+        description="Mask image painted over the last AI render (white = regenerate), used instead of the render border",
+        type=bpy.types.Image
+    )
+    
+    improved_render_budget: FloatProperty(
+        name="Improved Render Budget",
+        description="Seconds the improved render after applying AI fixes may take (samples and resolution are calibrated by a quick probe render)",
+        default=30.0,
+        min=2.0,
+        max=3600.0,
+        subtype='TIME_ABSOLUTE'
+    )
+    
+    last_analysis_fingerprint: StringProperty(
+        name="Last Analysis",
+        description="Scene fingerprint of the last analysis (key of its cached fix plan)",
+        default="",
+        options={'HIDDEN'}
+    )
+    
     # API Settings
     api_key: StringProperty(
         name="Gemini API Key",
@@ -79,7 +159,8 @@ class NanoBananaProperties(PropertyGroup):
         name="Image Prompt",
         description="Describe what you want to generate or transform",
         default="modern architectural building, photorealistic, high quality",
-        maxlen=2048
+        maxlen=2048,
+        update=update_live_input
     )
     
     # Image Generation API Settings
@@ -106,14 +187,16 @@ class NanoBananaProperties(PropertyGroup):
         name="Render Prompt",
         description="Text prompt to guide the AI rendering",
         default="photorealistic render, high quality, detailed",
-        maxlen=1024
+        maxlen=1024,
+        update=update_live_input
     )
     
     style_prompt: StringProperty(
         name="Style Prompt",
         description="Additional style guidance for the rendering",
         default="cinematic lighting, professional photography",
-        maxlen=512
+        maxlen=512,
+        update=update_live_input
     )
     
     # Aspect Ratio Settings (Google Gemini 2.5 Flash Image API)
@@ -132,7 +215,8 @@ class NanoBananaProperties(PropertyGroup):
             ('16:9', "Widescreen (16:9)", "1344x768 - Video/cinematic format"),
             ('21:9', "Ultra-wide (21:9)", "1536x672 - Cinematic ultra-wide"),
         ],
-        default='1:1'
+        default='1:1',
+        update=update_live_input
     )
     
     # Prompt Enhancement Settings
@@ -147,7 +231,8 @@ class NanoBananaProperties(PropertyGroup):
             ('MINIMALIST', "Minimalist", "Clean, minimal design"),
             ('COMIC', "Comic/Sequential", "Comic book and storyboard style"),
         ],
-        default='CUSTOM'
+        default='CUSTOM',
+        update=update_live_input
     )
     
     # Enhanced Prompt Details
@@ -164,7 +249,8 @@ class NanoBananaProperties(PropertyGroup):
             ('LOW_KEY', "Low Key", "Dark, moody lighting with shadows"),
             ('HIGH_KEY', "High Key", "Bright, evenly lit scene"),
         ],
-        default='AUTO'
+        default='AUTO',
+        update=update_live_input
     )
     
     camera_angle: EnumProperty(
@@ -180,7 +266,8 @@ class NanoBananaProperties(PropertyGroup):
             ('CLOSE_UP', "Close-up", "Detailed close-up shot"),
             ('WIDE_SHOT', "Wide Shot", "Expansive environmental view"),
         ],
-        default='AUTO'
+        default='AUTO',
+        update=update_live_input
     )
     
     # Image Settings (kept for compatibility but aspect_ratio takes precedence)
@@ -250,9 +337,163 @@ class NanoBananaProperties(PropertyGroup):
         default=True
     )
     
+    scene_context_budget: IntProperty(
+        name="Scene Context Budget",
+        description="Maximum number of characters the scene description adds to the prompt",
+        default=400,
+        min=60,
+        max=4000
+    )
+    
+    # Output Settings
+    save_artifacts: EnumProperty(
+        name="Save Artifacts",
+        description="Files written to the NanoBanana folder for every generation",
+        items=[
+            ('INPUT', "Input", "The captured camera image sent to the API"),
+            ('RESULT', "Result", "The generated image, saved as returned by the API"),
+            ('DEBUG', "Debug", "A compact, compressed dump of the API response"),
+        ],
+        options={'ENUM_FLAG'},
+        default={'INPUT', 'RESULT', 'DEBUG'}
+    )
+    
+    debug_level: EnumProperty(
+        name="Debug Level",
+        description="Which API responses are dumped when Debug artifacts are saved",
+        items=[
+            ('ERRORS', "Errors", "Only responses that contain no image"),
+            ('ALL', "All", "Every response (images replaced by size and hash)"),
+            ('PAYLOADS', "All + Payloads", "Every response, binary payloads stored once in .artifacts/"),
+        ],
+        default='ERRORS'
+    )
+    
+    fsync_outputs: BoolProperty(
+        name="Sync Writes to Disk",
+        description="fsync every saved file before it counts as written (safer on network storage, slower)",
+        default=False
+    )
+    
+    # Batch Settings
+    batch_source: EnumProperty(
+        name="Shots",
+        description="Which views the batch generates",
+        items=[
+            ('ALL_CAMERAS', "All Cameras", "Every camera in the scene at the current frame"),
+            ('SELECTED_CAMERAS', "Selected Cameras", "Selected camera objects at the current frame"),
+            ('MARKERS', "Marker Bindings", "Every timeline marker bound to a camera, at the marker's frame"),
+            ('NONE', "Turntable Only", "Only the turntable views"),
+        ],
+        default='ALL_CAMERAS'
+    )
+    
+    batch_turntable_views: IntProperty(
+        name="Turntable Views",
+        description="Number of extra views orbiting the turntable target (0 to disable)",
+        default=0,
+        min=0,
+        max=64
+    )
+    
+    batch_turntable_target: PointerProperty(
+        name="Turntable Target",
+        description="Object the turntable views orbit around (defaults to the world origin)",
+        type=bpy.types.Object
+    )
+    
+    batch_concurrency: IntProperty(
+        name="Concurrent Requests",
+        description="Number of generation requests running at the same time",
+        default=4,
+        min=1,
+        max=16
+    )
+    
+    tiled_long_side: IntProperty(
+        name="Tiled Resolution",
+        description="Longer side of the tiled high-resolution result in pixels (the camera aspect is kept)",
+        default=3840,
+        min=1024,
+        max=16384
+    )
+    
+    tile_size: IntProperty(
+        name="Tile Size",
+        description="Size of each generated tile in pixels",
+        default=1024,
+        min=256,
+        max=2048
+    )
+    
+    tile_overlap: IntProperty(
+        name="Tile Overlap",
+        description="Pixels shared by neighbouring tiles; seams are blended across this overlap",
+        default=128,
+        min=16,
+        max=1024
+    )
+    
+    panorama_face_size: IntProperty(
+        name="Face Size",
+        description="Size of each cube face; the equirectangular result is 4x wide and 2x high",
+        default=1024,
+        min=256,
+        max=2048
+    )
+    
+    panorama_set_world: BoolProperty(
+        name="Use as World",
+        description="Use the finished panorama as the world's environment texture",
+        default=True
+    )
+    
+    # History Browser
+    history_filter: StringProperty(
+        name="Search History",
+        description="Only show generations whose prompt contains these words",
+        default="",
+        update=update_history_filter
+    )
+    
+    history_page: IntProperty(
+        name="History Page",
+        description="Page of the generation history being shown",
+        default=0,
+        min=0
+    )
+    
+    # Retention Settings
+    retention_enabled: BoolProperty(
+        name="Clean Up Old Outputs",
+        description="Periodically delete old generated files from the NanoBanana folder (pinned and referenced files are kept)",
+        default=False
+    )
+    
+    retention_max_age_days: IntProperty(
+        name="Max Age (Days)",
+        description="Delete outputs older than this many days (0 = no limit)",
+        default=30,
+        min=0
+    )
+    
+    retention_max_count: IntProperty(
+        name="Max Files",
+        description="Keep at most this many output files, newest first (0 = no limit)",
+        default=0,
+        min=0
+    )
+    
+    retention_max_size_mb: FloatProperty(
+        name="Max Size (MB)",
+        description="Keep the output files below this total size, newest first (0 = no limit)",
+        default=2048.0,
+        min=0.0
+    )
+    
     # UI Settings
     show_advanced: BoolProperty(
         name="Show Advanced",
         description="Show advanced settings",
         default=False
-    )
\ No newline at end of file
+    )
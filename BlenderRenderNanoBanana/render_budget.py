@@ -0,0 +1,210 @@
+"""
+Time-budgeted improved render for Nano Banana Renderer
+
+应用分析建议后的"改进渲染"不再固定使用 256 采样，而是在给定的时间预算
+内完成：
+
+1. 以 25% 分辨率先渲染一次预热图（着色器编译和场景同步，不计时），
+   再用两种采样数各渲染一次探测图，拟合
+   渲染时间 ≈ 固定开销 + 单位成本 × 采样数 × 像素数；
+   斜率不为正或小得不合理时拟合作废，改用保守设置（最低采样数、最低分辨率）；
+2. 用剩余预算（扣除探测时间并留出余量）从高到低尝试分辨率百分比，
+   选出满足最低采样数的最高分辨率，以及对应的采样数和自适应采样阈值；
+3. 最终渲染（Cycles 还会设置 time_limit 作为硬上限），结束后恢复
+   原来的分辨率、采样和输出路径设置。
+"""
+
+import bpy
+import os
+import time
+import tempfile
+from datetime import datetime
+
+from . import disk_writer
+from . import image_pool
+from .output_manager import unique_path
+
+PROBE_PERCENTAGE = 25
+PROBE_SAMPLES = (4, 16)
+
+# 只使用预算的这一部分，给场景同步和保存留出余量
+SAFETY = 0.85
+
+RESOLUTION_STEPS = (100, 75, 50, 25)
+MIN_SAMPLES = {'CYCLES': 32, 'EEVEE': 8}
+MAX_SAMPLES = {'CYCLES': 4096, 'EEVEE': 256}
+
+# 每采样每百万像素低于此秒数的拟合视为测量噪声
+MIN_COST = 1e-4
+
+
+def engine_family(scene):
+    """'CYCLES', 'EEVEE' or None for engines without samples"""
+    if scene.render.engine == 'CYCLES':
+        return 'CYCLES'
+    if scene.render.engine.startswith('BLENDER_EEVEE'):
+        return 'EEVEE'
+    return None
+
+
+def _get_samples(scene, family):
+    return scene.cycles.samples if family == 'CYCLES' else scene.eevee.taa_render_samples
+
+
+def _set_samples(scene, family, samples):
+    if family == 'CYCLES':
+        scene.cycles.samples = samples
+    else:
+        scene.eevee.taa_render_samples = samples
+
+
+def megapixels(scene, percentage):
+    scale = percentage / 100.0
+    return scene.render.resolution_x * scale * scene.render.resolution_y * scale / 1e6
+
+
+def adaptive_threshold(samples):
+    """Noise threshold matching a sample count (fewer samples stop earlier)"""
+    return round(min(0.1, max(0.005, 0.01 * (1024.0 / max(samples, 1)) ** 0.5)), 4)
+
+
+def conservative_settings(family):
+    """(percentage, samples, threshold) used when the probe fit can't be trusted"""
+    samples = MIN_SAMPLES[family]
+    return RESOLUTION_STEPS[-1], samples, adaptive_threshold(samples)
+
+
+def plan_settings(overhead, cost, budget, full_megapixels, family):
+    """(percentage, samples, threshold) expected to render in `budget` seconds
+
+    cost is seconds per sample per megapixel, overhead seconds per render.
+    """
+    available = budget * SAFETY - overhead
+    for percentage in RESOLUTION_STEPS:
+        pixels = full_megapixels * (percentage / 100.0) ** 2
+        samples = int(available / (cost * pixels)) if available > 0 and pixels > 0 else 0
+        if samples >= MIN_SAMPLES[family]:
+            samples = min(samples, MAX_SAMPLES[family])
+            return percentage, samples, adaptive_threshold(samples)
+    return conservative_settings(family)
+
+
+def _timed_render(scene, filepath=None):
+    if filepath:
+        scene.render.filepath = filepath
+    start = time.time()
+    bpy.ops.render.render(write_still=bool(filepath))
+    return time.time() - start
+
+
+def calibrate(scene, family):
+    """(overhead, cost) fitted from two quick probe renders, or None if the fit is unusable"""
+    scene.render.resolution_percentage = PROBE_PERCENTAGE
+    # 预热：第一次渲染包含着色器编译和场景同步，不参与拟合
+    _set_samples(scene, family, PROBE_SAMPLES[0])
+    _timed_render(scene)
+
+    timings = []
+    for samples in PROBE_SAMPLES:
+        _set_samples(scene, family, samples)
+        timings.append(_timed_render(scene))
+
+    pixels = megapixels(scene, PROBE_PERCENTAGE)
+    (low, high), (t_low, t_high) = PROBE_SAMPLES, timings
+    cost = (t_high - t_low) / ((high - low) * pixels) if pixels > 0 else 0.0
+    if cost < MIN_COST:
+        print(f"⚠️ 探测渲染: {t_low:.2f}s / {t_high:.2f}s 无法拟合，使用保守设置")
+        return None
+    overhead = max(t_low - cost * low * pixels, 0.0)
+    print(f"⏱️ 探测渲染: {t_low:.2f}s / {t_high:.2f}s → 开销 {overhead:.2f}s, "
+          f"{cost * 1000:.2f}ms/采样/百万像素")
+    return overhead, cost
+
+
+def render_within_budget(scene, budget, filepath):
+    """Render the scene to filepath in about `budget` seconds; returns the chosen settings"""
+    render = scene.render
+    family = engine_family(scene)
+    saved = {
+        'percentage': render.resolution_percentage,
+        'filepath': render.filepath,
+    }
+    if family is not None:
+        saved['samples'] = _get_samples(scene, family)
+    if family == 'CYCLES':
+        saved['adaptive'] = (scene.cycles.use_adaptive_sampling, scene.cycles.adaptive_threshold)
+        saved['time_limit'] = scene.cycles.time_limit
+
+    result = {'engine': render.engine, 'budget': budget}
+    try:
+        start = time.time()
+        if family is None:
+            # 没有采样设置的引擎（如Workbench）直接渲染
+            result['render_seconds'] = _timed_render(scene, filepath)
+            return result
+
+        full = megapixels(scene, saved['percentage'])
+        fit = calibrate(scene, family)
+        result['probe_seconds'] = time.time() - start
+
+        remaining = max(budget - result['probe_seconds'], 0.0)
+        if fit is None:
+            overhead, cost = 0.0, None
+            percentage, samples, threshold = conservative_settings(family)
+        else:
+            overhead, cost = fit
+            percentage, samples, threshold = plan_settings(overhead, cost, remaining, full, family)
+        # 百分比不超过用户原来的设置
+        percentage = min(percentage, saved['percentage'])
+        render.resolution_percentage = percentage
+        _set_samples(scene, family, samples)
+        if family == 'CYCLES':
+            scene.cycles.use_adaptive_sampling = True
+            scene.cycles.adaptive_threshold = threshold
+            scene.cycles.time_limit = max(remaining * SAFETY - overhead, 1.0)
+
+        print(f"🎯 预算 {budget:.0f}s: {percentage}% 分辨率, {samples} 采样"
+              + (f", 阈值 {threshold}" if family == 'CYCLES' else ""))
+        result.update(percentage=percentage, samples=samples)
+        if cost is not None:
+            result['predicted_seconds'] = overhead + cost * samples * megapixels(scene, percentage)
+        else:
+            result['conservative'] = True
+        if family == 'CYCLES':
+            result['threshold'] = threshold
+
+        result['render_seconds'] = _timed_render(scene, filepath)
+        print(f"✅ 改进渲染用时 {result['render_seconds']:.1f}s (总计 {time.time() - start:.1f}s)")
+        return result
+
+    finally:
+        render.resolution_percentage = saved['percentage']
+        render.filepath = saved['filepath']
+        if 'samples' in saved:
+            _set_samples(scene, family, saved['samples'])
+        if family == 'CYCLES':
+            scene.cycles.use_adaptive_sampling, scene.cycles.adaptive_threshold = saved['adaptive']
+            scene.cycles.time_limit = saved['time_limit']
+
+
+def render_improved(scene, budget, output_dir, fsync=False):
+    """Budgeted render shown in the Improved image and saved to output_dir
+
+    Returns (image, saved_path, settings); image is None when nothing was rendered.
+    """
+    temp_path = os.path.join(tempfile.gettempdir(), f"nano_banana_improved_{os.getpid()}.png")
+    settings = render_within_budget(scene, budget, temp_path)
+    if not os.path.exists(temp_path):
+        return None, None, settings
+
+    try:
+        with open(temp_path, 'rb') as f:
+            data = f.read()
+    finally:
+        os.unlink(temp_path)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    saved_path = unique_path(output_dir, f"Improved_Render_{timestamp}", ".png")
+    disk_writer.submit(saved_path, data, fsync)
+    image = image_pool.load_image_from_memory(image_pool.IMPROVED_IMAGE_NAME, data, saved_path)
+    return image, saved_path, settings
@@ -0,0 +1,353 @@
+"""
+Retention policy for the Nano Banana output folder
+
+输出目录中的输入图、结果图和调试文件会一直累积。这里按三种上限清理旧
+文件（0 表示不限制）：
+
+- 最长保留天数；
+- 最多保留的文件数；
+- 总大小上限。
+
+最新的文件优先保留。以下文件永远不会被删除：在历史面板中固定(Pin)的
+记录、当前 .blend 中任何图像引用的文件、还在后台写入队列中的文件。
+history.sqlite 和 .thumbnails/ 不在清理范围内。
+
+批量生成的 Batch_* 子目录作为一个整体参与清理：它算作一项，时间取其中
+最新的文件，大小为所有文件之和。目录中有被保护的文件，或者还没有写入
+batch.json（批处理仍在运行）时，整个目录保留。
+调试转储保存的二进制内容（.artifacts/）在没有任何留下的转储引用它时
+删除；刚写入的内容（BLOB_GRACE 内）保留，它的转储可能还在写入队列中。
+后台写入的临时文件（<文件名>.tmp）在对应文件还在写入队列中时同样保留。
+删除文件后，历史记录中指向它的路径会被清空，历史面板不会显示或打开
+已经不存在的文件。
+
+清理通过 bpy.app.timers 增量进行：每次定时器回调只扫描/删除一小段时间，
+不会卡住界面。
+"""
+
+import bpy
+import os
+import time
+
+from . import history
+from . import debug_dump
+from . import disk_writer
+from . import history_browser
+from .output_manager import format_bytes
+from .properties import get_nano_banana_output_dir
+
+# 受保留策略管理的文件名前缀（包括旧版本生成的文件）
+MANAGED_PREFIXES = (
+    "nano_banana_INPUT_",
+    "nano_banana_RESULT_",
+    "AI_Generated_",
+    "Generated_Image_",
+    "Debug_Response_",
+    "Improved_Render_",
+    "AI_Tiled_",
+    "AI_Panorama_",
+)
+
+# 作为一个整体清理的批处理目录
+BATCH_DIR_PREFIX = "Batch_"
+BATCH_MANIFEST = "batch.json"
+
+# 两次自动清理之间的间隔(秒)
+RUN_INTERVAL = 15 * 60
+# 每次定时器回调最多用于扫描/删除的时间(秒)
+STEP_BUDGET = 0.02
+STEP_INTERVAL = 0.1
+IDLE_INTERVAL = 60.0
+
+# 比这更新的 .artifacts/ 内容不会被回收(秒)
+BLOB_GRACE = 60 * 60
+
+_state = {'run': None, 'last_run': 0.0}
+
+
+def plan_deletions(entries, protected, now, max_age_days=0, max_count=0, max_bytes=0):
+    """Paths to delete from entries [(mtime, size, path)], newest kept first
+
+    Protected paths are never deleted but still count towards the
+    count and size limits.
+    """
+    kept_count = 0
+    kept_bytes = 0
+    deletions = []
+    for mtime, size, path in sorted(entries, reverse=True):
+        if path in protected:
+            kept_count += 1
+            kept_bytes += size
+            continue
+
+        too_old = max_age_days > 0 and now - mtime > max_age_days * 86400
+        too_many = max_count > 0 and kept_count >= max_count
+        too_big = max_bytes > 0 and kept_bytes + size > max_bytes
+        if too_old or too_many or too_big:
+            deletions.append((path, size))
+        else:
+            kept_count += 1
+            kept_bytes += size
+    return deletions
+
+
+def referenced_paths():
+    """Absolute paths of all image files used by the current .blend"""
+    paths = set()
+    for image in bpy.data.images:
+        if image.filepath:
+            paths.add(os.path.normpath(bpy.path.abspath(image.filepath)))
+    return paths
+
+
+def protected_paths(output_dir):
+    """Pinned history files plus files referenced in the current .blend"""
+    protected = referenced_paths()
+    if os.path.exists(os.path.join(output_dir, history.HISTORY_FILENAME)):
+        # 读不到固定列表时抛出异常，宁可不清理
+        pinned = history.open_history(output_dir).pinned_paths()
+        protected.update(os.path.normpath(path) for path in pinned)
+    return protected
+
+
+class RetentionRun:
+    """One incremental clean-up pass; call step() until it returns False"""
+
+    def __init__(self, output_dir, max_age_days=0, max_count=0, max_bytes=0, dry_run=False):
+        self.output_dir = output_dir
+        self.max_age_days = max_age_days
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.dry_run = dry_run
+        self.protected = protected_paths(output_dir)
+        self.deleted = 0
+        self.freed = 0
+        self.removed = []
+        self.batch_dirs = set()
+        self._steps = self._run()
+
+    def step(self, budget=STEP_BUDGET):
+        """Work for at most `budget` seconds; False once the pass is finished"""
+        deadline = time.time() + budget
+        for _ in self._steps:
+            if time.time() >= deadline:
+                return True
+        return False
+
+    def _scan_batch_dir(self, path):
+        """(mtime, size) of a batch run directory, marking it protected when it must be kept"""
+        newest = 0.0
+        total = 0
+        keep = not os.path.exists(os.path.join(path, BATCH_MANIFEST))
+        for directory, _dirnames, filenames in os.walk(path):
+            for name in filenames:
+                file_path = os.path.normpath(os.path.join(directory, name))
+                final_path = file_path[:-len(".tmp")] if file_path.endswith(".tmp") else file_path
+                if file_path in self.protected or disk_writer.is_pending(final_path):
+                    keep = True
+                stat = os.stat(file_path, follow_symlinks=False)
+                newest = max(newest, stat.st_mtime)
+                total += stat.st_size
+            yield
+        if keep:
+            self.protected.add(path)
+        self.batch_dirs.add(path)
+        return newest, total
+
+    def _run(self):
+        entries = []
+        batch_paths = []
+        try:
+            with os.scandir(self.output_dir) as iterator:
+                for entry in iterator:
+                    if entry.name.startswith(MANAGED_PREFIXES) and entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        entries.append((stat.st_mtime, stat.st_size, os.path.normpath(entry.path)))
+                    elif entry.name.startswith(BATCH_DIR_PREFIX) and entry.is_dir(follow_symlinks=False):
+                        batch_paths.append(os.path.normpath(entry.path))
+                    yield
+            for path in batch_paths:
+                mtime, size = yield from self._scan_batch_dir(path)
+                entries.append((mtime, size, path))
+        except OSError as e:
+            print(f"⚠️ 无法扫描输出目录 {self.output_dir}: {e}")
+            return
+
+        deletions = plan_deletions(
+            entries, self.protected, time.time(), self.max_age_days, self.max_count, self.max_bytes
+        )
+        for path, size in deletions:
+            # 后台写入先写 <path>.tmp 再替换，写入队列里记录的是最终路径
+            final_path = path[:-len(".tmp")] if path.endswith(".tmp") else path
+            if disk_writer.is_pending(final_path):
+                continue
+            if self.dry_run:
+                print(f"🗑️ (试运行) 将删除: {path}")
+            else:
+                try:
+                    if path in self.batch_dirs:
+                        yield from self._remove_batch_dir(path)
+                    else:
+                        os.remove(path)
+                        self.removed.append(path)
+                except OSError as e:
+                    print(f"⚠️ 无法删除 {path}: {e}")
+                    yield
+                    continue
+            self.deleted += 1
+            self.freed += size
+            yield
+
+        if self.removed:
+            self._forget_removed()
+
+        yield from self._collect_blobs()
+
+        if self.deleted:
+            action = "可删除" if self.dry_run else "已删除"
+            print(f"🧹 保留策略: {action} {self.deleted} 个旧文件/批处理目录，释放 {format_bytes(self.freed)} ({self.output_dir})")
+
+    def _remove_batch_dir(self, path):
+        """Delete a batch run directory file by file, then the directory itself"""
+        for directory, dirnames, filenames in os.walk(path, topdown=False):
+            for name in filenames:
+                file_path = os.path.normpath(os.path.join(directory, name))
+                os.remove(file_path)
+                self.removed.append(file_path)
+                yield
+            for name in dirnames:
+                os.rmdir(os.path.join(directory, name))
+        os.rmdir(path)
+
+    def _collect_blobs(self):
+        """Delete artifact store files that no remaining debug dump references"""
+        store_dir = os.path.join(self.output_dir, debug_dump.ARTIFACT_STORE_DIRNAME)
+        if not os.path.isdir(store_dir):
+            return
+
+        removed = set(self.removed)
+        referenced = set()
+        try:
+            with os.scandir(self.output_dir) as iterator:
+                dumps = [entry.path for entry in iterator
+                         if entry.name.startswith("Debug_Response_") and not entry.name.endswith(".tmp")
+                         and entry.is_file(follow_symlinks=False)
+                         and os.path.normpath(entry.path) not in removed]
+        except OSError as e:
+            print(f"⚠️ 无法扫描输出目录 {self.output_dir}: {e}")
+            return
+        for path in dumps:
+            try:
+                stored = debug_dump.stored_paths(debug_dump.load(path))
+            except (OSError, EOFError, ValueError) as e:
+                # 读不了的转储可能引用任何内容，宁可不回收
+                print(f"⚠️ 无法读取调试转储 {path}: {e}")
+                return
+            referenced.update(os.path.normpath(os.path.join(self.output_dir, relative)) for relative in stored)
+            yield
+
+        cutoff = time.time() - BLOB_GRACE
+        for directory, _dirnames, filenames in os.walk(store_dir):
+            for name in filenames:
+                path = os.path.normpath(os.path.join(directory, name))
+                final_path = path[:-len(".tmp")] if path.endswith(".tmp") else path
+                if final_path in referenced or disk_writer.is_pending(final_path):
+                    continue
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    if self.dry_run:
+                        print(f"🗑️ (试运行) 将删除: {path}")
+                    else:
+                        os.remove(path)
+                except OSError as e:
+                    print(f"⚠️ 无法删除 {path}: {e}")
+                    yield
+                    continue
+                self.deleted += 1
+                self.freed += stat.st_size
+                yield
+
+    def _forget_removed(self):
+        """Clear history paths of the files deleted in this pass"""
+        if not os.path.exists(os.path.join(self.output_dir, history.HISTORY_FILENAME)):
+            return
+        try:
+            changed = history.open_history(self.output_dir).forget_paths(self.removed)
+        except Exception as e:
+            print(f"⚠️ 无法更新历史记录中已删除的文件: {e}")
+            return
+        if changed:
+            history_browser.invalidate()
+
+
+def _begin(props, output_dir, dry_run=False):
+    if _state['run'] is not None or not os.path.isdir(output_dir):
+        return False
+
+    _state['last_run'] = time.time()
+    try:
+        _state['run'] = RetentionRun(
+            output_dir,
+            max_age_days=props.retention_max_age_days,
+            max_count=props.retention_max_count,
+            max_bytes=int(props.retention_max_size_mb * 1024 * 1024),
+            dry_run=dry_run,
+        )
+    except Exception as e:
+        print(f"⚠️ 保留策略未运行: {e}")
+        return False
+    return True
+
+
+def start(props, output_dir, dry_run=False):
+    """Start a clean-up pass with the scene's retention settings now"""
+    if not _begin(props, output_dir, dry_run):
+        return False
+    # 立即开始，而不是等到下一次空闲检查
+    if bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.unregister(_tick)
+    bpy.app.timers.register(_tick, first_interval=STEP_INTERVAL, persistent=True)
+    return True
+
+
+def is_running():
+    return _state['run'] is not None
+
+
+def _tick():
+    """Timer: advance the current pass, or start one when it is due"""
+    run = _state['run']
+    if run is not None:
+        try:
+            unfinished = run.step()
+        except Exception as e:
+            print(f"⚠️ 保留策略出错: {e}")
+            unfinished = False
+        if unfinished:
+            return STEP_INTERVAL
+        _state['run'] = None
+        return IDLE_INTERVAL
+
+    scene = getattr(bpy.context, 'scene', None)
+    props = getattr(scene, 'nano_banana', None)
+    if props is None or not props.retention_enabled or not bpy.data.filepath:
+        return IDLE_INTERVAL
+    if time.time() - _state['last_run'] < RUN_INTERVAL:
+        return IDLE_INTERVAL
+
+    if _begin(props, get_nano_banana_output_dir()):
+        return STEP_INTERVAL
+    return IDLE_INTERVAL
+
+
+def register():
+    if not bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.register(_tick, first_interval=IDLE_INTERVAL, persistent=True)
+
+
+def unregister():
+    if bpy.app.timers.is_registered(_tick):
+        bpy.app.timers.unregister(_tick)
+    _state['run'] = None
@@ -0,0 +1,428 @@
+"""
+Region-of-interest regeneration for Nano Banana Renderer
+
+改一小块画面不需要重新生成整张图。区域来自渲染边框（相机视图中
+Ctrl+B 的 Render Region）或一张绘制的遮罩图像（白色 = 重新生成）：
+
+1. 区域换算到上一次结果 NanoBanana_Render 的取景中：结果来自正方形的
+   捕获图（pipeline.apply_capture_settings），非正方形相机在正方形捕获中
+   的取景与相机画面不同，边框区域按两者的视框（view_frame）换算；
+2. 区域向外扩展 roi_margin 作为上下文，用同样的正方形捕获设置只渲染
+   这一块（use_border + use_crop_to_border），像素密度与整帧捕获相同，
+   上传大小和渲染时间随区域大小成比例缩小；
+3. 返回的图块缩放到 NanoBanana_Render 中对应的像素矩形；
+4. 用 NumPy 一次性计算羽化权重（边框模式为区域内 1、边缘区 0 的矩形，
+   遮罩模式为遮罩本身，再做盒式模糊和 smoothstep），与原图混合。
+
+区域坐标是归一化坐标 (min_x, min_y, max_x, max_y)，y 向上，与
+render.border_* 和 Blender 图像像素的行顺序一致。渲染边框是相机画面中
+的坐标，遮罩画在上一次结果上，使用捕获画面中的坐标。上一次结果的宽高比
+与正方形捕获不一致时（例如生成时选择了其他宽高比）拒绝混合。
+"""
+
+import bpy
+import os
+import math
+import time
+import numpy as np
+
+from . import pipeline
+from . import image_pool
+from . import async_render
+from . import output_manager
+
+PATCH_IMAGE_NAME = "NanoBanana_ROI_Patch"
+
+CROP_INSTRUCTION = (
+    "The reference image is a crop of a larger frame. Regenerate only this crop: keep its exact framing, "
+    "perspective and scale, and keep the content near the borders consistent with the reference so the "
+    "result can be blended seamlessly back into the full image. Do not add borders or change the composition."
+)
+
+# 遮罩中高于此值的像素属于区域
+MASK_THRESHOLD = 0.01
+
+# 整帧分辨率上限：很小的区域也只渲染边框内的像素，但分辨率不能无限大
+MAX_FRAME_SIZE = 16384
+
+# 区域捕获较长一边的最少像素数
+MIN_CROP_SIZE = 128
+
+# 上一次结果与捕获画面宽高比允许的相对误差
+ASPECT_TOLERANCE = 0.02
+
+
+# ================================
+# Regions
+# ================================
+
+def border_region(scene):
+    """The render border as a normalized region, or None when it is off or empty"""
+    render = scene.render
+    if not render.use_border:
+        return None
+    region = (render.border_min_x, render.border_min_y, render.border_max_x, render.border_max_y)
+    if region[2] - region[0] <= 0.0 or region[3] - region[1] <= 0.0:
+        return None
+    return region
+
+
+def mask_weights(image):
+    """(height, width) float array of a painted mask: mean of RGB times alpha"""
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(height, width, 4)
+    return np.clip(pixels[..., :3].mean(axis=2) * pixels[..., 3], 0.0, 1.0)
+
+
+def mask_region(weights):
+    """Normalized bounding box of the painted part of a mask, or None"""
+    rows = np.flatnonzero((weights > MASK_THRESHOLD).any(axis=1))
+    cols = np.flatnonzero((weights > MASK_THRESHOLD).any(axis=0))
+    if rows.size == 0:
+        return None
+    height, width = weights.shape
+    return (cols[0] / width, rows[0] / height, (cols[-1] + 1) / width, (rows[-1] + 1) / height)
+
+
+def expand_region(region, margin, aspect):
+    """Grow a region by `margin` of the frame width on every side, clamped to the frame
+
+    aspect is width / height of the frame, so the margin is the same number
+    of pixels horizontally and vertically.
+    """
+    min_x, min_y, max_x, max_y = region
+    margin_y = margin * aspect
+    return (
+        max(min_x - margin, 0.0),
+        max(min_y - margin_y, 0.0),
+        min(max_x + margin, 1.0),
+        min(max_y + margin_y, 1.0),
+    )
+
+
+def pixel_rect(region, width, height):
+    """(x0, y0, x1, y1) pixel rectangle of a normalized region in a width x height image"""
+    x0, y0 = int(round(region[0] * width)), int(round(region[1] * height))
+    x1, y1 = int(round(region[2] * width)), int(round(region[3] * height))
+    return x0, y0, max(x1, x0 + 1), max(y1, y0 + 1)
+
+
+def _view_bounds(scene):
+    """(min_x, min_y, max_x, max_y) of the camera's view frame at unit depth for the current resolution"""
+    camera = scene.camera
+    frame = camera.data.view_frame(scene=scene)
+    if camera.data.type == 'ORTHO':
+        xs, ys = [corner.x for corner in frame], [corner.y for corner in frame]
+    else:
+        xs = [corner.x / -corner.z for corner in frame]
+        ys = [corner.y / -corner.z for corner in frame]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def camera_to_capture_region(scene, region, resolution=512):
+    """Map a region of the camera frame into the square capture frame
+
+    The square capture keeps the camera's lens and sensor fit, so for a
+    non-square camera it shows a different part of the scene (with AUTO
+    fit, more above and below a landscape frame).
+    """
+    render = scene.render
+    camera_bounds = _view_bounds(scene)
+    saved_resolution = (render.resolution_x, render.resolution_y)
+    try:
+        render.resolution_x = render.resolution_y = resolution
+        capture_bounds = _view_bounds(scene)
+    finally:
+        render.resolution_x, render.resolution_y = saved_resolution
+
+    def convert(value, axis):
+        plane = camera_bounds[axis] + value * (camera_bounds[axis + 2] - camera_bounds[axis])
+        return min(max((plane - capture_bounds[axis]) / (capture_bounds[axis + 2] - capture_bounds[axis]), 0.0), 1.0)
+
+    return convert(region[0], 0), convert(region[1], 1), convert(region[2], 0), convert(region[3], 1)
+
+
+def base_matches_capture(base_image):
+    """True when base_image has the aspect of the square capture it was generated from"""
+    width, height = base_image.size
+    return height > 0 and abs(width / height - 1.0) <= ASPECT_TOLERANCE
+
+
+# ================================
+# Capture
+# ================================
+
+def capture_region(scene, region, resolution=512):
+    """Render only `region` of the camera view; returns (png_bytes or None, seconds)
+
+    The frame is sized so the longer side of the crop is `resolution`
+    pixels. Render settings are restored afterwards.
+    """
+    render = scene.render
+    if not scene.camera:
+        print("❌ 没有活动摄像机")
+        return None, 0.0
+
+    frame_x, frame_y = render.resolution_x, render.resolution_y
+    crop_x = (region[2] - region[0]) * frame_x
+    crop_y = (region[3] - region[1]) * frame_y
+    scale = min(resolution / max(crop_x, crop_y), MAX_FRAME_SIZE / max(frame_x, frame_y))
+    return _render_crop(scene, region, max(int(round(frame_x * scale)), 4), max(int(round(frame_y * scale)), 4))
+
+
+def capture_base_region(scene, region, resolution=512):
+    """Render `region` of the square capture frame at the capture's pixel density
+
+    region is in capture frame coordinates; the crop is region × resolution
+    pixels (at least MIN_CROP_SIZE on its longer side). Returns
+    (png_bytes or None, seconds).
+    """
+    if not scene.camera:
+        print("❌ 没有活动摄像机")
+        return None, 0.0
+
+    longest = max(region[2] - region[0], region[3] - region[1]) * resolution
+    frame = resolution
+    if longest < MIN_CROP_SIZE:
+        frame = min(int(math.ceil(resolution * MIN_CROP_SIZE / longest)), MAX_FRAME_SIZE)
+    return _render_crop(scene, region, frame, frame)
+
+
+def _render_crop(scene, region, frame_x, frame_y):
+    """Render the border `region` of a frame_x × frame_y capture; (png_bytes or None, seconds)"""
+    render = scene.render
+    saved_border = (
+        render.use_border, render.use_crop_to_border,
+        render.border_min_x, render.border_min_y, render.border_max_x, render.border_max_y,
+    )
+    temp_file = pipeline.capture_temp_path()
+    saved = pipeline.apply_capture_settings(scene, temp_file)
+    start = time.time()
+
+    try:
+        render.resolution_x = frame_x
+        render.resolution_y = frame_y
+        render.use_border = True
+        render.use_crop_to_border = True
+        render.border_min_x, render.border_min_y, render.border_max_x, render.border_max_y = region
+
+        bpy.ops.render.render(write_still=True, scene=scene.name)
+
+        if not os.path.exists(temp_file):
+            print("❌ 区域捕获失败: 临时文件未创建")
+            return None, time.time() - start
+        with open(temp_file, 'rb') as f:
+            return f.read(), time.time() - start
+
+    except Exception as e:
+        print(f"❌ 区域捕获出错: {e}")
+        return None, time.time() - start
+
+    finally:
+        pipeline.restore_capture_settings(scene, saved)
+        (render.use_border, render.use_crop_to_border,
+         render.border_min_x, render.border_min_y, render.border_max_x, render.border_max_y) = saved_border
+        try:
+            if os.path.exists(temp_file):
+                os.unlink(temp_file)
+        except OSError:
+            pass
+
+
+# ================================
+# Blending
+# ================================
+
+def box_blur(values, radius):
+    """Separable box blur of a 2D array (edges extended), using cumulative sums"""
+    if radius < 1:
+        return values
+    size = 2 * radius + 1
+    for _ in range(2):
+        padded = np.pad(values, ((radius + 1, radius), (0, 0)), mode='edge')
+        summed = np.cumsum(padded, axis=0)
+        values = ((summed[size:] - summed[:-size]) / size).T
+    return values
+
+
+def smoothstep(values):
+    values = np.clip(values, 0.0, 1.0)
+    return values * values * (3.0 - 2.0 * values)
+
+
+def region_weights(shape, padded, inner=None, mask=None, feather=0):
+    """Blend weights (height, width) for a patch covering the `padded` region
+
+    Without a mask the weight is 1 inside `inner` and 0 in the margin;
+    with a mask the mask is sampled over the padded region. The hard
+    weights are then feathered by `feather` pixels.
+    """
+    height, width = shape
+    if mask is not None:
+        mask_height, mask_width = mask.shape
+        xs = padded[0] + (np.arange(width) + 0.5) / width * (padded[2] - padded[0])
+        ys = padded[1] + (np.arange(height) + 0.5) / height * (padded[3] - padded[1])
+        cols = np.clip((xs * mask_width).astype(int), 0, mask_width - 1)
+        rows = np.clip((ys * mask_height).astype(int), 0, mask_height - 1)
+        weights = mask[rows[:, None], cols[None, :]].astype(np.float32)
+    else:
+        span_x, span_y = padded[2] - padded[0], padded[3] - padded[1]
+        inner_region = (
+            (inner[0] - padded[0]) / span_x, (inner[1] - padded[1]) / span_y,
+            (inner[2] - padded[0]) / span_x, (inner[3] - padded[1]) / span_y,
+        )
+        x0, y0, x1, y1 = pixel_rect(inner_region, width, height)
+        weights = np.zeros(shape, dtype=np.float32)
+        weights[y0:y1, x0:x1] = 1.0
+    return smoothstep(box_blur(weights, feather))
+
+
+def composite(base, patch, x0, y0, weights):
+    """Blend patch (h, w, 4) into base (H, W, 4) at x0, y0 in place; base alpha is kept"""
+    height, width = weights.shape
+    target = base[y0:y0 + height, x0:x0 + width, :3]
+    alpha = weights[..., None]
+    target *= 1.0 - alpha
+    target += patch[..., :3] * alpha
+    return base
+
+
+def _read_pixels(image):
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, 4)
+
+
+def decode_patch(data, width, height):
+    """Decode encoded image bytes scaled to width x height; (height, width, 4) array or None
+
+    Rows are bottom-up like Blender image pixels.
+    """
+    patch_image = bpy.data.images.new(PATCH_IMAGE_NAME, width=8, height=8)
+    try:
+        patch_image.pack(data=data, data_len=len(data))
+        patch_image.source = 'FILE'
+        patch_image.reload()
+        if patch_image.size[0] == 0 or patch_image.size[1] == 0:
+            return None
+        if tuple(patch_image.size) != (width, height):
+            patch_image.scale(width, height)
+        return _read_pixels(patch_image)
+    finally:
+        bpy.data.images.remove(patch_image)
+
+
+def composite_result(base_image, patch_bytes, padded, inner=None, mask=None, feather=0):
+    """Blend a returned patch into base_image and re-pack it; returns the PNG bytes or None"""
+    width, height = base_image.size
+    x0, y0, x1, y1 = pixel_rect(padded, width, height)
+
+    patch = decode_patch(patch_bytes, x1 - x0, y1 - y0)
+    if patch is None:
+        print("❌ 无法解码返回的区域图像")
+        return None
+
+    base = _read_pixels(base_image)
+    weights = region_weights(patch.shape[:2], padded, inner, mask, feather)
+    composite(base, patch, x0, y0, weights)
+
+    base_image.pixels.foreach_set(base.ravel())
+    base_image.update()
+    # 重新打包成PNG，得到可以保存和记录的字节
+    base_image.file_format = 'PNG'
+    base_image.pack()
+    return bytes(base_image.packed_file.data)
+
+
+# ================================
+# Generation
+# ================================
+
+class RegionGeneration(async_render.AsyncGeneration):
+    """Generate a crop and blend it back into the last AI render"""
+
+    SOURCE = 'roi'
+
+    def __init__(self, scene, png_bytes, capture_seconds, padded, crop_size, inner=None, mask=None, margin=0.0):
+        self.padded = padded
+        self.crop_size = crop_size
+        self.inner = inner
+        self.mask = mask
+        self.margin = margin
+        super().__init__(scene, png_bytes, capture_seconds)
+
+    def build_payload(self, props, prompt, image_data):
+        aspect_ratio = pipeline.nearest_aspect_ratio(*self.crop_size)
+        return pipeline.build_generation_payload(
+            props, prompt, image_data, extra_instruction=CROP_INSTRUCTION, aspect_ratio=aspect_ratio
+        )
+
+    def apply_result(self, image_bytes):
+        base = bpy.data.images.get(image_pool.RENDER_IMAGE_NAME)
+        data = None
+        if base is None or base.size[0] == 0:
+            print("⚠️ 上一次的AI渲染已不存在，只保存区域图像")
+        elif not base_matches_capture(base):
+            print("⚠️ 上一次的AI渲染与捕获画面的宽高比不一致，只保存区域图像")
+        else:
+            try:
+                feather = int(round(self.margin * base.size[0]))
+                data = composite_result(base, image_bytes, self.padded, self.inner, self.mask, feather)
+            except Exception as e:
+                print(f"❌ 区域混合失败: {e}")
+
+        if data is None:
+            return self.job.write_bytes(output_manager.ARTIFACT_RESULT, image_bytes)
+
+        path = self.job.write_bytes(output_manager.ARTIFACT_RESULT, data)
+        if path:
+            base.filepath_raw = path
+        async_render.show_result(base)
+        print(f"🧩 区域已混合回 {image_pool.RENDER_IMAGE_NAME}")
+        return path
+
+
+def start_region_generation(scene, margin, mask_image=None, resolution=512):
+    """Capture the border (or mask) region and start generating it
+
+    Returns an error message, or None once the request is on its way.
+    """
+    base = bpy.data.images.get(image_pool.RENDER_IMAGE_NAME)
+    if base is None:
+        return "Generate a full AI render first; the region is blended into it"
+    if not base_matches_capture(base):
+        return "The last AI render is not square like the capture; generate it with a 1:1 aspect ratio first"
+    if not scene.camera:
+        return "No active camera"
+
+    mask = None
+    if mask_image is not None:
+        mask = mask_weights(mask_image)
+        inner = mask_region(mask)
+        if inner is None:
+            return f"Mask '{mask_image.name}' is empty"
+    else:
+        inner = border_region(scene)
+        if inner is None:
+            return "Enable a render region (Ctrl+B in camera view) or choose a mask"
+        inner = camera_to_capture_region(scene, inner, resolution)
+        if inner[2] <= inner[0] or inner[3] <= inner[1]:
+            return "The render region lies outside the captured frame"
+
+    # 捕获画面是正方形的
+    padded = expand_region(inner, margin, 1.0)
+    crop_size = ((padded[2] - padded[0]) * resolution, (padded[3] - padded[1]) * resolution)
+
+    png_bytes, seconds = capture_base_region(scene, padded, resolution)
+    if png_bytes is None:
+        return "Region capture failed"
+    print(f"📐 区域 {padded[0]:.2f},{padded[1]:.2f} - {padded[2]:.2f},{padded[3]:.2f} 已捕获 ({seconds:.1f}s)")
+
+    RegionGeneration(
+        scene, png_bytes, seconds, padded, crop_size,
+        inner=None if mask is not None else inner, mask=mask, margin=margin,
+    ).start()
+    return None
@@ -0,0 +1,363 @@
+"""
+Incremental scene summary for Nano Banana Renderer
+
+提示词中的场景描述不再每次点击都遍历 scene.objects。每个场景第一次被
+用到时完整统计一次，之后由 depsgraph_update_post 处理函数只更新发生变化
+的对象：
+
+- 按类型统计的对象数量；
+- 摄像机视野内的对象（包围球与视锥的近似测试）；
+- 主要材质（按使用它们的对象数统计）；
+- 灯光布置（读取时只遍历灯光对象）。
+
+对象增删或摄像机变化时，重新统计在定时器中分段完成，不会卡住界面；
+期间读取到的是上一次的结果。describe() 返回缓存的文本，并按字符预算
+截断，保证提示词不会变得很长。
+"""
+
+import bpy
+import time
+import heapq
+from collections import Counter
+from bpy.app.handlers import persistent
+
+DEFAULT_BUDGET = 400
+
+# 有几何体、可能出现在画面中的对象类型
+GEOMETRY_TYPES = {
+    'MESH', 'CURVE', 'CURVES', 'SURFACE', 'META', 'FONT', 'VOLUME', 'POINTCLOUD', 'GPENCIL', 'GREASEPENCIL',
+}
+
+MAX_MATERIALS = 5
+MAX_VIEW_NAMES = 5
+
+# 每次定时器回调最多用于重新统计的时间(秒)
+STEP_BUDGET = 0.01
+STEP_INTERVAL = 0.05
+
+JOB_REBUILD = 'REBUILD'
+JOB_VIEW = 'VIEW'
+
+_summaries = {}
+
+
+class CameraFrustum:
+    """Approximate view volume of a camera for bounding sphere tests"""
+
+    def __init__(self, scene, camera):
+        self.to_camera = camera.matrix_world.inverted()
+        data = camera.data
+        frame = data.view_frame(scene=scene)
+        self.ortho = data.type == 'ORTHO'
+        self.clip_start = data.clip_start
+        self.clip_end = data.clip_end
+        half_x = max(abs(corner.x) for corner in frame)
+        half_y = max(abs(corner.y) for corner in frame)
+        if self.ortho:
+            self.extent_x, self.extent_y = half_x, half_y
+        else:
+            # 透视相机: 每单位深度的半宽/半高
+            depth = abs(frame[0].z) or 1.0
+            self.extent_x, self.extent_y = half_x / depth, half_y / depth
+
+    def contains(self, center, radius):
+        local = self.to_camera @ center
+        depth = -local.z
+        if depth + radius < self.clip_start or depth - radius > self.clip_end:
+            return False
+        if self.ortho:
+            return abs(local.x) <= self.extent_x + radius and abs(local.y) <= self.extent_y + radius
+        scale = max(depth, 0.0)
+        # 包围球半径沿视锥侧面法线方向的放宽（近似）
+        return (abs(local.x) <= self.extent_x * scale + radius * (1.0 + self.extent_x)
+                and abs(local.y) <= self.extent_y * scale + radius * (1.0 + self.extent_y))
+
+
+def _object_entry(obj, frustum):
+    """(name, type, materials, radius, in_view) of one object"""
+    materials = ()
+    radius = 0.0
+    in_view = False
+    if obj.type in GEOMETRY_TYPES:
+        materials = tuple(slot.material.name for slot in obj.material_slots if slot.material)
+        radius = max(obj.dimensions) * 0.5
+        if frustum is not None and obj.visible_get():
+            in_view = frustum.contains(obj.matrix_world.translation, radius)
+    return (obj.name, obj.type, materials, radius, in_view)
+
+
+def _camera_key(scene):
+    return scene.camera.session_uid if scene.camera else None
+
+
+def _scene_frustum(scene):
+    if scene.camera is None or scene.camera.type != 'CAMERA':
+        return None
+    return CameraFrustum(scene, scene.camera)
+
+
+class SceneSummary:
+    """Running tallies of one scene, kept up to date from depsgraph updates"""
+
+    def __init__(self):
+        self.entries = {}
+        self.type_counts = Counter()
+        self.materials = Counter()
+        self.in_view = {}
+        self.lights = {}
+        self.object_total = 0
+        # 最近一次安排统计时的摄像机 / 当前视野数据所属的摄像机
+        self.camera_key = None
+        self.view_camera = None
+        self.job = None
+        self.job_kind = None
+        self.touched = set()
+        self._text = {}
+
+    # -- tallies ---------------------------------------------------------
+
+    def _add(self, uid, entry):
+        name, obj_type, materials, radius, in_view = entry
+        self.entries[uid] = entry
+        self.type_counts[obj_type] += 1
+        self.materials.update(materials)
+        if in_view:
+            self.in_view[uid] = (radius, name)
+        if obj_type == 'LIGHT':
+            self.lights[uid] = name
+
+    def _remove(self, uid):
+        entry = self.entries.pop(uid, None)
+        if entry is None:
+            return
+        _name, obj_type, materials, _radius, _in_view = entry
+        self.type_counts[obj_type] -= 1
+        self.materials.subtract(materials)
+        self.in_view.pop(uid, None)
+        self.lights.pop(uid, None)
+
+    def update_object(self, obj, frustum):
+        """Refresh one tracked object (new objects arrive with a rebuild)"""
+        uid = obj.session_uid
+        if self.job_kind == JOB_REBUILD:
+            self.touched.add(obj.name)
+        if uid in self.entries:
+            self._remove(uid)
+            self._add(uid, _object_entry(obj, frustum))
+
+    # -- time sliced jobs ------------------------------------------------
+
+    def _rebuild(self, scene):
+        fresh = SceneSummary()
+        frustum = _scene_frustum(scene)
+        for obj in scene.objects:
+            fresh._add(obj.session_uid, _object_entry(obj, frustum))
+            yield
+
+        self.entries = fresh.entries
+        self.type_counts = fresh.type_counts
+        self.materials = fresh.materials
+        self.in_view = fresh.in_view
+        self.lights = fresh.lights
+        self.object_total = len(bpy.data.objects)
+        self.view_camera = _camera_key(scene)
+
+        # 统计期间发生变化的对象需要重新读取
+        self.job_kind = None
+        touched, self.touched = self.touched, set()
+        for name in touched:
+            obj = bpy.data.objects.get(name)
+            if obj is not None:
+                self.update_object(obj, frustum)
+        self._text.clear()
+
+    def _refresh_view(self, scene):
+        frustum = _scene_frustum(scene)
+        for obj in scene.objects:
+            self.update_object(obj, frustum)
+            yield
+        self.view_camera = _camera_key(scene)
+        self._text.clear()
+
+    def schedule(self, scene, kind):
+        """Start (or restart) a rebuild or camera view refresh in the timer"""
+        if self.job is not None and self.job_kind == JOB_REBUILD and kind == JOB_VIEW:
+            # 重新统计本身就会计算视野
+            return
+        if kind == JOB_REBUILD:
+            self.touched = set()
+        self.camera_key = _camera_key(scene)
+        self.job_kind = kind
+        self.job = self._rebuild(scene) if kind == JOB_REBUILD else self._refresh_view(scene)
+        if not bpy.app.timers.is_registered(_process_jobs):
+            bpy.app.timers.register(_process_jobs, first_interval=STEP_INTERVAL)
+
+    def step(self, budget):
+        """Advance the current job; False when there is nothing left to do"""
+        if self.job is None:
+            return False
+        deadline = time.time() + budget
+        for _ in self.job:
+            if time.time() >= deadline:
+                return True
+        self.job = None
+        self.job_kind = None
+        return False
+
+    def run_to_completion(self):
+        while self.step(60.0):
+            pass
+
+    # -- depsgraph -------------------------------------------------------
+
+    def apply_updates(self, scene, depsgraph):
+        camera = scene.camera
+        camera_key = _camera_key(scene)
+        view_dirty = camera_key != self.camera_key
+        membership_dirty = len(bpy.data.objects) != self.object_total
+        frustum = None
+
+        for update in depsgraph.updates:
+            datablock = update.id.original
+            if isinstance(datablock, bpy.types.Object):
+                if datablock.session_uid == camera_key:
+                    view_dirty = True
+                    continue
+                if frustum is None and camera is not None:
+                    frustum = _scene_frustum(scene)
+                self.update_object(datablock, frustum)
+            elif isinstance(datablock, bpy.types.Collection):
+                # 对象被链接/移出集合
+                membership_dirty = True
+            elif isinstance(datablock, bpy.types.Camera):
+                view_dirty = True
+
+        self._text.clear()
+        if membership_dirty:
+            self.schedule(scene, JOB_REBUILD)
+        elif view_dirty:
+            self.schedule(scene, JOB_VIEW)
+
+    # -- description -----------------------------------------------------
+
+    def describe(self, scene, budget=DEFAULT_BUDGET):
+        """Scene description of at most `budget` characters (cached)"""
+        if self.job is not None and bpy.app.background:
+            # 无界面模式下定时器不会运行
+            self.run_to_completion()
+        cached = self._text.get(budget)
+        if cached is None:
+            cached = self._text[budget] = self._compose(scene, budget)
+        return cached
+
+    def _compose(self, scene, budget):
+        counts = self.type_counts
+        parts = [f"Scene with {counts['MESH']} meshes, {counts['LIGHT']} lights, {counts['CAMERA']} cameras"]
+
+        lighting = self._describe_lighting(scene)
+        if lighting:
+            parts.append(lighting)
+
+        # 视野数据属于另一台摄像机（正在重新计算）时不写入提示词
+        if self.in_view and self.view_camera == _camera_key(scene) and self.job_kind != JOB_VIEW:
+            largest = heapq.nlargest(MAX_VIEW_NAMES, self.in_view.values())
+            parts.append(f"{len(self.in_view)} objects in camera view, largest: "
+                         + ", ".join(name for _radius, name in largest))
+
+        dominant = [(name, count) for name, count in self.materials.most_common(MAX_MATERIALS) if count > 0]
+        if dominant:
+            parts.append("dominant materials: " + ", ".join(f"{name} ({count})" for name, count in dominant))
+
+        # 按优先级加入，超出预算的部分直接丢弃
+        text = parts[0][:budget]
+        for part in parts[1:]:
+            if len(text) + 2 + len(part) <= budget:
+                text += ", " + part
+        return text
+
+    def _describe_lighting(self, scene):
+        lights = []
+        for name in self.lights.values():
+            obj = bpy.data.objects.get(name)
+            if obj is not None and obj.type == 'LIGHT':
+                lights.append((obj.data.energy, obj.data.type.lower(), _color_word(obj.data.color)))
+        lights.sort(reverse=True)
+
+        parts = []
+        if lights:
+            energy, light_type, color = lights[0]
+            parts.append(f"key light: {color} {light_type} ({energy:g} W)")
+            others = Counter(light_type for _energy, light_type, _color in lights[1:])
+            if others:
+                parts.append("fill: " + ", ".join(f"{count} {light_type}" for light_type, count in others.items()))
+        if scene.world and scene.world.use_nodes:
+            parts.append("world lighting enabled")
+        return ", ".join(parts)
+
+
+def _color_word(color):
+    red, _green, blue = color
+    if red - blue > 0.15:
+        return "warm"
+    if blue - red > 0.15:
+        return "cool"
+    return "neutral"
+
+
+def summary_for(scene):
+    """The scene's summary; built synchronously the first time"""
+    summary = _summaries.get(scene.session_uid)
+    if summary is None:
+        summary = SceneSummary()
+        summary.schedule(scene, JOB_REBUILD)
+        summary.run_to_completion()
+        _summaries[scene.session_uid] = summary
+    return summary
+
+
+def describe(scene, budget=DEFAULT_BUDGET):
+    """Scene description for prompts, at most `budget` characters"""
+    return summary_for(scene).describe(scene, budget)
+
+
+def _process_jobs():
+    """Timer: advance rebuild/view jobs of all summaries within a small budget"""
+    busy = False
+    for summary in list(_summaries.values()):
+        try:
+            busy = summary.step(STEP_BUDGET) or busy
+        except ReferenceError:
+            # 场景已被删除
+            summary.job = None
+            summary.job_kind = None
+    return STEP_INTERVAL if busy else None
+
+
+@persistent
+def _on_depsgraph_update(scene, depsgraph):
+    # 只维护已经被用到过的场景
+    summary = _summaries.get(scene.session_uid)
+    if summary is not None:
+        summary.apply_updates(scene, depsgraph)
+
+
+@persistent
+def _on_load(*args):
+    _summaries.clear()
+
+
+def register():
+    if _on_depsgraph_update not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(_on_depsgraph_update)
+    if _on_load not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(_on_load)
+
+
+def unregister():
+    if _on_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_on_depsgraph_update)
+    if _on_load in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_on_load)
+    if bpy.app.timers.is_registered(_process_jobs):
+        bpy.app.timers.unregister(_process_jobs)
+    _summaries.clear()
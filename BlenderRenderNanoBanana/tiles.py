@@ -0,0 +1,425 @@
+"""
+Tiled high-resolution generation for Nano Banana Renderer
+
+模型一次只能输出大约 1~1.5 百万像素，4K/8K 交付需要分块生成：
+
+1. 按输出分辨率把画面分成有重叠的方块，每块用渲染边框单独渲染
+   （roi.capture_region），另外捕获一张 512 的整帧图作为共享上下文，
+   所有分块使用同一个提示词并发请求；
+2. 结果按行流式拼接：某一行的分块都到齐后，用 NumPy 按重叠区的
+   互补 smoothstep 权重混合进一条行带，已经确定的像素行立即压缩写入
+   PNG 文件，剩余的重叠部分留给下一行。内存中最多只有大约两行分块，
+   8K 结果也不需要整张图的缓冲区；
+3. PNG 压缩在单独的写入线程中按顺序进行，主线程的定时器每次最多解码
+   一个分块。
+
+生成失败的分块用它的捕获图代替，保证输出完整。
+"""
+
+import bpy
+import os
+import math
+import time
+import zlib
+import base64
+import struct
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import roi
+from . import batch
+from . import history
+from . import pipeline
+from . import delivery
+from . import disk_writer
+from . import image_pool
+from . import async_render
+from . import output_manager
+from .properties import get_nano_banana_output_dir
+
+TILED_IMAGE_NAME = "NanoBanana_Tiled"
+
+POLL_INTERVAL = 0.1
+
+TILE_INSTRUCTION = (
+    "The first image is one tile of a high resolution frame; the second image shows the whole frame at low "
+    "resolution for context. Generate only this tile at full detail: keep its exact framing, perspective and "
+    "scale, and match the lighting, colors and style of the whole frame so neighbouring tiles line up seamlessly."
+)
+
+
+# ================================
+# Tile layout and blending
+# ================================
+
+def tile_starts(length, tile, overlap):
+    """Start offsets of overlapping tiles covering `length` pixels (the last one is clamped)"""
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    count = int(math.ceil((length - tile) / float(stride))) + 1
+    return [min(index * stride, length - tile) for index in range(count)]
+
+
+def tile_weights(starts, size):
+    """1D blend weight of every tile; neighbouring ramps add up to 1 in each overlap"""
+    weights = []
+    for index, start in enumerate(starts):
+        weight = np.ones(size, dtype=np.float32)
+        if index > 0:
+            left = starts[index - 1] + size - start
+            weight[:left] = roi.smoothstep((np.arange(left) + 0.5) / left)
+        if index < len(starts) - 1:
+            right = start + size - starts[index + 1]
+            weight[size - right:] *= 1.0 - roi.smoothstep((np.arange(right) + 0.5) / right)
+        weights.append(weight)
+    return weights
+
+
+class PngStream:
+    """8-bit RGB PNG written row band by row band with a streaming zlib compressor
+
+    Rows go to <path>.tmp; close() renames it into place, abort() removes it.
+    Until then the path counts as pending in disk_writer, so the retention
+    policy leaves the temporary file alone.
+    """
+
+    def __init__(self, path, width, height):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.width = width
+        self.rows = 0
+        self.height = height
+        self.compressor = zlib.compressobj(6)
+        disk_writer.reserve(path)
+        try:
+            self.file = open(self.temp_path, 'wb')
+        except OSError:
+            disk_writer.release(path)
+            raise
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    def write_rows(self, rows):
+        """Append top-down rows, a (n, width, 3) uint8 array"""
+        # 每行前加过滤类型 0
+        filtered = np.zeros((rows.shape[0], self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows += rows.shape[0]
+
+    def close(self):
+        try:
+            self._chunk(b"IDAT", self.compressor.flush())
+            self._chunk(b"IEND", b"")
+            self.file.close()
+            if self.rows != self.height:
+                raise RuntimeError(f"PNG 行数不完整: {self.rows}/{self.height}")
+            os.replace(self.temp_path, self.path)
+        except Exception:
+            self.abort()
+            raise
+        disk_writer.release(self.path)
+
+    def abort(self):
+        """Drop the partial file"""
+        self.file.close()
+        try:
+            os.unlink(self.temp_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ 无法删除不完整的文件 {self.temp_path}: {e}")
+        disk_writer.release(self.path)
+
+
+class SeamStitcher:
+    """Blend rows of tiles into finished pixel rows, keeping only one row band in memory
+
+    Tiles are top-down (size, size, 3) float arrays. emit(rows) receives
+    finished top-down rows as uint8 arrays, in order.
+    """
+
+    def __init__(self, width, height, size, overlap, emit):
+        self.width = width
+        self.height = height
+        self.size = size
+        self.emit = emit
+        self.starts_x = tile_starts(width, size, overlap)
+        self.starts_y = tile_starts(height, size, overlap)
+        self.weights_x = tile_weights(self.starts_x, min(size, width))
+        self.weights_y = tile_weights(self.starts_y, min(size, height))
+        self.carry = None
+
+    def add_row(self, row, tiles):
+        """Blend all tiles of one row (in column order) and emit the rows now finished"""
+        tile_h = min(self.size, self.height)
+        tile_w = min(self.size, self.width)
+        band = np.zeros((tile_h, self.width, 3), dtype=np.float32)
+        if self.carry is not None:
+            band[:self.carry.shape[0]] += self.carry
+
+        weight_y = self.weights_y[row][:, None, None]
+        for column, tile in enumerate(tiles):
+            x = self.starts_x[column]
+            band[:, x:x + tile_w] += tile[..., :3] * (weight_y * self.weights_x[column][None, :, None])
+
+        if row < len(self.starts_y) - 1:
+            finished = self.starts_y[row + 1] - self.starts_y[row]
+            self.carry = band[finished:].copy()
+            band = band[:finished]
+        else:
+            self.carry = None
+        self.emit((np.clip(band, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8))
+
+
+# ================================
+# Tiled run
+# ================================
+
+class TiledRun:
+    """Concurrent tile requests, decoded and stitched row by row from a timer"""
+
+    # 正在运行的分块任务，防止定时器回调引用的对象被回收
+    active = []
+
+    def __init__(self, scene, width, height, tile_size, overlap, output_path, history_id=None):
+        props = scene.nano_banana
+        self.scene_name = scene.name
+        self.api_key = props.api_key
+        self.output_path = output_path
+        self.history_id = history_id
+        self.width = width
+        self.height = height
+        self.start_time = time.time()
+        self.prompt = ""
+        self.settings = history.settings_snapshot(props)
+        self.capture_seconds = 0.0
+
+        self.png = None
+        self.stitcher = SeamStitcher(width, height, tile_size, overlap, self.write_rows)
+        self.tile_w = min(tile_size, width)
+        self.tile_h = min(tile_size, height)
+        self.columns = len(self.stitcher.starts_x)
+        self.rows = len(self.stitcher.starts_y)
+
+        self.captures = {}
+        self.futures = {}
+        self.decoded = {}
+        self.failed = 0
+        self.next_row = 0
+        self.executor = ThreadPoolExecutor(max_workers=props.batch_concurrency, thread_name_prefix="NanoBananaTile")
+        # 压缩写入按顺序在一个线程中进行
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="NanoBananaTileWriter")
+        self.writes = []
+
+    def tile_region(self, row, column):
+        """Normalized camera region (y up) of a tile"""
+        x = self.stitcher.starts_x[column]
+        y = self.stitcher.starts_y[row]
+        return (
+            x / self.width, 1.0 - (y + self.tile_h) / self.height,
+            (x + self.tile_w) / self.width, 1.0 - y / self.height,
+        )
+
+    def submit(self, key, payload, png_bytes):
+        self.captures[key] = png_bytes
+        self.futures[key] = self.executor.submit(pipeline.generate_from_capture, self.api_key, payload)
+
+    def start(self):
+        try:
+            self.png = PngStream(self.output_path, self.width, self.height)
+        except OSError as e:
+            self.abandon(f"无法写入 {self.output_path}: {e}")
+            raise
+        TiledRun.active.append(self)
+        self.executor.shutdown(wait=False)
+        batch.set_status(self.scene_name, f"Tiled: 0/{len(self.futures)} tiles")
+        bpy.app.timers.register(self.poll, first_interval=POLL_INTERVAL)
+
+    def abandon(self, error):
+        """Stop a run that never started: drop its requests and record the failure"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.writer.shutdown(wait=False)
+        self.record_history(error, time.time() - self.start_time)
+
+    def write_rows(self, rows):
+        self.writes.append(self.writer.submit(self.png.write_rows, rows))
+
+    def decode_one(self):
+        """Decode one finished tile of the next two rows; False when none was ready"""
+        for key, future in self.futures.items():
+            if key in self.decoded or key[0] > self.next_row + 1 or not future.done():
+                continue
+            image_bytes, info = future.result()
+            tile = None
+            if image_bytes is not None:
+                tile = roi.decode_patch(image_bytes, self.tile_w, self.tile_h)
+            if tile is None:
+                self.failed += 1
+                print(f"⚠️ 分块 {key} 生成失败，使用捕获图: {info['error']}")
+                tile = roi.decode_patch(self.captures[key], self.tile_w, self.tile_h)
+            # Blender 像素自下而上，拼接按自上而下
+            self.decoded[key] = np.ascontiguousarray(tile[::-1, :, :3])
+            self.captures.pop(key, None)
+            return True
+        return False
+
+    def poll(self):
+        self.decode_one()
+        while self.next_row < self.rows and all((self.next_row, c) in self.decoded for c in range(self.columns)):
+            tiles = [self.decoded.pop((self.next_row, c)) for c in range(self.columns)]
+            self.stitcher.add_row(self.next_row, tiles)
+            self.next_row += 1
+
+        done = len([future for future in self.futures.values() if future.done()])
+        batch.set_status(self.scene_name, f"Tiled: {done}/{len(self.futures)} tiles, {self.next_row}/{self.rows} rows written")
+        if self.next_row < self.rows:
+            return POLL_INTERVAL
+
+        self.finish()
+        return None
+
+    def finish(self):
+        TiledRun.active.remove(self)
+        error = None
+        try:
+            for write in self.writes:
+                write.result()
+        except Exception as e:
+            error = f"写入分块结果失败: {e}"
+            self.png.abort()
+        else:
+            try:
+                self.png.close()
+            except Exception as e:
+                error = f"写入分块结果失败: {e}"
+        self.writer.shutdown(wait=False)
+
+        elapsed = time.time() - self.start_time
+        if error:
+            print(f"❌ {error}")
+            batch.set_status(self.scene_name, f"Tiled render failed: {error}")
+        else:
+            print(f"🎉 分块生成完成: {self.width}x{self.height}, {len(self.futures)} 块 "
+                  f"({self.failed} 块失败), {elapsed:.1f}s → {self.output_path}")
+            batch.set_status(self.scene_name, f"Tiled {self.width}x{self.height} done ({elapsed:.0f}s) → "
+                                              f"{os.path.basename(self.output_path)}")
+            path = self.output_path
+            delivery.submit(
+                ('tiled', self.scene_name),
+                lambda: async_render.show_result(image_pool.load_file(TILED_IMAGE_NAME, path, image_pool.ROLE_RESULT)),
+                image_name=TILED_IMAGE_NAME,
+            )
+        self.record_history(error, elapsed)
+
+    def record_history(self, error, elapsed):
+        scene = bpy.data.scenes.get(self.scene_name)
+        try:
+            index = history.open_history(os.path.dirname(self.output_path))
+            fields = dict(
+                prompt=self.prompt,
+                status=history.STATUS_FAILED if error else history.STATUS_DONE,
+                error=error,
+                output_path=None if error else self.output_path,
+                capture_seconds=round(self.capture_seconds, 3),
+                generate_seconds=round(elapsed, 3),
+                bytes_written=None if error else os.path.getsize(self.output_path),
+            )
+            if self.history_id is not None:
+                index.finish(self.history_id, **fields)
+            else:
+                index.record(
+                    blend=bpy.data.filepath,
+                    scene=self.scene_name,
+                    camera=scene.camera.name if scene is not None and scene.camera else None,
+                    frame=scene.frame_current if scene is not None else None,
+                    source='tiled',
+                    settings=self.settings,
+                    **fields
+                )
+        except Exception as e:
+            print(f"⚠️ 写入历史记录失败: {e}")
+
+
+def output_size(scene, long_side):
+    """(width, height) with the camera aspect and the given longer side"""
+    aspect = scene.render.resolution_x / float(scene.render.resolution_y)
+    if aspect >= 1.0:
+        return long_side, max(int(round(long_side / aspect)), 1)
+    return max(int(round(long_side * aspect)), 1), long_side
+
+
+def start_tiled(context):
+    """Capture every tile and start the concurrent requests
+
+    Returns (run, error); run is None when nothing could be started.
+    """
+    scene = context.scene
+    props = scene.nano_banana
+    width, height = output_size(scene, props.tiled_long_side)
+    overlap = min(props.tile_overlap, props.tile_size // 2)
+
+    output_dir = get_nano_banana_output_dir(context)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_filename = f"AI_Tiled_{width}x{height}_{timestamp}"
+    # 与其他产物一样用历史记录的 id 命名，不需要探测目录
+    history_id = None
+    try:
+        history_id = history.open_history(output_dir).begin(
+            blend=bpy.data.filepath,
+            scene=scene.name,
+            camera=scene.camera.name if scene.camera else None,
+            frame=scene.frame_current,
+            source='tiled',
+            settings=history.settings_snapshot(props),
+        )
+    except Exception as e:
+        print(f"⚠️ 历史记录不可用: {e}")
+    if history_id is not None:
+        output_path = os.path.join(output_dir, f"{base_filename}_{history_id:06d}.png")
+    else:
+        output_path = output_manager.unique_path(output_dir, base_filename, ".png")
+    run = TiledRun(scene, width, height, props.tile_size, overlap, output_path, history_id)
+
+    capture_start = time.time()
+    context_png = pipeline.capture_camera_png(scene)
+    if context_png is None:
+        run.abandon("Context capture failed")
+        return None, "Context capture failed"
+    context_data = base64.b64encode(context_png).decode('utf-8')
+
+    run.prompt = pipeline.build_image_generation_prompt(scene, props)
+    aspect_ratio = pipeline.nearest_aspect_ratio(run.tile_w, run.tile_h)
+
+    # 在渲染设置里使用输出分辨率，边框裁剪出的每块就是分块大小
+    saved_resolution = (scene.render.resolution_x, scene.render.resolution_y)
+    try:
+        scene.render.resolution_x, scene.render.resolution_y = width, height
+        for row in range(run.rows):
+            for column in range(run.columns):
+                png_bytes, _seconds = roi.capture_region(scene, run.tile_region(row, column), max(run.tile_w, run.tile_h))
+                if png_bytes is None:
+                    error = f"Capture of tile {row},{column} failed"
+                    run.abandon(error)
+                    return None, error
+                instruction = f"{TILE_INSTRUCTION} This is tile row {row + 1}/{run.rows}, column {column + 1}/{run.columns}."
+                payload = pipeline.build_generation_payload(
+                    props, run.prompt, base64.b64encode(png_bytes).decode('utf-8'),
+                    extra_instruction=instruction, aspect_ratio=aspect_ratio, context_image_data=context_data,
+                )
+                run.submit((row, column), payload, png_bytes)
+    finally:
+        scene.render.resolution_x, scene.render.resolution_y = saved_resolution
+
+    run.capture_seconds = time.time() - capture_start
+    print(f"🧱 {run.rows}x{run.columns} 个分块已捕获 ({run.capture_seconds:.1f}s)，输出 {width}x{height}")
+    return run, None
@@ -0,0 +1,97 @@
+"""Lease behaviour of the distributed frame queue (frame_queue.py does not need bpy)"""
+
+import os
+import importlib.util
+from unittest import mock
+
+import pytest
+
+_spec = importlib.util.spec_from_file_location(
+    "frame_queue",
+    os.path.join(os.path.dirname(__file__), os.pardir, "BlenderRenderNanoBanana", "frame_queue.py"),
+)
+frame_queue = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(frame_queue)
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = Clock()
+    with mock.patch.object(frame_queue.time, 'time', clock):
+        yield clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = frame_queue.FrameQueue(str(tmp_path / "queue.sqlite"), lease_seconds=60, max_attempts=2)
+    queue.enqueue([("Camera_0001", "Camera", 1)])
+    return queue
+
+
+def test_lease_is_exclusive_until_it_expires(queue, clock):
+    assert [frame['unit'] for frame in queue.lease("a")] == ["Camera_0001"]
+    assert queue.lease("b") == []
+
+    clock.now += 61
+    leased = queue.lease("b")
+    assert [frame['unit'] for frame in leased] == ["Camera_0001"]
+    assert leased[0]['attempt'] == 2
+
+
+def test_renew_keeps_the_lease(queue, clock):
+    queue.lease("a")
+    clock.now += 50
+    queue.renew("a", ["Camera_0001"])
+    clock.now += 50
+    assert queue.lease("b") == []
+
+
+def test_expired_lease_after_max_attempts_fails(queue, clock):
+    queue.lease("a")
+    clock.now += 61
+    queue.lease("b")
+    clock.now += 61
+
+    assert queue.lease("c") == []
+    counts = queue.counts()
+    assert counts[frame_queue.STATUS_FAILED] == 1
+    assert queue.is_finished()
+
+
+def test_fail_requeues_until_max_attempts(queue):
+    queue.lease("a")
+    queue.fail("a", "Camera_0001", "timeout")
+    assert queue.counts()[frame_queue.STATUS_PENDING] == 1
+
+    queue.lease("a")
+    queue.fail("a", "Camera_0001", "timeout")
+    assert queue.counts()[frame_queue.STATUS_FAILED] == 1
+    assert queue.lease("a") == []
+
+
+def test_complete_by_stale_holder_is_rejected(queue, clock):
+    queue.lease("a")
+    clock.now += 61
+    queue.lease("b")
+
+    assert not queue.complete("a", "Camera_0001", "/out/a.png")
+    assert queue.counts()[frame_queue.STATUS_LEASED] == 1
+
+    assert queue.complete("b", "Camera_0001", "/out/b.png")
+    assert queue.counts()[frame_queue.STATUS_DONE] == 1
+    assert not queue.complete("a", "Camera_0001", "/out/a.png")
+
+
+def test_complete_after_failure_is_rejected(queue):
+    queue.lease("a")
+    queue.fail("a", "Camera_0001", "timeout")
+    assert not queue.complete("a", "Camera_0001", "/out/a.png")
+    assert queue.counts()[frame_queue.STATUS_PENDING] == 1